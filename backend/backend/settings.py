@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,12 +53,113 @@ INSTALLED_APPS = [
 
 ASGI_APPLICATION = 'backend.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default':{
-        'BACKEND':'channels.layers.InMemoryChannelLayer'
+# Set REDIS_URL to share the channel layer between processes, so OPC UA ingest
+# workers and any number of web workers can run side by side
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default':{
+            'BACKEND':'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG':{
+                'hosts':[REDIS_URL]
+            }
+        }
     }
+else:
+    CHANNEL_LAYERS = {
+        'default':{
+            'BACKEND':'channels.layers.InMemoryChannelLayer'
+        }
+    }
+
+# OPC UA
+
+# Subscription changes are buffered for this long and sent as one batch frame
+OPCUA_NOTIFICATION_WINDOW_MS = 100
+
+# Shortest period accepted by the server-side polling engine
+OPCUA_MIN_POLL_PERIOD_MS = 50
+
+# Children lists kept per session by the browse API, least recently used dropped first
+OPCUA_BROWSE_CACHE_SIZE = 1000
+
+# References per node and Browse response before the server returns a continuation point
+OPCUA_BROWSE_MAX_REFERENCES = 1000
+
+# Browse path translations are kept here per server and namespace array, in the user's cache directory
+OPCUA_PATH_CACHE_DIR = os.environ.get('OPCUA_PATH_CACHE_DIR', os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'opcua-client', 'path_cache'
+))
+
+# Namespace (index or URI) of browse path segments written without an "ns:" prefix
+OPCUA_BROWSE_PATH_NAMESPACE = os.environ.get('OPCUA_BROWSE_PATH_NAMESPACE')
+
+# Directory of the local time-series recorder; unset disables recording
+OPCUA_RECORDER_DIR = os.environ.get('OPCUA_RECORDER_DIR')
+
+# Samples buffered per tag before they are appended to the recorder files
+OPCUA_RECORDER_CHUNK_ROWS = 1024
+
+# Every session reads the server state this often and reconnects when the read fails
+OPCUA_KEEPALIVE_INTERVAL_MS = 5000
+
+# Reconnect attempts back off exponentially between these delays
+OPCUA_RECONNECT_MIN_DELAY_MS = 500
+OPCUA_RECONNECT_MAX_DELAY_MS = 30000
+
+# Blocking calls per OPC UA server run on this many threads, with this many more requests queued;
+# requests beyond that get 503
+OPCUA_SERVER_WORKERS = 4
+OPCUA_SERVER_QUEUE = 16
+
+# Requests for a session answer 504 when its server takes longer than this
+OPCUA_REQUEST_TIMEOUT_MS = 10000
+
+# Concurrent reads of a session within this window are merged into one Read of their node ids
+OPCUA_READ_COALESCE_MS = 5
+
+# Reads and writes are split into requests of at most this many nodes, or the server's
+# MaxNodesPerRead / MaxNodesPerWrite when lower; 0 leaves it to the server
+OPCUA_MAX_NODES_PER_REQUEST = 1000
+
+# Chunks of one read or write that may await their response at the same time
+OPCUA_PIPELINE_DEPTH = 4
+
+# Writes of a session within this window are sent as one Write, keeping the latest value per node;
+# a batch goes out early once it holds OPCUA_WRITE_BATCH_SIZE nodes
+OPCUA_WRITE_COALESCE_MS = 20
+OPCUA_WRITE_BATCH_SIZE = 1000
+
+# WebSockets that acknowledge frames may have this many unacknowledged; further updates are
+# held back, keeping only the latest value per node
+OPCUA_WS_MAX_IN_FLIGHT = 8
+
+# A socket is closed once this many nodes are held back for it, or once its oldest unacknowledged
+# frame, a batch still waiting for it or a send to it is older than OPCUA_WS_MAX_LAG_MS; 0 disables
+# either check
+OPCUA_WS_OUTBOX_SIZE = 10000
+OPCUA_WS_MAX_LAG_MS = 30000
+
+# opc_ua messages go to stderr from this level up; DEBUG adds one line per data change,
+# which costs real throughput on busy subscriptions
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'opc_ua': {'handlers': ['console'], 'level': os.environ.get('OPCUA_LOG_LEVEL', 'INFO')},
+    },
 }
 
+# Sessions opened by `manage.py opcua_ingest` when it is started without --config
+OPCUA_INGEST = []
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from opc_ua.views import OPCUAMetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('opc_ua.urls')), 
+    path('metrics', OPCUAMetricsView.as_view(), name='opcua-metrics'),
 ]
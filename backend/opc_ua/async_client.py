@@ -0,0 +1,527 @@
+import asyncio
+import inspect
+import logging
+
+from asyncua import Client, ua
+from asyncua.common import ua_utils
+from asyncua.ua.ua_binary import struct_from_binary
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from .client_base import ClientBase, EventHandler, ModelChangeHandler, OPCUAError
+from .type_cache import TypeInfo
+from .variants import VariantConverter
+from .browse import BrowseRequest
+from .browse_paths import PathCache, browse_path
+from .reconnect import transfer_request
+from .operation_limits import OperationLimits, read_requests, value_ids, write_requests
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+def call_client(method, *args):
+    """Call a client method from sync code, running it on the event loop for asyncio sessions"""
+    if inspect.iscoroutinefunction(method):
+        return async_to_sync(method)(*args)
+    return method(*args)
+
+
+async def await_client(method, *args):
+    """
+    Await a client method of either session kind. asyncio sessions are awaited
+    in place; sync ones block the caller, which is already on a worker thread.
+    """
+    if inspect.iscoroutinefunction(method):
+        return await method(*args)
+    return method(*args)
+
+
+class AsyncOPCUAClient(ClientBase):
+    """asyncio implementation of the OPCUAClient interface, meant to run on the ASGI event loop."""
+    client_class = Client
+    ua = ua
+    converter = VariantConverter(ua)
+    lock_class = asyncio.Lock
+
+    async def get_endpoints(self):
+        """Get available endpoints from the OPC UA server."""
+        try:
+            endpoints = await self.client.connect_and_get_server_endpoints()
+            logger.info("🔗 Found %d available endpoints.", len(endpoints))
+            return [self._endpoint_info(endpoint) for endpoint in endpoints]
+        except Exception as e:
+            raise OPCUAError(f"Endpoints: {str(e)}")
+
+    @timed("connect")
+    async def connect(self):
+        """Connect to OPC UA server"""
+        try:
+            security_string = self._security_string()
+            if security_string:
+                logger.info("🔒 Connecting with security...")
+                await self.client.set_security_string(security_string)
+                self._set_identity()
+            await self.client.connect()
+        except Exception as e:
+            raise OPCUAError(f"Connect: {str(e)}")
+
+        self._session_opened()
+        await self._watch_model_changes()
+
+    async def _watch_model_changes(self):
+        """Subscribe to GeneralModelChangeEvents so cached metadata follows the address space"""
+        try:
+            subscription = await self.client.create_subscription(1000, ModelChangeHandler(self))
+            await subscription.subscribe_events(self.client.get_server_node(), ua.ObjectIds.GeneralModelChangeEventType)
+            self._model_change_subscription = subscription
+        except Exception as e:
+            logger.warning("⚠️ Model change events not available: %s", e)
+
+    async def keepalive(self):
+        """Read the server state; raises once the session or connection is gone"""
+        await self.client.check_connection()
+        await self.client.get_node(ua.ObjectIds.Server_ServerStatus_State).read_value()
+
+    def _abandon_session(self):
+        """Stop the background work of the lost session and drop its socket, leaving the session open"""
+        old = self.client
+        for task in (old._monitor_server_task, old._renew_channel_task, old.uaclient._publish_task):
+            if task is not None:
+                task.cancel()
+        try:
+            old.disconnect_socket()
+        except Exception:
+            pass
+
+    async def reconnect(self):
+        """
+        Open a new session and bring back registered nodes and subscriptions.
+
+        The old session is not closed: closing it would delete the subscriptions
+        that TransferSubscriptions may still move over. Returns the number of
+        (transferred, recreated) subscriptions.
+        """
+        self._abandon_session()
+        self.client = Client(self.url)
+        await self.connect()
+
+        try:
+            # Browse paths were forgotten with the old session; translate them again in one call
+            await self.resolve_paths(self._replay_node_ids())
+            await self._replay_registrations()
+            counts = await self._replay_subscriptions()
+            await self._replay_event_subscriptions()
+        except Exception:
+            # The next attempt would abandon this session open, one more on the server per retry
+            await self._close_session()
+            raise
+        return counts
+
+    async def _close_session(self):
+        """Close the new session after a failed replay; the next attempt opens another one"""
+        try:
+            await self.client.disconnect()
+        except Exception as e:
+            logger.warning("⚠️ Could not close the session to %s: %s", self.url, e)
+
+    async def _replay_registrations(self):
+        """Register all previously registered nodes again with one RegisterNodes call"""
+        node_ids = list(self.registered_nodes)
+        if not node_ids:
+            return
+        try:
+            self._registered(node_ids, await self.client.register_nodes(self._registration_nodes(node_ids)))
+        except Exception as e:
+            raise OPCUAError(f"Register: {str(e)}")
+
+    async def _transfer_subscriptions(self, subscriptions):
+        """Move subscriptions of the lost session to this one; returns the ids the server kept"""
+        uaclient = self.client.uaclient
+        try:
+            data = await uaclient.protocol.send_request(
+                transfer_request(ua, [sub.subscription_id for sub in subscriptions])
+            )
+            response = struct_from_binary(ua.TransferSubscriptionsResponse, data)
+            response.ResponseHeader.ServiceResult.check()
+        except Exception as e:
+            logger.info("ℹ️ Subscriptions not transferred, recreating them: %s", e)
+            return set()
+
+        kept = set()
+        for sub, result in zip(subscriptions, response.Results):
+            if result.StatusCode.is_good():
+                # asyncua has no transfer support yet; point the Subscription at the new session by hand
+                sub.server = uaclient
+                uaclient._subscription_callbacks[sub.subscription_id] = sub.publish_callback
+                kept.add(sub.subscription_id)
+        if kept and (uaclient._publish_task is None or uaclient._publish_task.done()):
+            uaclient._publish_task = asyncio.create_task(uaclient._publish_loop())
+        return kept
+
+    async def _replay_subscriptions(self):
+        """Transfer subscriptions where possible, recreate the others with one CreateMonitoredItems each"""
+        async with self._subscription_lock:
+            if not self.subscriptions:
+                return 0, 0
+            kept = await self._transfer_subscriptions(
+                [sub_data['subscription'] for sub_data in self.subscriptions.values()]
+            )
+            recreated = 0
+            for sub_id, sub_data in self.subscriptions.items():
+                if sub_data['subscription'].subscription_id in kept:
+                    continue
+                # The key stays the same so callers keep using the id they were given
+                sub_data['subscription'] = await self.client.create_subscription(
+                    sub_data['interval'], sub_data['handler']
+                )
+                node_ids = list(sub_data['handles'])
+                nodes = self.get_nodes(node_ids)
+                handles = await sub_data['subscription'].subscribe_data_change(nodes)
+                sub_data['handles'] = {}
+                for nid, status in self._monitored(sub_data, node_ids, nodes, handles).items():
+                    logger.warning("⚠️ Could not monitor %s again on subscription %s: %s", nid, sub_id, status)
+                recreated += 1
+            return len(kept), recreated
+
+    async def disconnect(self):
+        """Disconnect from OPC UA server"""
+        self._session_closing()
+        try:
+            await self.client.disconnect()
+            logger.info("🔌 OPC UA Disconnected.")
+        except Exception as e:
+            raise OPCUAError(f"Disconnect: {str(e)}")
+        finally:
+            self.client = None
+
+    async def operation_limits(self):
+        """Return the server's OperationLimits, read once per session"""
+        if self.limits is None:
+            try:
+                self.limits = OperationLimits.from_results(
+                    await self.client.uaclient.read(self._read_params(OperationLimits.node_ids(ua)))
+                )
+            except Exception as e:
+                logger.warning("⚠️ OperationLimits not available, using OPCUA_MAX_NODES_PER_REQUEST: %s", e)
+                self.limits = OperationLimits()
+        return self.limits
+
+    async def _pipeline(self, requests, response_type):
+        """Send requests with up to OPCUA_PIPELINE_DEPTH awaiting an answer; return the responses in order"""
+        semaphore = asyncio.Semaphore(getattr(settings, 'OPCUA_PIPELINE_DEPTH', 4))
+        protocol = self.client.uaclient.protocol
+
+        async def send(request):
+            async with semaphore:
+                data = await protocol.send_request(request)
+            response = struct_from_binary(response_type, data)
+            response.ResponseHeader.ServiceResult.check()
+            return response
+
+        return await asyncio.gather(*(send(request) for request in requests))
+
+    async def _read_chunks(self, read_ids):
+        """DataValues for ReadValueIds, read in chunks of the server's MaxNodesPerRead"""
+        requests = read_requests(ua, read_ids, (await self.operation_limits()).read_size)
+        return [result for response in await self._pipeline(requests, ua.ReadResponse) for result in response.Results]
+
+    async def read_status(self, node_id):
+        """Return {node_id: (value, status name)}; nodes the server refuses get None and their StatusCode"""
+        try:
+            return await self.reads.read_async(node_id, self._read_values)
+        except Exception as e:
+            raise OPCUAError(f"Read: {str(e)}")
+
+    async def read_value(self, node_id):
+        """Read single or multiple node values, sharing the Read with concurrent callers"""
+        return {nid: value for nid, (value, _) in (await self.read_status(node_id)).items()}
+
+    @timed("read", nodes=True)
+    async def _read_values(self, node_ids):
+        nodes = self.get_nodes(node_ids)
+        return self._read_results(node_ids, await self._read_chunks(value_ids(ua, [node.nodeid for node in nodes])))
+
+    async def history_read(self, node_ids, start, end=None, page_size=1000, aggregate=None, interval_ms=None):
+        """Yield history pages of node_ids, following continuation points until every node is done"""
+        reader = self._history_reader(node_ids, start, end, page_size, aggregate, interval_ms)
+        try:
+            while not reader.done:
+                try:
+                    results = await self.client.uaclient.history_read(reader.params())
+                except Exception as e:
+                    raise OPCUAError(f"HistoryRead: {str(e)}")
+                for page in reader.consume(results):
+                    yield page
+        finally:
+            if not reader.done:
+                # Stopped early, e.g. the HTTP client went away; free the server's continuation points
+                try:
+                    await self.client.uaclient.history_read(reader.params(release=True))
+                except Exception:
+                    pass
+
+    async def _variant_type(self, data_type):
+        """Map a DataType NodeId to the VariantType used to encode its values"""
+        variant_type = self._known_variant_type(data_type)
+        if variant_type is None:
+            variant_type = await ua_utils.data_type_to_variant_type(self.client.get_node(data_type))
+            self.type_cache.set_data_type(data_type.to_string(), variant_type)
+        return variant_type
+
+    async def get_type_info(self, node_ids):
+        """
+        Return ({node_id: TypeInfo}, {node_id: status name} of nodes whose type can't be read),
+        reading metadata of uncached nodes in one batched Read
+        """
+        found, missing = self.type_cache.get_many(node_ids)
+        if not missing:
+            return found, {}
+
+        attributes, failed = self._type_attributes(missing, await self._read_chunks(self._type_info_reads(missing)))
+        entries = {
+            nid: TypeInfo(await self._variant_type(data_type), value_rank, array_dimensions)
+            for nid, data_type, value_rank, array_dimensions in attributes
+        }
+        self.type_cache.update(entries)
+        found.update(entries)
+        return found, failed
+
+    async def translate_paths(self, paths, namespace=None):
+        """Return {path: node id string}, translating uncached browse paths in one batched call"""
+        try:
+            if self.path_cache is None:
+                self.path_cache = PathCache(self.url, await self.client.get_namespace_array())
+            keys, found, missing = self._path_lookup(paths, namespace)
+            if missing:
+                results = await self.client.uaclient.translate_browsepaths_to_nodeids(
+                    [browse_path(ua, key) for key in missing]
+                )
+                found.update(self._translated(missing, results))
+            return self._remember_paths(keys, found)
+        except Exception as e:
+            raise OPCUAError(f"Translate: {str(e)}")
+
+    async def resolve_paths(self, node_ids):
+        """Translate the browse paths among node_ids that this session has not seen yet"""
+        paths = self._unresolved_paths(node_ids)
+        if paths:
+            await self.translate_paths(paths)
+
+    async def browse(self, node_ids):
+        """Return {node_id: [child]} with BrowseName, NodeClass and DataType of each child"""
+        try:
+            keys = self._browse_keys(node_ids)
+            found, missing = self.browse_cache.get_many(keys)
+            if missing:
+                request = BrowseRequest(ua, missing)
+                try:
+                    request.consume(await self.client.uaclient.browse(request.browse_params()))
+                    while request.continuation:
+                        request.consume(await self.client.uaclient.browse_next(request.next_params()))
+                except ValueError:
+                    await self._release_browse(request)
+                    raise
+                data_types = await self._read_chunks(request.read_ids()) if request.variables() else []
+                entries = request.children(data_types)
+                self.browse_cache.update(entries)
+                found.update(entries)
+            return {nid: found[key] for nid, key in zip(node_ids, keys)}
+        except Exception as e:
+            raise OPCUAError(f"Browse: {str(e)}")
+
+    async def _release_browse(self, request):
+        """Free the continuation points the server still holds for a failed browse"""
+        if not request.continuation:
+            return
+        try:
+            await self.client.uaclient.browse_next(request.next_params(release=True))
+        except Exception as e:
+            logger.warning("⚠️ Could not release browse continuation points: %s", e)
+
+    async def write_value(self, node_id, value):
+        """
+        Write single or multiple values to nodes with automatic data type detection.
+
+        Returns {node_id: status name}; a node the server refuses does not fail the others.
+        """
+        try:
+            node_ids, data_values, failed = await self.prepare_write(node_id, value)
+            statuses = await self._write_values(node_ids, data_values) if node_ids else {}
+            return self._merge_statuses(node_id, statuses, failed)
+        except Exception as e:
+            raise OPCUAError(f"Write: {str(e)}")
+
+    async def queue_write(self, node_id, value, flush=False):
+        """Convert values and queue them on the session's WriteQueue; returns a WriteTicket"""
+        try:
+            return await self.writes.submit_async(*await self.prepare_write(node_id, value), flush=flush)
+        except Exception as e:
+            raise OPCUAError(f"Write: {str(e)}")
+
+    async def write_queued(self, node_id, value, flush=False):
+        """
+        write_value() through the WriteQueue, merged with concurrent writes of the session;
+        flush sends the batch without waiting out the coalescing window
+        """
+        ticket = await self.queue_write(node_id, value, flush)
+        try:
+            return await ticket.wait()
+        except Exception as e:
+            raise OPCUAError(f"Write: {str(e)}")
+
+    async def prepare_write(self, node_id, value):
+        """
+        Return (node ids, DataValues) of value converted to the data types of the nodes, and
+        {node_id: status name} of the nodes left out because their data type can't be read
+        """
+        type_info, failed = await self.get_type_info(node_id)
+        return (*self._data_values(node_id, value, type_info, failed), failed)
+
+    @timed("write", nodes=True)
+    async def _write_values(self, node_ids, data_values):
+        nodes = self.get_nodes(node_ids)
+        # Write values in chunks of the server's MaxNodesPerWrite
+        requests = write_requests(
+            ua, [node.nodeid for node in nodes], data_values, (await self.operation_limits()).write_size
+        )
+        responses = await self._pipeline(requests, ua.WriteResponse)
+        logger.debug("✅ Values written successfully!")
+        return self._write_results(node_ids, [result for response in responses for result in response.Results])
+
+    @timed("register", nodes=True)
+    async def register_nodes(self, node_ids):
+        """Register nodes with the server for optimized access"""
+        try:
+            registered_nodes = await self.client.register_nodes(self._registration_nodes(node_ids))
+            logger.debug("Registered Nodes Response: %s", registered_nodes)
+            return self._registered(node_ids, registered_nodes)
+        except Exception as e:
+            raise OPCUAError(f"Register: {str(e)}")
+
+    async def unregister_nodes(self, node_ids):
+        """Unregister previously registered nodes"""
+        try:
+            registered_nodes = self._unregistered(node_ids)
+            if registered_nodes:
+                await self.client.unregister_nodes(registered_nodes)
+                logger.debug("Nodes unregistered successfully!")
+        except Exception as e:
+            raise OPCUAError(f"Unregister: {str(e)}")
+
+    async def _subscription_for_interval(self, interval):
+        """Return the id of the shared subscription for a publishing interval, creating it if needed"""
+        sub_id = self._interval_subscription(interval)
+        if sub_id is None:
+            logger.info("Creating subscription with interval %sms...", interval)
+            handler = self._sub_handler()
+            sub_id = self._add_subscription(await self.client.create_subscription(interval, handler), handler, interval)
+        return sub_id
+
+    @timed("subscribe", nodes=True)
+    async def subscribe(self, node_ids, interval=500):
+        """Subscribe to nodes with specified interval (ms), sharing one subscription per interval"""
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        try:
+            async with self._subscription_lock:
+                sub_id = await self._subscription_for_interval(interval)
+                sub_data = self.subscriptions[sub_id]
+
+                new_ids = self._unmonitored(sub_data, node_ids)
+                if not new_ids:
+                    return sub_id
+
+                # One CreateMonitoredItems call for all new nodes
+                nodes = self.get_nodes(new_ids)
+                handles = await sub_data['subscription'].subscribe_data_change(nodes)
+                failed = self._monitored(sub_data, new_ids, nodes, handles)
+                logger.info("Subscribed to %d node(s) on subscription %s", len(new_ids) - len(failed), sub_id)
+
+                if not sub_data['handles']:
+                    # Nothing could be monitored, don't leave an empty subscription behind
+                    await sub_data['subscription'].delete()
+                    del self.subscriptions[sub_id]
+            if failed:
+                raise ValueError(f"Could not monitor {failed}")
+            return sub_id
+        except Exception as e:
+            raise OPCUAError(f"Subscribe: {str(e)}")
+
+    async def unsubscribe(self, subscription_id=None, node_ids=None):
+        """Remove monitored items for node_ids, or delete a whole subscription"""
+        try:
+            async with self._subscription_lock:
+                for sub_data, handles, delete in self._unsubscribe_plan(subscription_id, node_ids):
+                    # Deleting the subscription removes its monitored items too
+                    if delete:
+                        await sub_data['subscription'].delete()
+                    elif handles:
+                        # One DeleteMonitoredItems call for all nodes of the subscription
+                        await sub_data['subscription'].unsubscribe(handles)
+                logger.debug("Unsubscribed successfully!")
+        except Exception as e:
+            raise OPCUAError(f"Unsubscribe: {str(e)}")
+
+    async def _create_event_subscription(self, dispatcher, interval):
+        """Create a subscription monitoring the events of the dispatcher's source through its EventFilter"""
+        spec = dispatcher.spec
+        subscription = await self.client.create_subscription(interval, EventHandler(dispatcher, self.url))
+        try:
+            handle = await subscription.subscribe_events(self._event_source(spec), evfilter=spec.event_filter(ua))
+        except Exception:
+            await subscription.delete()
+            raise
+        return self._add_event_subscription(subscription, dispatcher, interval, handle)
+
+    @timed("subscribe_events")
+    async def subscribe_events(self, source="i=2253", select=None, where=None, interval=500):
+        """
+        Monitor the events of source (the Server object by default) with an
+        EventFilter the server applies, then ask for its retained conditions
+        """
+        try:
+            async with self._subscription_lock:
+                sub_id = await self._create_event_subscription(self._event_dispatcher(source, select, where), interval)
+            logger.info("Subscribed to events of %s on subscription %s", source, sub_id)
+        except Exception as e:
+            raise OPCUAError(f"Subscribe events: {str(e)}")
+        await self.condition_refresh(sub_id)
+        return sub_id
+
+    async def unsubscribe_events(self, subscription_id=None):
+        """Delete one event subscription, or all of them"""
+        try:
+            async with self._subscription_lock:
+                for subscription in self._pop_event_subscriptions(subscription_id):
+                    await subscription.delete()
+        except Exception as e:
+            raise OPCUAError(f"Unsubscribe events: {str(e)}")
+
+    async def condition_refresh(self, subscription_id=None):
+        """
+        Ask the server to send the retained conditions of event subscriptions
+        again; they reach WebSockets as one alarms frame each. Returns
+        {subscription id: status name}.
+        """
+        method = self.client.get_node(ua.ObjectIds.ConditionType)
+        results = {}
+        for sub_id, sub_data in self._refresh_targets(subscription_id):
+            try:
+                await method.call_method(*self._refresh_arguments(sub_data))
+                results[sub_id] = "Good"
+            except Exception as e:
+                results[sub_id] = self._refresh_failed(sub_id, sub_data, e)
+        return results
+
+    async def _replay_event_subscriptions(self):
+        """Recreate event subscriptions on the new session and refresh their conditions"""
+        async with self._subscription_lock:
+            for sub_id, sub_data in list(self.event_subscriptions.items()):
+                try:
+                    # The dispatcher keeps its id and alarm cache; ConditionRefresh then prunes it
+                    await self._create_event_subscription(sub_data['dispatcher'], sub_data['interval'])
+                except Exception as e:
+                    logger.warning("⚠️ Could not subscribe to events again on %s: %s", sub_id, e)
+                    del self.event_subscriptions[sub_id]
+        await self.condition_refresh()
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import multiprocessing
+import platform
+import statistics
+import time
+import tracemalloc
+
+import opcua
+from channels.testing import WebsocketCommunicator
+from django.test import AsyncClient, override_settings
+
+from .connection_pool import pool
+from .consumers import OPCConsumer
+from .opc_ua_client import OPCUAClient
+
+NAMESPACE = "urn:opcua-benchmark"
+
+
+def tag(index):
+    return f"ns=2;s=Tag{index}"
+
+
+def serve(port, variables, changing, rate_hz, ready):
+    """
+    Simulated server process: `variables` Double tags, the first `changing` of
+    them set to the current Unix time `rate_hz` times per second, so a client
+    can tell how old a notification is from its value alone.
+    """
+    from opcua import Server, ua
+
+    server = Server()
+    server.set_endpoint(f"opc.tcp://127.0.0.1:{port}/")
+    server.register_namespace(NAMESPACE)
+    folder = server.get_objects_node().add_folder(2, "Benchmark")
+    nodes = []
+    for index in range(variables):
+        node = folder.add_variable(ua.NodeId(f"Tag{index}", 2), f"Tag{index}", 0.0, ua.VariantType.Double)
+        node.set_writable()
+        nodes.append(node)
+    server.start()
+    ready.set()
+    try:
+        period = 1 / rate_hz if rate_hz else None
+        while True:
+            if not period or not changing:
+                time.sleep(1)
+                continue
+            started = time.monotonic()
+            now = time.time()
+            for node in nodes[:changing]:
+                node.set_value(now)
+            time.sleep(max(0.0, period - (time.monotonic() - started)))
+    finally:
+        server.stop()
+
+
+class SimulatedServer:
+    """Runs serve() in a child process so the server does not compete with the client for the GIL."""
+    def __init__(self, port=48500, variables=1000, changing=100, rate_hz=10):
+        self.port = port
+        self.variables = variables
+        self.changing = changing
+        self.rate_hz = rate_hz
+        self.url = f"opc.tcp://127.0.0.1:{port}/"
+        self._process = None
+
+    def __enter__(self):
+        ready = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=serve, args=(self.port, self.variables, self.changing, self.rate_hz, ready), daemon=True
+        )
+        self._process.start()
+        if not ready.wait(60):
+            raise RuntimeError("Simulated server did not start")
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join(10)
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+    return {
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
+
+
+def timed_calls(call, seconds):
+    """Call call() repeatedly for about `seconds`; return (calls, elapsed, [latency ms])"""
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        begin = time.perf_counter()
+        call()
+        end = time.perf_counter()
+        latencies.append((end - begin) * 1000)
+        if end >= deadline:
+            return len(latencies), end - started, latencies
+
+
+class Benchmark:
+    """
+    Measures one simulated server through the client, the REST views and the consumer.
+
+    Every stage returns plain numbers; keys ending in ``_per_s`` are better
+    when higher, keys ending in ``_ms`` or ``_bytes`` when lower, which is what
+    regressions() relies on.
+    """
+    def __init__(self, server, batch_sizes=(1, 10, 100, 1000), seconds=2.0, concurrency=16,
+                 interval_ms=50, log=print):
+        self.server = server
+        self.batch_sizes = [size for size in batch_sizes if size <= server.variables - server.changing]
+        self.seconds = seconds
+        self.concurrency = concurrency
+        self.interval_ms = interval_ms
+        self.log = log
+
+    def endpoint(self):
+        endpoints = OPCUAClient(self.server.url).get_endpoints()
+        return next(endpoint for endpoint in endpoints if int(endpoint['security_level']) == 0)
+
+    def static_tags(self, count):
+        """Tags the simulated server does not change, safe to write"""
+        return [tag(index) for index in range(self.server.changing, self.server.changing + count)]
+
+    def run(self):
+        session_id, _ = pool.connect(self.endpoint())
+        client = pool.get(session_id)
+        try:
+            return {
+                "config": {
+                    "variables": self.server.variables,
+                    "changing": self.server.changing,
+                    "rate_hz": self.server.rate_hz,
+                    "seconds": self.seconds,
+                    "concurrency": self.concurrency,
+                    "interval_ms": self.interval_ms,
+                },
+                "environment": {
+                    "python": platform.python_version(),
+                    "opcua": getattr(opcua, '__version__', None),
+                    "platform": platform.platform(),
+                },
+                "read": self.bench_reads(client),
+                "write": self.bench_writes(client),
+                "rest": asyncio.run(self.bench_rest(session_id)),
+                "notifications": asyncio.run(self.bench_notifications(client)),
+                "memory": self.bench_memory(client),
+            }
+        finally:
+            pool.release(session_id)
+
+    def bench_reads(self, client):
+        results = []
+        for size in self.batch_sizes:
+            node_ids = self.static_tags(size)
+            client.read_value(node_ids)  # resolve nodes and OperationLimits outside the measurement
+            calls, elapsed, latencies = timed_calls(lambda: client.read_value(node_ids), self.seconds)
+            results.append({
+                "batch": size,
+                "calls_per_s": round(calls / elapsed, 1),
+                "values_per_s": round(calls * size / elapsed, 1),
+                **percentiles(latencies),
+            })
+            self.log(f"📖 read x{size}: {results[-1]['values_per_s']} values/s")
+        return results
+
+    def bench_writes(self, client):
+        results = []
+        for size in self.batch_sizes:
+            node_ids = self.static_tags(size)
+            values = [1.5] * size
+            client.write_value(node_ids, values)  # fill the type cache outside the measurement
+            calls, elapsed, latencies = timed_calls(lambda: client.write_value(node_ids, values), self.seconds)
+            results.append({
+                "batch": size,
+                "calls_per_s": round(calls / elapsed, 1),
+                "values_per_s": round(calls * size / elapsed, 1),
+                **percentiles(latencies),
+            })
+            self.log(f"✏️ write x{size}: {results[-1]['values_per_s']} values/s")
+        return results
+
+    async def bench_rest(self, session_id):
+        """`concurrency` clients posting overlapping reads to the read-write view"""
+        http = AsyncClient()
+        path = f"/api/sessions/{session_id}/read-write/"
+        node_ids = self.static_tags(min(10, self.server.variables - self.server.changing))
+        latencies = []
+        statuses = {}
+        deadline = time.perf_counter() + self.seconds
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                begin = time.perf_counter()
+                response = await http.post(path, {"node_ids": node_ids}, content_type="application/json")
+                latencies.append((time.perf_counter() - begin) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        # The test client's "testserver" host is only allowed by the test runner
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+        result = {
+            "requests_per_s": round(len(latencies) / elapsed, 1),
+            "statuses": {str(code): count for code, count in statuses.items()},
+            **percentiles(latencies),
+        }
+        self.log(f"🌐 REST read: {result['requests_per_s']} requests/s")
+        return result
+
+    async def bench_notifications(self, client):
+        """Age of the changing tags' values when they reach a WebSocket client"""
+        communicator = WebsocketCommunicator(OPCConsumer.as_asgi(), "/ws/socket-server/")
+        connected, _ = await communicator.connect()
+        if not connected:
+            raise RuntimeError("WebSocket connection refused")
+        node_ids = [tag(index) for index in range(self.server.changing)]
+        await asyncio.to_thread(client.subscribe, node_ids, self.interval_ms)
+        latencies = []
+        deadline = time.perf_counter() + self.seconds
+        try:
+            while time.perf_counter() < deadline:
+                # A receive timeout cancels the consumer, so wait long enough for the slowest frame
+                frame = json.loads(await communicator.receive_from(timeout=self.seconds + 5))
+                received = time.time()
+                if frame.get("type") != "batch":
+                    continue
+                latencies.extend(
+                    (received - update["value"]) * 1000 for update in frame["updates"]
+                    if isinstance(update.get("value"), float) and update["value"] > 0
+                )
+        finally:
+            await asyncio.to_thread(client.unsubscribe)
+            await communicator.disconnect()
+        result = {
+            "notifications_per_s": round(len(latencies) / self.seconds, 1),
+            **percentiles(latencies),
+        }
+        self.log(f"📡 notification latency p99: {result.get('p99_ms')} ms")
+        return result
+
+    def bench_memory(self, client, items=None):
+        """Python heap growth per monitored item of a fresh subscription"""
+        items = items or min(1000, self.server.variables)
+        node_ids = [tag(index) for index in range(items)]
+        client.get_nodes(node_ids)  # Node objects are cached by reads too; keep them out of the figure
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        client.subscribe(node_ids, self.interval_ms * 20)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        grown = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        client.unsubscribe()
+        result = {"monitored_items": items, "item_bytes": round(grown / items, 1)}
+        self.log(f"🧮 {result['item_bytes']} bytes per monitored item")
+        return result
+
+
+def flatten(result, prefix=""):
+    """{"read.batch=10.values_per_s": ...} for every number in a benchmark result"""
+    flat = {}
+    if isinstance(result, dict):
+        for key, value in result.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(result, list):
+        for entry in result:
+            label = f"batch={entry['batch']}" if isinstance(entry, dict) and 'batch' in entry else str(result.index(entry))
+            flat.update(flatten(entry, f"{prefix}{label}."))
+    elif isinstance(result, (int, float)) and not isinstance(result, bool):
+        flat[prefix.rstrip('.')] = result
+    return flat
+
+
+def regressions(result, baseline, tolerance=0.2):
+    """Metrics worse than baseline by more than tolerance (a fraction), as {name: (baseline, now)}"""
+    now = flatten(result)
+    worse = {}
+    for name, before in flatten(baseline).items():
+        if name.startswith(("config.", "environment.")) or name not in now or not before:
+            continue
+        after = now[name]
+        if name.endswith("_per_s") and after < before * (1 - tolerance):
+            worse[name] = (before, after)
+        elif name.endswith(("_ms", "_bytes")) and after > before * (1 + tolerance):
+            worse[name] = (before, after)
+    return worse
@@ -0,0 +1,112 @@
+import json
+import math
+import struct
+from datetime import datetime, timezone
+
+# Frame kinds, first byte of every binary frame
+BATCH = 1
+SNAPSHOT = 2
+# A batch sent after updates were held back for a slow socket; older values of its nodes were skipped
+CONFLATED_BATCH = 3
+
+# Value types of a record
+NULL = 0
+BOOL = 1
+INT32 = 2
+INT64 = 3
+DOUBLE = 4
+STRING = 5
+JSON = 6
+
+# Status classes of a record
+STATUS_CODES = {"Good": 0, "Uncertain": 1, "Bad": 2}
+
+# kind, record count
+FRAME_HEADER = struct.Struct("<BI")
+# handle, value type, status class, source timestamp in ms since the epoch (NaN when unknown)
+RECORD_HEADER = struct.Struct("<IBBd")
+LENGTH = struct.Struct("<I")
+
+INT32_RANGE = range(-2 ** 31, 2 ** 31)
+
+
+def timestamp_ms(value):
+    if not value:
+        return math.nan
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        # python-opcua hands out naive UTC timestamps
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp() * 1000
+
+
+def status_class(status):
+    for prefix, code in STATUS_CODES.items():
+        if status and status.startswith(prefix):
+            return code
+    return STATUS_CODES["Good"] if status is None else STATUS_CODES["Bad"]
+
+
+def finite(value):
+    """value with NaN and infinities, also inside arrays and structures, replaced by None for JSON.parse"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (list, tuple)):
+        return [finite(item) for item in value]
+    if isinstance(value, dict):
+        return {key: finite(item) for key, item in value.items()}
+    return value
+
+
+def encode_value(value):
+    """Return (value type, packed payload) for a JSON-safe value"""
+    if value is None:
+        return NULL, b""
+    if isinstance(value, bool):
+        return BOOL, struct.pack("<B", value)
+    if isinstance(value, int):
+        if value in INT32_RANGE:
+            return INT32, struct.pack("<i", value)
+        if -2 ** 63 <= value < 2 ** 63:
+            return INT64, struct.pack("<q", value)
+    elif isinstance(value, float):
+        return DOUBLE, struct.pack("<d", value)
+    elif isinstance(value, str):
+        data = value.encode()
+        return STRING, LENGTH.pack(len(data)) + data
+    # Arrays, structures and integers beyond 64 bits
+    data = json.dumps(finite(value), default=str, allow_nan=False).encode()
+    return JSON, LENGTH.pack(len(data)) + data
+
+
+class FrameEncoder:
+    """
+    Packs update entries into binary frames for one socket.
+
+    Every (session_id, node_id) gets a small integer handle the first time it
+    is sent; the socket learns new handles from a dictionary message sent just
+    before the frame that uses them, so node ids go over the wire only once.
+    """
+    def __init__(self):
+        self.handles = {}
+
+    def encode(self, kind, updates):
+        """Return (new dictionary entries {handle: {session_id, node_id}}, frame bytes)"""
+        handles = self.handles
+        new = {}
+        parts = [FRAME_HEADER.pack(kind, len(updates))]
+        for update in updates:
+            key = (update.get("session_id"), update["node_id"])
+            handle = handles.get(key)
+            if handle is None:
+                handle = handles[key] = len(handles)
+                new[handle] = {"session_id": key[0], "node_id": key[1]}
+            value_type, payload = encode_value(update.get("value"))
+            parts.append(RECORD_HEADER.pack(
+                handle,
+                value_type,
+                status_class(update.get("status")),
+                timestamp_ms(update.get("source_timestamp")),
+            ))
+            parts.append(payload)
+        return new, b"".join(parts)
@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class BrowseCache:
+    """
+    Per-session LRU of node id -> list of child descriptions.
+
+    Keys are normalized NodeId strings so ``i=85`` and ``ns=0;i=85`` share an
+    entry. Entries are dropped on reconnect and when the server reports a model
+    change: that of a parent whose references changed, those listing a changed
+    or deleted child, or all of them when the parent is not known.
+    """
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def capacity(self):
+        return self.max_entries or getattr(settings, 'OPCUA_BROWSE_CACHE_SIZE', 1000)
+
+    def get_many(self, keys):
+        """Return ({key: children} for cached keys, [uncached keys])"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                children = self._entries.get(key)
+                if children is None:
+                    missing.append(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = children
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, list(dict.fromkeys(missing))
+
+    def update(self, entries):
+        with self._lock:
+            for key, children in entries.items():
+                self._entries[key] = children
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys=None):
+        """Forget all entries, or only those for keys"""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+
+    def invalidate_parents(self, node_ids):
+        """Forget the entries that list one of node_ids as a child"""
+        node_ids = set(node_ids)
+        with self._lock:
+            parents = [
+                key for key, children in self._entries.items()
+                if any(child["node_id"] in node_ids for child in children)
+            ]
+            for key in parents:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def local_node_id(ua, expanded):
+    """NodeId of a reference target on this server, without ExpandedNodeId extras"""
+    return ua.NodeId(expanded.Identifier, expanded.NamespaceIndex)
+
+
+def data_type_name(ua, data_type):
+    """Name of a standard DataType such as Double, otherwise its NodeId string"""
+    if data_type.NamespaceIndex == 0 and isinstance(data_type.Identifier, int):
+        name = ua.ObjectIdNames.get(data_type.Identifier)
+        if name:
+            return name
+    return data_type.to_string()
+
+
+class BrowseRequest:
+    """
+    Batched Browse of the hierarchical children of several nodes.
+
+    Takes the ``ua`` module of the OPC UA library in use like VariantConverter.
+    The owning client sends browse_params(), then next_params() while nodes have
+    continuation points, then reads DataType for every Variable child from
+    read_ids() in chunks of its OperationLimits, so a whole tree level costs a
+    handful of round trips. When a node fails, next_params(release=True) frees
+    the continuation points the server still holds for the others.
+    """
+    def __init__(self, ua, keys, max_references=None):
+        self.ua = ua
+        self.keys = keys
+        self.max_references = max_references or getattr(settings, 'OPCUA_BROWSE_MAX_REFERENCES', 1000)
+        self.references = {key: [] for key in keys}
+        self.continuation = OrderedDict()  # key -> continuation point
+        self._order = list(keys)
+
+    def browse_params(self):
+        ua = self.ua
+        params = ua.BrowseParameters()
+        params.RequestedMaxReferencesPerNode = self.max_references
+        params.NodesToBrowse = []
+        for key in self.keys:
+            description = ua.BrowseDescription()
+            description.NodeId = ua.NodeId.from_string(key)
+            description.BrowseDirection = ua.BrowseDirection.Forward
+            description.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+            description.IncludeSubtypes = True
+            description.NodeClassMask = 0
+            description.ResultMask = ua.BrowseResultMask.All
+            params.NodesToBrowse.append(description)
+        self._order = list(self.keys)
+        return params
+
+    def next_params(self, release=False):
+        params = self.ua.BrowseNextParameters()
+        params.ReleaseContinuationPoints = release
+        params.ContinuationPoints = list(self.continuation.values())
+        self._order = list(self.continuation)
+        return params
+
+    def consume(self, results):
+        """
+        Collect references of a Browse or BrowseNext response; raises ValueError
+        for failed nodes, leaving the continuation points of the others to release
+        """
+        failed = []
+        self.continuation = OrderedDict()
+        for key, result in zip(self._order, results):
+            if not result.StatusCode.is_good():
+                failed.append(f"{key}: {result.StatusCode.name}")
+                continue
+            self.references[key].extend(result.References or [])
+            if result.ContinuationPoint:
+                self.continuation[key] = result.ContinuationPoint
+        if failed:
+            raise ValueError(f"Could not browse {', '.join(failed)}")
+
+    def variables(self):
+        return [
+            reference for references in self.references.values() for reference in references
+            if reference.NodeClass == self.ua.NodeClass.Variable
+        ]
+
+    def read_ids(self):
+        """ReadValueIds of the DataType attribute of every Variable child"""
+        ua = self.ua
+        read_ids = []
+        for reference in self.variables():
+            rv = ua.ReadValueId()
+            rv.NodeId = local_node_id(ua, reference.NodeId)
+            rv.AttributeId = ua.AttributeIds.DataType
+            read_ids.append(rv)
+        return read_ids
+
+    def children(self, data_types):
+        """Return {key: [child description]} given the results of reading read_ids()"""
+        ua = self.ua
+        data_types = iter(data_types)
+        entries = {}
+        for key, references in self.references.items():
+            children = []
+            for reference in references:
+                data_type = None
+                if reference.NodeClass == ua.NodeClass.Variable:
+                    result = next(data_types)
+                    if result.StatusCode.is_good():
+                        data_type = data_type_name(ua, result.Value.Value)
+                children.append({
+                    "node_id": local_node_id(ua, reference.NodeId).to_string(),
+                    "browse_name": reference.BrowseName.to_string(),
+                    "display_name": reference.DisplayName.Text,
+                    "node_class": reference.NodeClass.name,
+                    "data_type": data_type,
+                    "type_definition": (
+                        local_node_id(ua, reference.TypeDefinition).to_string()
+                        if reference.TypeDefinition.Identifier else None
+                    ),
+                })
+            entries[key] = children
+        return entries
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from django.conf import settings
+
+from .browse import local_node_id
+
+logger = logging.getLogger(__name__)
+
+# NodeId strings such as "i=85", "ns=3;s=Motor" or "nsu=urn:x;s=Motor"; anything else with a slash is a path
+NODE_ID_PATTERN = re.compile(r'^(ns=\d+;|nsu=[^;]+;)?[isgb]=')
+
+# Children of the Root folder, always in namespace 0
+ROOT_FOLDERS = {'Objects', 'Types', 'Views'}
+
+
+def is_browse_path(value):
+    return isinstance(value, str) and '/' in value and not NODE_ID_PATTERN.match(value)
+
+
+def parse_path(path, namespace=0):
+    """
+    Split a path such as ``Objects/PLC1/2:Motor/Speed`` into (namespace, name) pairs.
+
+    A segment may carry its namespace index as ``2:Name``; other segments use
+    ``namespace``, except the Root folders (Objects, Types, Views) which are
+    always in namespace 0. Paths start at the Root folder.
+    """
+    elements = []
+    for segment in path.strip('/').split('/'):
+        prefix, sep, name = segment.partition(':')
+        if sep and prefix.isdigit():
+            elements.append((int(prefix), name))
+        elif not elements and segment in ROOT_FOLDERS:
+            elements.append((0, segment))
+        else:
+            elements.append((namespace, segment))
+    return elements
+
+
+def canonical_path(elements):
+    """Namespace-qualified form used as the cache key, e.g. 0:Objects/2:PLC1"""
+    return '/'.join(f"{namespace}:{name}" for namespace, name in elements)
+
+
+def browse_path(ua, key):
+    """BrowsePath from the Root folder along hierarchical references for a canonical path"""
+    path = ua.BrowsePath()
+    path.StartingNode = ua.NodeId(ua.ObjectIds.RootFolder)
+    path.RelativePath = ua.RelativePath()
+    path.RelativePath.Elements = []
+    for segment in key.split('/'):
+        namespace, _, name = segment.partition(':')
+        element = ua.RelativePathElement()
+        element.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+        element.IsInverse = False
+        element.IncludeSubtypes = True
+        element.TargetName = ua.QualifiedName(name, int(namespace))
+        path.RelativePath.Elements.append(element)
+    return path
+
+
+def translation_results(ua, keys, results):
+    """Return ({key: node id string}, [failed keys with status]) for TranslateBrowsePathsToNodeIds results"""
+    entries = {}
+    failed = []
+    for key, result in zip(keys, results):
+        if result.StatusCode.is_good() and result.Targets:
+            entries[key] = local_node_id(ua, result.Targets[0].TargetId).to_string()
+        else:
+            failed.append(f"{key}: {result.StatusCode.name}")
+    return entries, failed
+
+
+class PathCache:
+    """
+    Persistent browse path -> NodeId string cache of one server.
+
+    Namespace indexes in NodeIds are only stable while the server's namespace
+    array stays the same, so the file is keyed by server url and a fingerprint
+    of that array; a server that reorders its namespaces gets a fresh file.
+    """
+    def __init__(self, server, namespaces, directory=None):
+        self.directory = directory or getattr(settings, 'OPCUA_PATH_CACHE_DIR', None)
+        fingerprint = hashlib.sha1(json.dumps(namespaces).encode()).hexdigest()[:16]
+        server_key = hashlib.sha1(server.encode()).hexdigest()[:16]
+        self.namespaces = namespaces
+        self.path = os.path.join(self.directory, f"{server_key}-{fingerprint}.json") if self.directory else None
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️ Ignoring unreadable browse path cache %s: %s", self.path, e)
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves half a cache behind
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as cache_file:
+            json.dump(self._entries, cache_file)
+        os.replace(temp_path, self.path)
+
+    def namespace_index(self, namespace=None):
+        """Index of a namespace given as index or URI, OPCUA_BROWSE_PATH_NAMESPACE by default"""
+        if namespace is None:
+            namespace = getattr(settings, 'OPCUA_BROWSE_PATH_NAMESPACE', None)
+        if namespace is None or namespace == '':
+            return 0
+        if isinstance(namespace, int) or str(namespace).isdigit():
+            return int(namespace)
+        try:
+            return self.namespaces.index(namespace)
+        except ValueError:
+            raise ValueError(f"Unknown namespace {namespace}")
+
+    def get_many(self, keys):
+        """Return ({key: node id} for cached keys, [uncached keys])"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                node_id = self._entries.get(key)
+                if node_id is None:
+                    missing.append(key)
+                else:
+                    found[key] = node_id
+        return found, list(dict.fromkeys(missing))
+
+    def update(self, entries):
+        with self._lock:
+            self._entries.update(entries)
+            self._save()
+
+    def has_path(self, node_id):
+        with self._lock:
+            return node_id in self._entries.values()
+
+    def invalidate(self, node_ids, below_only=False):
+        """
+        Forget the translations to node_ids and of every path below them, or
+        only the latter with below_only; returns the node ids that were forgotten
+        """
+        node_ids = set(node_ids)
+        with self._lock:
+            prefixes = [key for key, node_id in self._entries.items() if node_id in node_ids]
+            dropped = [
+                key for key in self._entries
+                if any(key.startswith(f"{prefix}/") or (key == prefix and not below_only) for prefix in prefixes)
+            ]
+            forgotten = {self._entries.pop(key) for key in dropped}
+            if dropped:
+                self._save()
+        return forgotten
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def __len__(self):
+        return len(self._entries)
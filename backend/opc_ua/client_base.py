@@ -0,0 +1,511 @@
+import logging
+import os
+
+from .fanout import batcher
+from .recorder import recorder
+from .type_cache import NodeTypeCache
+from .polling import PollingEngine
+from .last_value import LastValueCache
+from .coalesce import ReadCoalescer
+from .write_queue import WriteQueue
+from .history import HistoryReader
+from .browse import BrowseCache
+from .browse_paths import canonical_path, is_browse_path, parse_path, translation_results
+from .reconnect import ReconnectSupervisor
+from .operation_limits import value_ids
+from .metrics import events, notifications
+from .events import EventDispatcher, EventFilterSpec
+
+logger = logging.getLogger(__name__)
+
+
+class SubHandler:
+    """Handles subscription updates from OPC UA server; python-opcua and asyncua both call it."""
+    def __init__(self, session_id=None, last_values=None, url=None):
+        self.session_id = session_id
+        self.url = url
+        self.last_values = last_values if last_values is not None else LastValueCache()
+        self.node_names = {}  # NodeId -> node id string the caller subscribed with
+
+    def datachange_notification(self, node, val, data):
+        logger.debug("📡 Data Change: Node %s, New Value: %s", node, val)
+        notifications.inc(server=self.url)
+
+        node_id = self.node_names.get(node.nodeid, str(node))
+        data_value = data.monitored_item.Value
+        entry = self.last_values.update(
+            node_id, val, data_value.SourceTimestamp, data_value.ServerTimestamp, data_value.StatusCode.name
+        )
+        # Coalesced into the next batch frame for the WebSocket group
+        batcher.add(self.session_id, node_id, val, entry["source_timestamp"], entry["status"])
+        recorder.append(self.url, node_id, val, data_value.SourceTimestamp)
+
+class ModelChangeHandler:
+    """
+    Keeps cached node metadata in line with the address space changes the server reports.
+
+    The browse cache holds the children of a parent. A ReferenceAdded or
+    ReferenceDeleted change names the source of the reference, so only that
+    parent's entry is dropped. A NodeAdded change does not name the parent, so
+    it clears the whole browse cache. A deleted node, or one whose data type
+    changed, drops the parents that list it. Browse path translations stay valid
+    when something is added; deletions forget the paths to the deleted node and
+    the paths below the deleted node or reference.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def event_notification(self, event):
+        client = self.client
+        client.type_cache.invalidate()
+        changes = getattr(event, 'Changes', None)
+        if not changes:
+            # A plain BaseModelChangeEvent says that something changed, not what
+            logger.info("🧩 Model change reported, clearing node metadata caches")
+            client.browse_cache.invalidate()
+            self._forget_paths(None)
+            return
+
+        verbs = client.ua.ModelChangeStructureVerbMask
+        added = False
+        sources, deleted, listed, reference_sources = set(), set(), set(), set()
+        for change in changes:
+            node_id = change.Affected.to_string()
+            verb = int(change.Verb)
+            added = added or bool(verb & verbs.NodeAdded)
+            if verb & (verbs.ReferenceAdded | verbs.ReferenceDeleted):
+                sources.add(node_id)
+            if verb & verbs.ReferenceDeleted:
+                reference_sources.add(node_id)
+            if verb & verbs.NodeDeleted:
+                deleted.add(node_id)
+            if verb & (verbs.NodeDeleted | verbs.DataTypeChanged):
+                listed.add(node_id)
+        logger.info("🧩 Model change reported for %d node(s), updating node metadata caches", len(changes))
+
+        if added:
+            client.browse_cache.invalidate()
+        else:
+            client.browse_cache.invalidate(sources | deleted)
+            client.browse_cache.invalidate_parents(listed)
+        self._forget_paths(deleted, reference_sources)
+
+    def _forget_paths(self, deleted, reference_sources=()):
+        """Drop translations to deleted nodes and below them or below deleted references; None drops all"""
+        client = self.client
+        cache = client.path_cache
+        if deleted is None or (cache is not None and not all(cache.has_path(nid) for nid in reference_sources)):
+            # Which paths went through a removed reference can't be told without the source's own path
+            if cache is not None:
+                cache.clear()
+            client._paths.clear()
+            return
+        if cache is None or not (deleted or reference_sources):
+            return
+        forgotten = cache.invalidate(deleted) | cache.invalidate(reference_sources, below_only=True)
+        for path in [path for path, node_id in client._paths.items() if node_id in forgotten]:
+            client._paths.pop(path, None)
+
+class EventHandler:
+    """Hands the event notifications of one event subscription to its dispatcher."""
+    def __init__(self, dispatcher, url=None):
+        self.dispatcher = dispatcher
+        self.url = url
+
+    def event_notification(self, event):
+        events.inc(server=self.url)
+        self.dispatcher.dispatch(event.event_fields)
+
+class OPCUAError(Exception):
+    """Custom exception for OPC UA connection failures."""
+    pass
+
+
+def unique_id(base_id, existing):
+    """base_id, or base_id with a suffix when existing already has it"""
+    # Keys outlive reconnects while server ids start over, so never reuse one
+    key = base_id
+    suffix = 1
+    while key in existing:
+        suffix += 1
+        key = f"{base_id}-{suffix}"
+    return key
+
+
+class ClientBase:
+    """
+    Session state and protocol-independent logic of OPCUAClient and AsyncOPCUAClient.
+
+    Subclasses name the OPC UA library they use and add only the service calls,
+    blocking for python-opcua and coroutines for asyncua. The helpers here turn
+    node ids into requests and apply the responses to the session's caches and
+    subscription bookkeeping, so both clients behave the same.
+    """
+    client_class = None  # Client class of the OPC UA library
+    ua = None            # its ua module
+    converter = None     # VariantConverter for that ua module
+    lock_class = None    # lock type guarding the subscription bookkeeping
+
+    def __init__(self, url, session_id=None):
+        self.url = url
+        self.session_id = session_id
+        self.client = self.client_class(url)
+        self.cert_path = os.path.join(os.path.dirname(__file__), 'certificates')
+        self.registered_nodes = {}
+        self.subscriptions = {}
+        self.event_subscriptions = {}
+        self._node_index = {}  # node id string -> Node, registered handles take precedence
+        self._paths = {}  # browse path -> node id string, filled by translate_paths
+        self.path_cache = None
+        self.limits = None  # OperationLimits, read on first use
+        self._subscription_lock = self.lock_class()
+        self.type_cache = NodeTypeCache()
+        self.browse_cache = BrowseCache()
+        self.poller = PollingEngine(self)
+        self.last_values = LastValueCache()
+        self.reads = ReadCoalescer()
+        self.writes = WriteQueue(self._write_values)
+        self.supervisor = ReconnectSupervisor(self)
+
+    def configure(self, endpoint, username, password):
+        self.endpoint = endpoint
+        self.username = username
+        self.password = password
+
+    @staticmethod
+    def _endpoint_info(endpoint):
+        return {
+            "endpoint_url": str(endpoint.EndpointUrl),
+            "security_mode": str(int(endpoint.SecurityMode)),
+            "security_policy_uri": str(endpoint.SecurityPolicyUri),
+            "security_level": int(endpoint.SecurityLevel)
+        }
+
+    def _security_string(self):
+        """Argument of set_security_string() for the configured endpoint, None without security"""
+        if int(self.endpoint['security_level']) == 0:
+            return None
+        # Extract security policy and mode
+        security_policy = self.endpoint['security_policy_uri'].split("#")[1]
+        security_mode = int(self.endpoint['security_mode'])
+
+        # Get absolute paths for certificates
+        cert_file = os.path.join(self.cert_path, 'opcua_client_cert.pem')
+        private_key_file = os.path.join(self.cert_path, 'opcua_client_key.pem')
+
+        mode = "Sign" if security_mode == 2 else "SignAndEncrypt"
+        return f"{security_policy},{mode},{cert_file},{private_key_file}"
+
+    def _set_identity(self):
+        self.client.application_uri = "urn:example.org:ozkanerozcan.com"
+        self.client.set_user(self.username)
+        self.client.set_password(self.password)
+
+    def _session_opened(self):
+        """Forget what belonged to a previous session"""
+        logger.info("✅ OPC UA Connected successfully!")
+        # Metadata and handles from a previous session may be stale
+        self.type_cache.invalidate()
+        self.browse_cache.invalidate()
+        self._node_index = {}
+        self._paths = {}
+        # The namespace array may have changed; the cache file is picked again on first use
+        self.path_cache = None
+        self.limits = None
+
+    def _session_closing(self):
+        self.supervisor.stop()
+        self.poller.stop()
+
+    def _replay_node_ids(self):
+        """Node ids and browse paths in use, translated again after a reconnect"""
+        return (
+            list(self.registered_nodes)
+            + [nid for sub_data in self.subscriptions.values() for nid in sub_data['handles']]
+            + list(self.poller.tags())
+            + [sub_data['dispatcher'].spec.source for sub_data in self.event_subscriptions.values()]
+        )
+
+    def get_nodes(self, node_ids):
+        """Resolve node id strings to Node objects, preferring registered handles"""
+        index = self._node_index
+        nodes = []
+        for nid in node_ids:
+            node = index.get(nid)
+            if node is None:
+                # Parse once; later calls reuse the Node
+                node = index[nid] = self.client.get_node(nid)
+            nodes.append(node)
+        return nodes
+
+    def _read_params(self, nodeids):
+        params = self.ua.ReadParameters()
+        params.NodesToRead = value_ids(self.ua, nodeids)
+        return params
+
+    def _read_results(self, node_ids, results):
+        """{node_id: (value, status name)} of Read results, kept in the last value cache"""
+        values = {}
+        for nid, data_value in zip(node_ids, results):
+            value = data_value.Value.Value if data_value.Value is not None else None
+            status = data_value.StatusCode.name
+            self.last_values.update(nid, value, data_value.SourceTimestamp, data_value.ServerTimestamp, status)
+            values[nid] = (value, status)
+        return values
+
+    def _history_reader(self, node_ids, start, end, page_size, aggregate, interval_ms):
+        nodes = self.get_nodes(node_ids)
+        return HistoryReader(
+            self.ua, node_ids, [node.nodeid for node in nodes], start, end, page_size, aggregate, interval_ms
+        )
+
+    def _known_variant_type(self, data_type):
+        """VariantType of a built-in or already resolved DataType NodeId, else None"""
+        if data_type.NamespaceIndex == 0 and isinstance(data_type.Identifier, int) and data_type.Identifier <= 25:
+            return self.ua.VariantType(data_type.Identifier)
+        # Subtypes (enumerations, UtcTime, vendor types...) need a browse up the type tree, once
+        return self.type_cache.data_type(data_type.to_string())
+
+    def _type_info_reads(self, node_ids):
+        """ReadValueIds of DataType, ValueRank and ArrayDimensions of every node"""
+        ua = self.ua
+        attributes = (ua.AttributeIds.DataType, ua.AttributeIds.ValueRank, ua.AttributeIds.ArrayDimensions)
+        read_ids = []
+        for node in self.get_nodes(node_ids):
+            for attribute in attributes:
+                rv = ua.ReadValueId()
+                rv.NodeId = node.nodeid
+                rv.AttributeId = attribute
+                read_ids.append(rv)
+        return read_ids
+
+    @staticmethod
+    def _type_attributes(node_ids, results):
+        """
+        Return ([(node_id, DataType NodeId, value rank, array dimensions)], {node_id: status name})
+        from _type_info_reads() results; nodes whose DataType can't be read go in the second part
+        """
+        attributes = []
+        failed = {}
+        for idx, nid in enumerate(node_ids):
+            data_type, value_rank, array_dimensions = results[idx * 3:idx * 3 + 3]
+            if not data_type.StatusCode.is_good():
+                # Unknown or unreadable node; it fails on its own instead of failing the batch
+                failed[nid] = data_type.StatusCode.name
+                continue
+            attributes.append((
+                nid,
+                data_type.Value.Value,
+                value_rank.Value.Value if value_rank.StatusCode.is_good() else -1,
+                array_dimensions.Value.Value if array_dimensions.StatusCode.is_good() else None,
+            ))
+        return attributes, failed
+
+    def _path_lookup(self, paths, namespace):
+        """Return ({path: cache key}, {key: node id} of cached keys, [untranslated keys])"""
+        namespace = self.path_cache.namespace_index(namespace)
+        keys = {path: canonical_path(parse_path(path, namespace)) for path in paths}
+        found, missing = self.path_cache.get_many(keys.values())
+        return keys, found, missing
+
+    def _translated(self, missing, results):
+        """Cache TranslateBrowsePathsToNodeIds results; returns {key: node id}"""
+        entries, failed = translation_results(self.ua, missing, results)
+        self.path_cache.update(entries)
+        if failed:
+            raise ValueError(f"Could not translate {', '.join(failed)}")
+        return entries
+
+    def _remember_paths(self, keys, found):
+        """Return {path: node id string} and let other methods take the paths as node ids"""
+        node_ids = {path: found[key] for path, key in keys.items()}
+        for path, node_id in node_ids.items():
+            self._paths[path] = node_id
+            if path not in self.registered_nodes:
+                self._node_index[path] = self.client.get_node(node_id)
+        return node_ids
+
+    def _unresolved_paths(self, node_ids):
+        """Browse paths among node_ids that this session has not translated yet"""
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        return [nid for nid in node_ids if is_browse_path(nid) and nid not in self._paths]
+
+    def _browse_keys(self, node_ids):
+        return [self.ua.NodeId.from_string(self._paths.get(nid, nid)).to_string() for nid in node_ids]
+
+    def _data_values(self, node_ids, values, type_info, failed):
+        """(node ids, DataValues) of values converted to the data types of the nodes, without failed nodes"""
+        if len(values) != len(node_ids):
+            raise ValueError("node_id and value must have the same length")
+
+        write_ids = []
+        data_values = []
+        for nid, value in zip(node_ids, values):
+            if nid in failed:
+                continue
+            try:
+                data_values.append(self.converter.to_data_value(value, type_info[nid]))
+            except (ValueError, TypeError, OverflowError) as e:
+                raise ValueError(f"Node {nid}: {e}")
+            write_ids.append(nid)
+        return write_ids, data_values
+
+    @staticmethod
+    def _write_results(node_ids, results):
+        return {nid: result.name for nid, result in zip(node_ids, results)}
+
+    @staticmethod
+    def _merge_statuses(node_ids, statuses, failed):
+        """{node_id: status name} in request order, with the nodes that were left out of the Write"""
+        return {nid: failed[nid] if nid in failed else statuses[nid] for nid in node_ids}
+
+    def _registration_nodes(self, node_ids):
+        return [self.client.get_node(self._paths.get(nid, nid)) for nid in node_ids]
+
+    def _registered(self, node_ids, registered_nodes):
+        """Route node_ids through their registered handles; returns every registration, serialized"""
+        for nid, reg_node in zip(node_ids, registered_nodes):
+            self.registered_nodes[nid] = reg_node
+            # Route the hot path through the server-assigned alias
+            self._node_index[nid] = reg_node
+        return {
+            node_id: {"node": str(reg_node.nodeid)}
+            for node_id, reg_node in self.registered_nodes.items()
+        }
+
+    def _unregistered(self, node_ids):
+        """Forget the registrations of node_ids; returns the handles to unregister"""
+        registered_nodes = [self.registered_nodes.pop(nid) for nid in node_ids if nid in self.registered_nodes]
+        for nid in node_ids:
+            self._node_index.pop(nid, None)
+        return registered_nodes
+
+    def _interval_subscription(self, interval):
+        """Id of the shared subscription for a publishing interval, or None"""
+        for sub_id, sub_data in self.subscriptions.items():
+            if sub_data['interval'] == interval:
+                return sub_id
+        return None
+
+    def _sub_handler(self):
+        return SubHandler(self.session_id, self.last_values, self.url)
+
+    def _add_subscription(self, subscription, handler, interval):
+        sub_id = unique_id(str(subscription.subscription_id), self.subscriptions)
+        self.subscriptions[sub_id] = {
+            'subscription': subscription,
+            'handler': handler,
+            'interval': interval,
+            'handles': {}  # node_id -> monitored item handle
+        }
+        return sub_id
+
+    @staticmethod
+    def _unmonitored(sub_data, node_ids):
+        return [nid for nid in dict.fromkeys(node_ids) if nid not in sub_data['handles']]
+
+    def _monitored(self, sub_data, node_ids, nodes, handles):
+        """Record the monitored items of node_ids; returns {node_id: status name} of refused ones"""
+        failed = {}
+        for nid, node, handle in zip(node_ids, nodes, handles):
+            if isinstance(handle, self.ua.StatusCode):
+                failed[nid] = handle.name
+            else:
+                sub_data['handles'][nid] = handle
+                sub_data['handler'].node_names[node.nodeid] = nid
+        return failed
+
+    def _unsubscribe_plan(self, subscription_id, node_ids):
+        """
+        Return (sub_data, monitored item handles to delete, whether to delete the subscription)
+        per affected subscription; subscriptions to delete are dropped from the bookkeeping
+        """
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        if subscription_id is not None and subscription_id not in self.subscriptions:
+            raise ValueError(f"Subscription ID {subscription_id} not found")
+        sub_ids = [subscription_id] if subscription_id is not None else list(self.subscriptions)
+
+        plan = []
+        for sub_id in sub_ids:
+            sub_data = self.subscriptions[sub_id]
+            handles = []
+            if node_ids is not None:
+                removed = [nid for nid in dict.fromkeys(node_ids) if nid in sub_data['handles']]
+                handles = [sub_data['handles'].pop(nid) for nid in removed]
+                self._forget_names(sub_data['handler'], removed)
+            # Drop the subscription once its last monitored item is gone
+            delete = node_ids is None or not sub_data['handles']
+            if delete:
+                logger.info("Unsubscribing from subscription %s...", sub_id)
+                del self.subscriptions[sub_id]
+            plan.append((sub_data, handles, delete))
+        return plan
+
+    @staticmethod
+    def _forget_names(handler, node_ids):
+        """Drop the NodeId names of unmonitored nodes so the handler doesn't grow with every unsubscribe"""
+        if not node_ids:
+            return
+        node_ids = set(node_ids)
+        for nodeid in [nodeid for nodeid, nid in handler.node_names.items() if nid in node_ids]:
+            del handler.node_names[nodeid]
+
+    def _event_dispatcher(self, source, select, where):
+        return EventDispatcher(self.session_id, None, EventFilterSpec(source, select, where), batcher)
+
+    def _event_subscription_id(self, dispatcher, subscription):
+        """The dispatcher's subscription id, given on its first subscription"""
+        if dispatcher.subscription_id is None:
+            dispatcher.subscription_id = unique_id(f"events-{subscription.subscription_id}", self.event_subscriptions)
+        return dispatcher.subscription_id
+
+    def _event_source(self, spec):
+        return self.get_nodes([self._paths.get(spec.source, spec.source)])[0]
+
+    def _add_event_subscription(self, subscription, dispatcher, interval, handle):
+        sub_id = self._event_subscription_id(dispatcher, subscription)
+        self.event_subscriptions[sub_id] = {
+            'subscription': subscription,
+            'dispatcher': dispatcher,
+            'interval': interval,
+            'handle': handle,
+        }
+        return sub_id
+
+    def _pop_event_subscriptions(self, subscription_id):
+        """Drop one event subscription, or all of them; returns their subscriptions to delete"""
+        if subscription_id is not None and subscription_id not in self.event_subscriptions:
+            raise ValueError(f"Event subscription ID {subscription_id} not found")
+        sub_ids = [subscription_id] if subscription_id is not None else list(self.event_subscriptions)
+        subscriptions = []
+        for sub_id in sub_ids:
+            logger.info("Unsubscribing from event subscription %s...", sub_id)
+            subscriptions.append(self.event_subscriptions.pop(sub_id)['subscription'])
+        return subscriptions
+
+    def _refresh_targets(self, subscription_id):
+        """(sub_id, sub_data) of the event subscriptions a ConditionRefresh is for"""
+        sub_ids = [subscription_id] if subscription_id is not None else list(self.event_subscriptions)
+        targets = []
+        for sub_id in sub_ids:
+            sub_data = self.event_subscriptions.get(sub_id)
+            if sub_data is None:
+                raise OPCUAError(f"Condition refresh: Event subscription ID {sub_id} not found")
+            targets.append((sub_id, sub_data))
+        return targets
+
+    def _refresh_arguments(self, sub_data):
+        ua = self.ua
+        return (
+            ua.NodeId(ua.ObjectIds.ConditionType_ConditionRefresh),
+            ua.Variant(sub_data['subscription'].subscription_id, ua.VariantType.UInt32),
+        )
+
+    @staticmethod
+    def _refresh_failed(sub_id, sub_data, error):
+        # Without ConditionRefresh clients still get what this session has seen so far
+        logger.warning("⚠️ ConditionRefresh failed for %s: %s", sub_id, error)
+        sub_data['dispatcher'].publish_alarms()
+        return str(error)
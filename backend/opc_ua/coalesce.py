@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+
+
+class ReadBatch:
+    """Node ids of the callers that share one Read."""
+    def __init__(self):
+        self.node_ids = {}  # insertion-ordered set
+        self.callers = 0
+        self.values = None
+        self.error = None
+        self.done = threading.Event()
+        self.task = None
+
+
+class ReadCoalescer:
+    """
+    Merges concurrent reads of one session into a single Read of their union.
+
+    A caller that finds no read in flight reads at once. Otherwise it opens a
+    batch and waits OPCUA_READ_COALESCE_MS for others to add their node ids;
+    then one read goes to the server and every caller gets its own subset
+    back. A caller whose nodes are all part of a read that
+    is already in flight waits for that one instead. When the merged read
+    fails, each caller reads its own nodes again, so one bad node id does not
+    fail the others.
+    """
+    def __init__(self, window_ms=None):
+        self.window_ms = window_ms
+        self._lock = threading.Lock()
+        self._collecting = None
+        self._in_flight = []
+        self.requests = 0
+        self.reads = 0
+
+    @property
+    def window(self):
+        window_ms = self.window_ms if self.window_ms is not None else getattr(settings, 'OPCUA_READ_COALESCE_MS', 5)
+        return window_ms / 1000
+
+    def _join(self, node_ids):
+        """Return (batch, wait) for a caller of node_ids; wait is None unless it leads the batch"""
+        with self._lock:
+            self.requests += 1
+            wanted = set(node_ids)
+            batch = next((b for b in self._in_flight if wanted.issubset(b.node_ids)), None)
+            wait = None
+            if batch is None:
+                batch = self._collecting
+                if batch is None:
+                    batch = self._collecting = ReadBatch()
+                    # Uncontended reads skip the window; readers only pile up behind a read in flight
+                    wait = self.window if self._in_flight else 0
+                batch.node_ids.update(dict.fromkeys(node_ids))
+            batch.callers += 1
+            return batch, wait
+
+    def _close(self, batch):
+        """Stop collecting into batch; it is read next"""
+        with self._lock:
+            if self._collecting is batch:
+                self._collecting = None
+            self._in_flight.append(batch)
+            self.reads += 1
+
+    def _finish(self, batch):
+        with self._lock:
+            self._in_flight.remove(batch)
+
+    def _result(self, batch, node_ids):
+        """This caller's values, or None when it has to read on its own"""
+        if batch.error is None:
+            return {nid: batch.values[nid] for nid in node_ids}
+        if batch.callers == 1:
+            raise batch.error
+        with self._lock:
+            self.reads += 1
+        return None
+
+    def read(self, node_ids, fetch):
+        """Return fetch(node_ids), sharing the call with concurrent readers"""
+        batch, wait = self._join(node_ids)
+        if wait is not None:
+            if wait:
+                time.sleep(wait)
+            self._close(batch)
+            try:
+                batch.values = fetch(list(batch.node_ids))
+            except Exception as e:
+                batch.error = e
+            finally:
+                self._finish(batch)
+                batch.done.set()
+        else:
+            batch.done.wait()
+        values = self._result(batch, node_ids)
+        return fetch(node_ids) if values is None else values
+
+    async def read_async(self, node_ids, fetch):
+        """Coroutine version of read() for asyncio sessions; fetch is a coroutine function"""
+        batch, wait = self._join(node_ids)
+        if wait is not None:
+            # A task of its own, so a caller that gets cancelled does not take the others' read with it
+            batch.task = asyncio.ensure_future(self._flush_async(batch, fetch, wait))
+        await asyncio.shield(batch.task)
+        values = self._result(batch, node_ids)
+        return await fetch(node_ids) if values is None else values
+
+    async def _flush_async(self, batch, fetch, wait):
+        if wait:
+            await asyncio.sleep(wait)
+        self._close(batch)
+        try:
+            batch.values = await fetch(list(batch.node_ids))
+        except Exception as e:
+            batch.error = e
+        finally:
+            self._finish(batch)
+            batch.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "reads": self.reads,
+                "coalesced": self.requests - self.reads,
+            }
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import uuid
+
+from .opc_ua_client import OPCUAClient, OPCUAError
+from .async_client import AsyncOPCUAClient, call_client
+from .metrics import sessions
+
+logger = logging.getLogger(__name__)
+
+# Keys a password digest with a per-process secret, so pool keys never hold anything reusable
+_KEY_SECRET = os.urandom(32)
+
+
+def credential_digest(password):
+    """Digest telling passwords apart in a pool key; empty without a password"""
+    if not password:
+        return ''
+    return hmac.new(_KEY_SECRET, password.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class OPCUAConnectionPool:
+    """
+    Thread-safe registry of OPC UA sessions keyed by endpoint, security settings and credentials.
+
+    Every connect that returns a session holds a reference to it; release
+    drops one and only the last release disconnects the session.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}   # session_id -> OPCUAClient
+        self._keys = {}       # pool key -> session_id
+        self._references = {}  # session_id -> callers holding the session
+        self._key_locks = {}  # pool key -> lock serializing connects for that key
+        self._async_key_locks = {}
+
+    @staticmethod
+    def make_key(endpoint, username=None, kind='sync', password=None):
+        """Build the pool key for an endpoint description, credentials and client kind"""
+        return (
+            endpoint['endpoint_url'],
+            endpoint.get('security_policy_uri', ''),
+            str(endpoint.get('security_mode', '')),
+            username or '',
+            credential_digest(password),
+            kind,
+        )
+
+    def _reuse(self, key):
+        """Session id open for key with one more reference, or None; call with self._lock held"""
+        session_id = self._keys.get(key)
+        if session_id:
+            self._references[session_id] += 1
+        return session_id
+
+    def _add(self, key, session_id, client):
+        with self._lock:
+            self._sessions[session_id] = client
+            self._keys[key] = session_id
+            self._references[session_id] = 1
+
+    def connect(self, endpoint, username=None, password=None):
+        """Return (session_id, created), reusing an open session for the same key"""
+        key = self.make_key(endpoint, username, password=password)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one worker connects per key; other keys are not blocked meanwhile
+        with key_lock:
+            with self._lock:
+                session_id = self._reuse(key)
+                if session_id:
+                    return session_id, False
+
+            session_id = uuid.uuid4().hex
+            client = OPCUAClient(endpoint['endpoint_url'], session_id=session_id)
+            client.configure(endpoint, username, password)
+            client.connect()
+            client.supervisor.start()
+
+            self._add(key, session_id, client)
+            return session_id, True
+
+    async def connect_async(self, endpoint, username=None, password=None):
+        """Return (session_id, created) for an AsyncOPCUAClient session on the running event loop"""
+        key = self.make_key(endpoint, username, kind='asyncio', password=password)
+        with self._lock:
+            key_lock = self._async_key_locks.setdefault(key, asyncio.Lock())
+
+        async with key_lock:
+            with self._lock:
+                session_id = self._reuse(key)
+                if session_id:
+                    return session_id, False
+
+            session_id = uuid.uuid4().hex
+            client = AsyncOPCUAClient(endpoint['endpoint_url'], session_id=session_id)
+            client.configure(endpoint, username, password)
+            await client.connect()
+            client.supervisor.start()
+
+            self._add(key, session_id, client)
+            return session_id, True
+
+    def get(self, session_id):
+        """Return the client for a session or None"""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def sessions(self):
+        """Return a snapshot of (session_id, client) pairs"""
+        with self._lock:
+            return list(self._sessions.items())
+
+    def find(self, url):
+        """Return ids of sessions connected to the given server url"""
+        with self._lock:
+            return [key_id for key, key_id in self._keys.items() if key[0] == url]
+
+    def references(self, session_id):
+        """Number of callers holding a session"""
+        with self._lock:
+            return self._references.get(session_id, 0)
+
+    def _drop(self, session_id):
+        """Remove a session from the pool and return its client; call with self._lock held"""
+        client = self._sessions.pop(session_id, None)
+        if client is None:
+            raise OPCUAError(f"Session {session_id} not found")
+        self._references.pop(session_id, None)
+        for key, key_id in list(self._keys.items()):
+            if key_id == session_id:
+                del self._keys[key]
+        return client
+
+    def _release(self, session_id):
+        """Drop one reference; returns (references left, client to disconnect after the last one or None)"""
+        with self._lock:
+            if session_id not in self._sessions:
+                raise OPCUAError(f"Session {session_id} not found")
+            self._references[session_id] -= 1
+            remaining = self._references[session_id]
+            client = self._drop(session_id) if remaining <= 0 else None
+        return max(remaining, 0), client
+
+    def release(self, session_id):
+        """Drop one caller's reference, disconnecting after the last; returns the references left"""
+        remaining, client = self._release(session_id)
+        if client is not None:
+            call_client(client.disconnect)
+        return remaining
+
+    async def release_async(self, session_id):
+        """release() of an AsyncOPCUAClient session, disconnecting it on the running event loop"""
+        remaining, client = self._release(session_id)
+        if client is not None:
+            await client.disconnect()
+        return remaining
+
+    def disconnect(self, session_id):
+        """Close a session for every caller and drop it from the pool"""
+        with self._lock:
+            client = self._drop(session_id)
+        call_client(client.disconnect)
+
+    def disconnect_all(self):
+        """Close every pooled session"""
+        for session_id, _ in self.sessions():
+            try:
+                self.disconnect(session_id)
+            except OPCUAError as e:
+                logger.warning("⚠️ %s", e)
+
+
+pool = OPCUAConnectionPool()
+sessions.set_function(lambda: len(pool.sessions()))
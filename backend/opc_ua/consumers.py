@@ -1,26 +1,324 @@
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
+import asyncio
+import inspect
 import json
+import logging
+import time
+import weakref
+from urllib.parse import parse_qs
+
+from channels.exceptions import StopConsumer
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .binary_frames import BATCH, CONFLATED_BATCH, SNAPSHOT, FrameEncoder
+from .connection_pool import pool
+from .events import snapshot_alarms
+from .executor import executor_for
+from .fanout import batch_frame, batcher, select_entries
+from .ingest import request_snapshot
+from .last_value import snapshot_updates
+from .metrics import dropped_frames, track_queue, websocket_conflated, websocket_lag, websockets
+from .outbox import Outbox
+from .write_queue import write_status
+
+logger = logging.getLogger(__name__)
+
+# Close code for sockets that fall too far behind
+TOO_SLOW = 4008
+
+# Open consumers of this process, for /api/sockets/ and the metrics
+sockets = weakref.WeakSet()
+
+
+class OPCConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        # Updates held back while the client is behind
+        self.outbox = Outbox()
+        # Writes still waiting for their status
+        self.writes = set()
+        # None means "every node"; a set of (session_id, node_id) keys otherwise.
+        # session_id None in a key matches the node on any session.
+        self.interest = None
+        # None sends JSON text frames; a FrameEncoder sends binary frames
+        self.encoder = None
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        if query.get('encoding') == ['binary']:
+            self.encoder = FrameEncoder()
 
-class OPCConsumer(WebsocketConsumer):
-    def connect(self):
         # Accept WebSocket connection
-        self.accept()
+        await self.accept()
+        batcher.attach(asyncio.get_running_loop())
+        sockets.add(self)
 
         # Add client to "opcua_updates" group
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             "opcua_updates",
             self.channel_name
         )
 
-    def disconnect(self, close_code):
+        # Current values first, so the page does not wait for the next change
+        await self.send_snapshot()
+        # Then every active alarm in one burst, empty only if there are event subscriptions at all
+        sessions = pool.sessions()
+        await self.send_alarms_frame(
+            snapshot_alarms(sessions), empty=any(client.event_subscriptions for _, client in sessions)
+        )
+
+    async def disconnect(self, close_code):
+        sockets.discard(self)
         # Remove client from "opcua_updates" group
-        async_to_sync(self.channel_layer.group_discard)(
+        await self.channel_layer.group_discard(
             "opcua_updates",
             self.channel_name
         )
 
-    def send_update(self, event):
-        """Send OPC UA updates to frontend"""
-        data = event['data']
-        self.send(text_data=data)
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle subscribe/unsubscribe requests that narrow what this socket receives"""
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            await self.send_error("Messages must be JSON")
+            return
+        if not isinstance(message, dict):
+            await self.send_error("Messages must be JSON objects")
+            return
+
+        action = message.get('action')
+        node_ids = message.get('node_ids')
+        session_id = message.get('session_id')
+
+        if action == 'ack':
+            # Not answered; acknowledgements only open the window again
+            if not isinstance(message.get('frames'), int):
+                await self.send_error("frames must be the number of messages received")
+                return
+            self.outbox.ack(message['frames'])
+            await self.send_outbox()
+            return
+
+        if action == 'write':
+            # Answered with a write_status frame once the queued write is done
+            task = asyncio.ensure_future(self.write(message))
+            self.writes.add(task)
+            task.add_done_callback(self.writes.discard)
+            return
+
+        if action == 'encoding':
+            await self.set_encoding(message.get('encoding'))
+            return
+
+        snapshot = None
+        if action == 'subscribe':
+            if node_ids == '*':
+                self.interest = None
+            else:
+                if not isinstance(node_ids, list):
+                    await self.send_error("node_ids must be a list or '*'")
+                    return
+                snapshot = {(session_id, nid) for nid in node_ids}
+                if self.interest is None:
+                    self.interest = set()
+                    snapshot = None
+                else:
+                    snapshot -= self.interest
+                self.interest.update((session_id, nid) for nid in node_ids)
+        elif action == 'unsubscribe':
+            if node_ids == '*' or node_ids is None:
+                self.interest = set()
+            elif not isinstance(node_ids, list):
+                await self.send_error("node_ids must be a list or '*'")
+                return
+            elif self.interest is not None:
+                self.interest.difference_update((session_id, nid) for nid in node_ids)
+            else:
+                await self.send_error("Subscribe to a node list before unsubscribing single nodes")
+                return
+        else:
+            await self.send_error(f"Unknown action {action}")
+            return
+
+        await self.send(text_data=json.dumps({
+            "type": "interest",
+            "node_ids": '*' if self.interest is None else sorted(nid for _, nid in self.interest)
+        }))
+        if snapshot:
+            await self.send_snapshot(snapshot)
+
+    async def send_snapshot(self, keys=None):
+        """Send cached last values matching keys, or this socket's interest"""
+        keys = keys if keys is not None else self.interest
+        await self.send_snapshot_frame(snapshot_updates(pool.sessions(), keys))
+        # Sessions owned by ingest workers answer over the channel layer
+        await request_snapshot(self.channel_layer, self.channel_name, keys)
+
+    async def send_snapshot_frame(self, updates):
+        await self.send_updates("snapshot", updates)
+
+    async def set_encoding(self, encoding):
+        if encoding == 'binary':
+            # A fresh dictionary; handles are announced again as they are used
+            self.encoder = FrameEncoder()
+        elif encoding == 'json':
+            self.encoder = None
+        else:
+            await self.send_error("encoding must be 'json' or 'binary'")
+            return
+        await self.send(text_data=json.dumps({"type": "encoding", "encoding": encoding}))
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        try:
+            # Servers that apply backpressure block here while the client does not read
+            await asyncio.wait_for(super().send(text_data, bytes_data, close), self.outbox.send_timeout)
+        except asyncio.TimeoutError:
+            # A close frame would queue behind the stuck send, so just stop serving the socket
+            self.drop_slow(f"a send took more than {self.outbox.send_timeout:g}s")
+            await self.channel_layer.group_discard("opcua_updates", self.channel_name)
+            raise StopConsumer()
+        if text_data is not None or bytes_data is not None:
+            self.outbox.sent()
+
+    def drop_slow(self, reason):
+        logger.warning("⚠️ Closing slow WebSocket %s: %s", self.channel_name, reason)
+        dropped_frames.inc(reason="slow_consumer")
+        sockets.discard(self)
+
+    async def send_updates(self, kind, updates, conflated=False):
+        """Send a batch or snapshot frame in this socket's encoding; conflated flags a batch that skipped values"""
+        if not updates:
+            return
+        if self.encoder is None:
+            frame = {"type": kind, "updates": updates}
+            if conflated:
+                frame["conflated"] = True
+            await self.send(text_data=json.dumps(frame, default=str))
+            return
+        if kind == "snapshot":
+            frame_kind = SNAPSHOT
+        else:
+            frame_kind = CONFLATED_BATCH if conflated else BATCH
+        handles, frame = self.encoder.encode(frame_kind, updates)
+        if handles:
+            await self.send(text_data=json.dumps({"type": "dictionary", "handles": handles}))
+        await self.send(bytes_data=frame)
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({"type": "error", "message": message}))
+
+    async def send_update(self, event):
+        """Send OPC UA updates to frontend, or hold them back while the client is behind"""
+        entries = select_entries(event, self.interest)
+        if not entries:
+            return
+
+        # Batches pile up in the channel layer while this socket's sends keep it busy
+        queued_ms = (time.time() - event['created']) * 1000 if 'created' in event else 0.0
+        if not len(self.outbox) and self.outbox.can_send() and not self.outbox.too_slow(queued_ms):
+            # Nothing held back, so the entries go out as they came
+            if self.encoder is None:
+                await self.send(text_data=batch_frame(entries))
+            else:
+                await self.send_updates("batch", [json.loads(entry) for entry in entries])
+            return
+
+        updates = [json.loads(entry) for entry in entries]
+        self.outbox.add(updates)
+        reason = self.outbox.too_slow(queued_ms)
+        if reason:
+            self.drop_slow(reason)
+            await self.close(code=TOO_SLOW)
+            return
+        await self.send_outbox()
+
+    async def send_outbox(self):
+        """Send the held back updates as one frame if the client has room for it"""
+        if len(self.outbox) and self.outbox.can_send():
+            updates, replaced = self.outbox.take()
+            if replaced:
+                websocket_conflated.inc(replaced)
+            await self.send_updates("batch", updates, conflated=replaced > 0)
+
+    def stats(self):
+        client = self.scope.get('client') or (None, None)
+        return {
+            "channel": self.channel_name,
+            "client": f"{client[0]}:{client[1]}" if client[0] else None,
+            "encoding": "json" if self.encoder is None else "binary",
+            "interest": '*' if self.interest is None else len(self.interest),
+            **self.outbox.stats(),
+        }
+
+    async def write(self, message):
+        """Queue a write of a session in this process and send its write_status to this socket"""
+        session_id = message.get('session_id')
+        node_ids = message.get('node_ids')
+        values = message.get('values')
+        write_id = message.get('write_id')
+        client = pool.get(session_id)
+        if client is None:
+            await self.send_error(f"Session {session_id} not found")
+            return
+        if not isinstance(node_ids, list) or not isinstance(values, list) or len(node_ids) != len(values):
+            await self.send_error("node_ids and values must be lists of the same length")
+            return
+
+        timeout = getattr(settings, 'OPCUA_REQUEST_TIMEOUT_MS', 10000) / 1000
+        try:
+            if inspect.iscoroutinefunction(client.queue_write):
+                await client.resolve_paths(node_ids)
+                ticket = await client.queue_write(node_ids, values)
+            else:
+                def queue():
+                    client.resolve_paths(node_ids)
+                    return client.queue_write(node_ids, values)
+
+                ticket = await executor_for(client.url).run(queue, timeout=timeout)
+            await ticket.wait()
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = f"Server {client.url} did not answer within {timeout:g}s"
+            await self.write_status({
+                "type": "write_status", "write_id": write_id, "session_id": session_id, "message": str(e)
+            })
+            return
+        await self.write_status(write_status(session_id, ticket, write_id))
+
+    async def write_status(self, event):
+        """Outcome of a queued write"""
+        await self.send(text_data=json.dumps(event, default=str))
+
+    async def snapshot_reply(self, event):
+        """Snapshot from an ingest worker, filtered to what this socket wants now"""
+        interest = self.interest
+        await self.send_snapshot_frame([
+            update for update in event['updates']
+            if interest is None or (None, update['node_id']) in interest
+            or (update['session_id'], update['node_id']) in interest
+        ])
+        await self.send_alarms_frame(event.get('alarms'))
+
+    async def send_alarms_frame(self, alarms, session_id=None, subscription_id=None, empty=False):
+        """
+        Retained conditions as one alarms frame. A frame naming a subscription
+        replaces that subscription's alarms on the client, one without replaces
+        all of them; empty frames are only sent when asked for.
+        """
+        if not alarms and not empty:
+            return
+        frame = {"type": "alarms", "alarms": alarms or []}
+        if subscription_id is not None:
+            frame["session_id"] = session_id
+            frame["subscription_id"] = subscription_id
+        await self.send(text_data=json.dumps(frame, default=str))
+
+    async def send_events(self, event):
+        """Event notifications; never held back or conflated, and always JSON"""
+        await self.send(text_data=json.dumps({"type": "events", "events": event['events']}, default=str))
+
+    async def send_alarms(self, event):
+        """Retained conditions of one event subscription after a ConditionRefresh"""
+        await self.send_alarms_frame(event['alarms'], event['session_id'], event['subscription_id'], empty=True)
+
+
+websockets.set_function(lambda: len(sockets))
+websocket_lag.set_function(lambda: max((socket.outbox.lag_ms() for socket in list(sockets)), default=0) / 1000)
+track_queue("websocket", lambda: sum(len(socket.outbox) for socket in list(sockets)))
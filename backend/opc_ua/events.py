@@ -0,0 +1,283 @@
+import functools
+import json
+import threading
+from datetime import datetime
+
+# Fields selected when a subscription does not name its own
+DEFAULT_FIELDS = [
+    "EventId", "EventType", "SourceNode", "SourceName", "Time", "Message", "Severity",
+    "ConditionName", "ActiveState/Id", "AckedState/Id", "Retain",
+]
+
+# The alarm cache and condition refresh need these whatever the caller selects
+REQUIRED_FIELDS = ["EventType", "Retain"]
+
+# ObjectIds names of the event type each standard field is defined on; other fields are looked up
+# on BaseEventType and may carry a namespace index, such as "2:Setpoint"
+FIELD_TYPES = {
+    "ConditionName": "ConditionType",
+    "ConditionClassId": "ConditionType",
+    "ConditionClassName": "ConditionType",
+    "BranchId": "ConditionType",
+    "Retain": "ConditionType",
+    "EnabledState": "ConditionType",
+    "Quality": "ConditionType",
+    "LastSeverity": "ConditionType",
+    "Comment": "ConditionType",
+    "ClientUserId": "ConditionType",
+    "AckedState": "AcknowledgeableConditionType",
+    "ConfirmedState": "AcknowledgeableConditionType",
+    "ActiveState": "AlarmConditionType",
+    "SuppressedState": "AlarmConditionType",
+    "ShelvingState": "AlarmConditionType",
+}
+
+# Selected as the NodeId attribute of the condition itself rather than a field
+CONDITION_ID = "ConditionId"
+
+# Event types a server sends around the burst of retained conditions of a ConditionRefresh
+REFRESH_START = "i=2787"
+REFRESH_END = "i=2788"
+
+
+def json_value(value):
+    """JSON-safe form of an event field"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    if hasattr(value, 'Text'):
+        return value.Text
+    if hasattr(value, 'to_string'):
+        return value.to_string()
+    return str(value)
+
+
+class EventFilterSpec:
+    """
+    What an event subscription asks the server for.
+
+    select names the fields to return, as browse paths below the event type
+    ("Message", "ActiveState/Id", "2:Setpoint"). where narrows the events on
+    the server: {"min_severity": 500, "event_types": ["i=2915"],
+    "source_nodes": ["ns=2;s=Boiler"]}, all optional and combined with AND.
+    """
+    def __init__(self, source="i=2253", select=None, where=None):
+        self.source = source
+        self.select = list(dict.fromkeys(list(select or DEFAULT_FIELDS) + REQUIRED_FIELDS))
+        self.where = where or {}
+        unknown = set(self.where) - {"min_severity", "event_types", "source_nodes"}
+        if unknown:
+            raise ValueError(f"Unknown where clause {', '.join(sorted(unknown))}")
+
+    @property
+    def fields(self):
+        """Names of the event fields in the order the server returns them"""
+        return self.select + [CONDITION_ID]
+
+    def as_dict(self):
+        return {"source": self.source, "select": self.select, "where": self.where}
+
+    @staticmethod
+    def _operand(ua, field):
+        operand = ua.SimpleAttributeOperand()
+        path = [ua.QualifiedName.from_string(name) for name in field.split("/")]
+        type_name = FIELD_TYPES.get(field.split("/")[0], "BaseEventType")
+        operand.TypeDefinitionId = ua.NodeId(getattr(ua.ObjectIds, type_name))
+        operand.BrowsePath = path
+        operand.AttributeId = ua.AttributeIds.Value
+        return operand
+
+    @staticmethod
+    def _condition_operand(ua):
+        operand = ua.SimpleAttributeOperand()
+        operand.TypeDefinitionId = ua.NodeId(ua.ObjectIds.ConditionType)
+        operand.AttributeId = ua.AttributeIds.NodeId
+        return operand
+
+    @staticmethod
+    def _literal(ua, value, variant_type=None):
+        literal = ua.LiteralOperand()
+        literal.Value = ua.Variant(value, variant_type) if variant_type else ua.Variant(value)
+        return literal
+
+    def _conditions(self, ua):
+        """The where clause as (operator, operands) trees; an operand that is a tuple is a nested element"""
+        conditions = []
+        if self.where.get("min_severity") is not None:
+            conditions.append((ua.FilterOperator.GreaterThanOrEqual, [
+                self._operand(ua, "Severity"),
+                self._literal(ua, int(self.where["min_severity"]), ua.VariantType.UInt16),
+            ]))
+        if self.where.get("event_types"):
+            types = [
+                (ua.FilterOperator.OfType, [self._literal(ua, ua.NodeId.from_string(event_type))])
+                for event_type in self.where["event_types"]
+            ]
+            conditions.append(functools.reduce(lambda a, b: (ua.FilterOperator.Or, [a, b]), types))
+        if self.where.get("source_nodes"):
+            conditions.append((ua.FilterOperator.InList, [self._operand(ua, "SourceNode")] + [
+                self._literal(ua, ua.NodeId.from_string(source)) for source in self.where["source_nodes"]
+            ]))
+        return conditions
+
+    def where_clause(self, ua):
+        """ContentFilter evaluated by the server, so unwanted events never reach this process"""
+        content_filter = ua.ContentFilter()
+        content_filter.Elements = []
+        conditions = self._conditions(ua)
+        if not conditions:
+            return content_filter
+
+        def add(tree):
+            # The root must be the first element, so parents are placed before their operands
+            element = ua.ContentFilterElement()
+            element.FilterOperator = tree[0]
+            content_filter.Elements.append(element)
+            operands = []
+            for operand in tree[1]:
+                if isinstance(operand, tuple):
+                    reference = ua.ElementOperand()
+                    reference.Index = add(operand)
+                    operand = reference
+                operands.append(operand)
+            element.FilterOperands = operands
+            return content_filter.Elements.index(element)
+
+        add(functools.reduce(lambda a, b: (ua.FilterOperator.And, [a, b]), conditions))
+        return content_filter
+
+    def event_filter(self, ua):
+        event_filter = ua.EventFilter()
+        event_filter.SelectClauses = [self._operand(ua, field) for field in self.select] + [self._condition_operand(ua)]
+        event_filter.WhereClause = self.where_clause(ua)
+        return event_filter
+
+    def event(self, event_fields):
+        """{field: JSON-safe value} of one notification's EventFields"""
+        return {
+            field: json_value(variant.Value if variant is not None else None)
+            for field, variant in zip(self.fields, event_fields)
+        }
+
+
+class AlarmCache:
+    """
+    Conditions an event subscription's server still retains, by ConditionId.
+
+    Condition events with Retain true are kept and Retain false ones drop
+    their condition. Between the RefreshStart and RefreshEnd events of a
+    ConditionRefresh the server sends every retained condition again; what
+    it does not resend is gone.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._alarms = {}
+        self._refreshed = None  # condition ids seen since RefreshStart
+
+    @property
+    def refreshing(self):
+        return self._refreshed is not None
+
+    def begin_refresh(self):
+        with self._lock:
+            self._refreshed = set()
+
+    def end_refresh(self):
+        with self._lock:
+            if self._refreshed is not None:
+                for condition_id in set(self._alarms) - self._refreshed:
+                    del self._alarms[condition_id]
+            self._refreshed = None
+
+    @staticmethod
+    def condition_key(event):
+        """ConditionId, or source and name for servers that do not return it; None for plain events"""
+        if event.get(CONDITION_ID):
+            return event[CONDITION_ID]
+        if isinstance(event.get("Retain"), bool):
+            return f"{event.get('SourceNode')}/{event.get('ConditionName')}"
+        return None
+
+    def update(self, event):
+        """Track a condition event; returns False for events that are not about a condition"""
+        condition_id = self.condition_key(event)
+        if condition_id is None:
+            return False
+        with self._lock:
+            if self._refreshed is not None:
+                self._refreshed.add(condition_id)
+            if event.get("Retain") is False:
+                self._alarms.pop(condition_id, None)
+            else:
+                self._alarms[condition_id] = event
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._alarms.values())
+
+    def clear(self):
+        with self._lock:
+            self._alarms.clear()
+            self._refreshed = None
+
+
+def snapshot_alarms(sessions):
+    """Retained conditions of every event subscription of (session_id, client) pairs"""
+    return [
+        alarm
+        for _, client in sessions
+        for sub_data in list(getattr(client, 'event_subscriptions', {}).values())
+        for alarm in sub_data['dispatcher'].alarms.snapshot()
+    ]
+
+
+def alarms_message(session_id, subscription_id, alarms):
+    """Channel layer message carrying every retained condition of one event subscription"""
+    return {
+        "type": "send_alarms",
+        "session_id": session_id,
+        "subscription_id": subscription_id,
+        "alarms": alarms,
+    }
+
+
+class EventDispatcher:
+    """
+    Turns the event notifications of one subscription into WebSocket traffic.
+
+    Events go out in the batcher's next events frame. The conditions a
+    ConditionRefresh sends between RefreshStart and RefreshEnd only update
+    the alarm cache, which RefreshEnd then sends as one alarms frame.
+    """
+    def __init__(self, session_id, subscription_id, spec, batcher):
+        self.session_id = session_id
+        self.subscription_id = subscription_id
+        self.spec = spec
+        self.batcher = batcher
+        self.alarms = AlarmCache()
+
+    def publish_alarms(self):
+        self.batcher.publish(alarms_message(self.session_id, self.subscription_id, self.alarms.snapshot()))
+
+    def dispatch(self, event_fields):
+        event = self.spec.event(event_fields)
+        event_type = event.get("EventType")
+        if event_type == REFRESH_START:
+            self.alarms.begin_refresh()
+            return
+        if event_type == REFRESH_END:
+            self.alarms.end_refresh()
+            self.publish_alarms()
+            return
+        event["session_id"] = self.session_id
+        event["subscription_id"] = self.subscription_id
+        refreshing = self.alarms.refreshing
+        self.alarms.update(event)
+        if not refreshing:
+            self.batcher.add_event(event)
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .metrics import rejected_requests, track_queue
+
+
+class ServerBusy(Exception):
+    """Raised when a server's executor has no room for another call."""
+    pass
+
+
+class ServerExecutor:
+    """
+    Bounded thread pool for the blocking calls made to one OPC UA server.
+
+    At most OPCUA_SERVER_WORKERS calls run at once and OPCUA_SERVER_QUEUE more
+    may wait; beyond that run() raises ServerBusy right away instead of piling
+    threads up behind a slow PLC. A call that times out or is cancelled while
+    still queued is dropped. One that already runs cannot be interrupted and
+    keeps its slot until it returns.
+    """
+    def __init__(self, name, workers=None, queue=None, server=None):
+        self.server = server
+        self.workers = workers or getattr(settings, 'OPCUA_SERVER_WORKERS', 4)
+        self.queue = queue if queue is not None else getattr(settings, 'OPCUA_SERVER_QUEUE', 16)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=f"opcua-{name}")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Await func(*args, **kwargs) on a worker thread, for at most timeout seconds"""
+        with self._lock:
+            if self.pending >= self.workers + self.queue:
+                self.rejected += 1
+                rejected_requests.inc(server=self.server, reason="busy")
+                raise ServerBusy(f"{self.pending} requests are already waiting for this server")
+            self.pending += 1
+        state = {"started": False, "dropped": False}
+
+        def call():
+            with self._lock:
+                if state["dropped"]:
+                    return None
+                state["started"] = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.pending -= 1
+
+        try:
+            # sync_to_async keeps async_to_sync inside func pointed at this event loop
+            return await asyncio.wait_for(
+                sync_to_async(call, thread_sensitive=False, executor=self._executor)(), timeout
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            rejected_requests.inc(server=self.server, reason="timeout")
+            raise
+        finally:
+            with self._lock:
+                if not state["started"]:
+                    state["dropped"] = True
+                    self.pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue": self.queue,
+                "pending": self.pending,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def executor_for(url):
+    """Return the shared executor of a server url"""
+    with _executors_lock:
+        executor = _executors.get(url)
+        if executor is None:
+            executor = _executors[url] = ServerExecutor(len(_executors), server=url)
+            track_queue(f"executor {url}", lambda: executor.pending)
+        return executor
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .metrics import dropped_frames, fanout_conflated, fanout_seconds, fanout_updates, track_queue
+
+logger = logging.getLogger(__name__)
+
+
+def batch_frame(entries):
+    """JSON batch frame of update entries already encoded by NotificationBatcher.take()"""
+    return '{"type": "batch", "updates": [' + ', '.join(entries) + ']}'
+
+
+def select_entries(message, interest):
+    """
+    Entries of a send_update message for interest, a set of (session_id, node_id)
+    keys where session_id None matches any session; None selects everything.
+    """
+    entries = message['updates']
+    if interest is None:
+        return entries
+    nodes = message['nodes']
+    if len(interest) < len(nodes):
+        positions = {
+            position
+            for session_id, node_id in interest
+            for update_session, position in nodes.get(node_id, ())
+            if session_id is None or session_id == update_session
+        }
+    else:
+        positions = {
+            position
+            for node_id, keys in nodes.items()
+            for update_session, position in keys
+            if (None, node_id) in interest or (update_session, node_id) in interest
+        }
+    return [entries[position] for position in sorted(positions)]
+
+
+class NotificationBatcher:
+    """
+    Buffers data changes and sends one coalesced batch frame per window.
+
+    Only the latest value per (session, node) is kept, so a tag that changes
+    several times inside one window costs a single entry in the frame.
+    Events are never conflated; every one of them goes out, in order, in the
+    window's events frame.
+    """
+    def __init__(self, group="opcua_updates", window_ms=None, channel_layer=None):
+        self.group = group
+        self.window_ms = window_ms
+        self.channel_layer = channel_layer
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._events = []
+        self._has_data = threading.Event()
+        self._thread = None
+        # Event loop of the WebSocket consumers in this process, if any
+        self.loop = None
+
+    @property
+    def window(self):
+        window_ms = self.window_ms
+        if window_ms is None:
+            window_ms = getattr(settings, 'OPCUA_NOTIFICATION_WINDOW_MS', 100)
+        return window_ms / 1000
+
+    def add(self, session_id, node_id, value, source_timestamp=None, status="Good"):
+        """Queue a data change; cheap enough to call from subscription callbacks"""
+        key = (session_id, node_id)
+        with self._lock:
+            if key in self._pending:
+                fanout_conflated.inc()
+            self._pending[key] = {
+                "session_id": session_id,
+                "node_id": node_id,
+                "value": value,
+                "source_timestamp": source_timestamp,
+                "status": status,
+            }
+            self._start()
+        self._has_data.set()
+
+    def add_event(self, event):
+        """Queue a JSON-safe event notification for the next events frame"""
+        with self._lock:
+            self._events.append(event)
+            self._start()
+        self._has_data.set()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="opcua-fanout", daemon=True)
+            self._thread.start()
+
+    def attach(self, loop):
+        """
+        Send from the consumers' event loop from now on.
+
+        The in-memory channel layer wakes its readers only from their own loop,
+        so a frame sent from the flush thread's loop would sit in the queue
+        until something else woke the consumers up.
+        """
+        self.loop = loop
+
+    def publish(self, message):
+        """Send message to the group from any thread without waiting for it"""
+        layer = self.get_channel_layer()
+        target = self.loop
+        if target is None or not target.is_running():
+            try:
+                target = asyncio.get_running_loop()
+            except RuntimeError:
+                async_to_sync(layer.group_send)(self.group, message)
+                return
+        asyncio.run_coroutine_threadsafe(layer.group_send(self.group, message), target)
+
+    def get_channel_layer(self):
+        return self.channel_layer or get_channel_layer()
+
+    def take(self):
+        """
+        Return the group message for everything buffered so far, or None.
+
+        updates holds every entry encoded once as JSON text, and nodes indexes
+        them as {node_id: [[session_id, position], ...]}, so a socket that only
+        wants a few nodes picks them without looking at the rest. created is
+        the Unix time the batch was taken, for sockets to tell how far behind
+        they are.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not self._events:
+                self._has_data.clear()
+        if not pending:
+            return None
+        nodes = {}
+        for position, (session_id, node_id) in enumerate(pending):
+            nodes.setdefault(node_id, []).append([session_id, position])
+        return {
+            "type": "send_update",
+            "updates": [json.dumps(update, default=str) for update in pending.values()],
+            "nodes": nodes,
+            "created": time.time(),
+        }
+
+    def take_events(self):
+        """Return the group message for the events received so far, or None"""
+        with self._lock:
+            events, self._events = self._events, []
+            if not self._pending:
+                self._has_data.clear()
+        if not events:
+            return None
+        return {"type": "send_events", "events": json.loads(json.dumps(events, default=str))}
+
+    def pending(self):
+        """Number of updates and events waiting for the next frame"""
+        with self._lock:
+            return len(self._pending) + len(self._events)
+
+    def flush(self):
+        """Send everything buffered so far, one frame for updates and one for events"""
+        for message in (self.take(), self.take_events()):
+            if message:
+                async_to_sync(self.get_channel_layer().group_send)(self.group, message)
+
+    def _run(self):
+        # One loop for the thread's lifetime, so a Redis layer keeps its connection
+        loop = asyncio.new_event_loop()
+        while True:
+            self._has_data.wait()
+            # Let the window fill up before sending
+            time.sleep(self.window)
+            for message in (self.take(), self.take_events()):
+                if not message:
+                    continue
+                try:
+                    started = time.perf_counter()
+                    send = self.get_channel_layer().group_send(self.group, message)
+                    target = self.loop
+                    if target is not None and target.is_running():
+                        asyncio.run_coroutine_threadsafe(send, target).result()
+                    else:
+                        loop.run_until_complete(send)
+                    if "updates" in message:
+                        fanout_seconds.observe(time.perf_counter() - started)
+                        fanout_updates.observe(len(message["updates"]))
+                except Exception as e:
+                    dropped_frames.inc(reason="flush_failed")
+                    logger.warning("⚠️ Fan-out flush failed: %s", e)
+
+
+batcher = NotificationBatcher()
+track_queue("fanout", batcher.pending)
@@ -0,0 +1,150 @@
+import asyncio
+import inspect
+import json
+import logging
+from datetime import datetime, timezone
+
+from .last_value import isoformat
+
+logger = logging.getLogger(__name__)
+
+
+def history_entry(data_value):
+    return {
+        "value": data_value.Value.Value if data_value.Value is not None else None,
+        "source_timestamp": isoformat(data_value.SourceTimestamp),
+        "server_timestamp": isoformat(data_value.ServerTimestamp),
+        "status": data_value.StatusCode.name,
+    }
+
+
+class HistoryReader:
+    """
+    Builds HistoryRead requests for a set of nodes and follows continuation points.
+
+    Takes the ``ua`` module of the OPC UA library in use like VariantConverter.
+    Raw history is read with ReadRawModifiedDetails, page_size values per node
+    and request; passing an aggregate name such as ``Average`` reads processed
+    history at interval_ms instead. Only nodes that still have a continuation
+    point are part of the next request, so pages come back as the server
+    produces them and are never collected in memory.
+    """
+    def __init__(self, ua, node_ids, nodeids, start, end=None, page_size=1000, aggregate=None, interval_ms=None):
+        self.ua = ua
+        self.start = start
+        self.end = end or datetime.now(timezone.utc)
+        self.page_size = int(page_size)
+        self.aggregate = None
+        if aggregate:
+            self.aggregate = getattr(ua.ObjectIds, f"AggregateFunction_{aggregate}", None)
+            if self.aggregate is None:
+                raise ValueError(f"Unknown aggregate {aggregate}")
+            if not interval_ms:
+                raise ValueError("interval is required for processed history")
+        self.interval_ms = float(interval_ms or 0)
+        self.nodeids = dict(zip(node_ids, nodeids))
+        # node id -> continuation point; None before the first request
+        self.pending = {nid: None for nid in node_ids}
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def details(self, count):
+        ua = self.ua
+        if self.aggregate is None:
+            details = ua.ReadRawModifiedDetails()
+            details.IsReadModified = False
+            details.NumValuesPerNode = self.page_size
+            details.ReturnBounds = False
+        else:
+            details = ua.ReadProcessedDetails()
+            details.ProcessingInterval = self.interval_ms
+            details.AggregateType = [ua.NodeId(self.aggregate)] * count
+            configuration = ua.AggregateConfiguration()
+            configuration.UseServerCapabilitiesDefaults = True
+            details.AggregateConfiguration = configuration
+        details.StartTime = self.start
+        details.EndTime = self.end
+        return details
+
+    def params(self, release=False):
+        """HistoryReadParameters for the pending nodes; release frees their continuation points"""
+        ua = self.ua
+        params = ua.HistoryReadParameters()
+        params.HistoryReadDetails = self.details(len(self.pending))
+        params.TimestampsToReturn = ua.TimestampsToReturn.Both
+        params.ReleaseContinuationPoints = release
+        params.NodesToRead = []
+        for nid, continuation_point in self.pending.items():
+            value_id = ua.HistoryReadValueId()
+            value_id.NodeId = self.nodeids[nid]
+            value_id.IndexRange = ''
+            if continuation_point:
+                value_id.ContinuationPoint = continuation_point
+            params.NodesToRead.append(value_id)
+        return params
+
+    def consume(self, results):
+        """Return one page {node_id, values} or {node_id, error} per result and advance"""
+        pages = []
+        pending = {}
+        for nid, result in zip(list(self.pending), results):
+            if not result.StatusCode.is_good():
+                pages.append({"node_id": nid, "error": result.StatusCode.name})
+                continue
+            history = result.HistoryData
+            values = history.DataValues if history is not None and history.DataValues else []
+            pages.append({"node_id": nid, "values": [history_entry(dv) for dv in values]})
+            if result.ContinuationPoint:
+                pending[nid] = result.ContinuationPoint
+        self.pending = pending
+        return pages
+
+
+async def first_page(pages):
+    """Pull the first page so request errors surface before the response starts"""
+    if inspect.isasyncgen(pages):
+        return await pages.__anext__()
+    return next(pages)
+
+
+def ndjson(page):
+    return json.dumps(page, default=str) + "\n"
+
+
+async def ndjson_stream(first, pages, executor, timeout=None):
+    """
+    Encode pages as NDJSON lines while they are read.
+
+    Every further page is read like a request: pages of sync sessions are
+    pulled one at a time on the server's executor, those of asyncio sessions
+    on the event loop, each within timeout seconds. A failure after the
+    response has started ends the stream with an error line.
+    """
+    is_async = inspect.isasyncgen(pages)
+    yield ndjson(first)
+    try:
+        while True:
+            if is_async:
+                page = await asyncio.wait_for(pages.__anext__(), timeout)
+            else:
+                page = await executor.run(next, pages, None, timeout=timeout)
+            if page is None:
+                break
+            yield ndjson(page)
+    except StopAsyncIteration:
+        pass
+    except asyncio.TimeoutError:
+        yield ndjson({"error": f"Server did not answer within {timeout:g}s"})
+    except Exception as e:
+        yield ndjson({"error": str(e)})
+    finally:
+        try:
+            if is_async:
+                await pages.aclose()
+            else:
+                await executor.run(pages.close, timeout=timeout)
+        except Exception as e:
+            # A read that timed out may still run; the server drops its continuation points in time
+            logger.warning("⚠️ Could not release history continuation points: %r", e)
@@ -0,0 +1,111 @@
+from channels.layers import get_channel_layer
+
+from .connection_pool import pool
+from .events import snapshot_alarms
+from .last_value import snapshot_updates
+from .opc_ua_client import OPCUAClient, OPCUAError
+
+# Ingest workers join this group to answer snapshot requests from web workers
+INGEST_GROUP = "opcua_ingest"
+
+
+def encode_keys(keys):
+    """Turn a socket's interest into something the channel layer can carry"""
+    return None if keys is None else [list(key) for key in keys]
+
+
+def decode_keys(keys):
+    return None if keys is None else {tuple(key) for key in keys}
+
+
+async def request_snapshot(channel_layer, reply_channel, keys=None):
+    """Ask every ingest worker to send its cached last values to reply_channel"""
+    await channel_layer.group_send(INGEST_GROUP, {
+        "type": "snapshot.request",
+        "reply_channel": reply_channel,
+        "keys": encode_keys(keys),
+    })
+
+
+class SnapshotResponder:
+    """
+    Answers snapshot requests with the last values and retained alarms of
+    this process's sessions.
+
+    Runs inside an ingest worker; web workers own no sessions and ask over the
+    shared channel layer instead.
+    """
+    def __init__(self, sessions=None, channel_layer=None):
+        self.sessions = sessions or pool.sessions
+        self.channel_layer = channel_layer
+
+    async def serve(self):
+        channel_layer = self.channel_layer or get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add(INGEST_GROUP, channel)
+        try:
+            while True:
+                message = await channel_layer.receive(channel)
+                if message.get("type") == "snapshot.request":
+                    await self.reply(channel_layer, message)
+        finally:
+            await channel_layer.group_discard(INGEST_GROUP, channel)
+
+    async def reply(self, channel_layer, message):
+        sessions = self.sessions()
+        updates = snapshot_updates(sessions, decode_keys(message.get("keys")))
+        alarms = snapshot_alarms(sessions)
+        if updates or alarms:
+            await channel_layer.send(message["reply_channel"], {
+                "type": "snapshot.reply",
+                "updates": updates,
+                "alarms": alarms,
+            })
+
+
+def select_endpoint(endpoints, security_policy="None", security_mode=None):
+    """Pick the most secure endpoint matching a policy name such as Basic256Sha256"""
+    matches = [
+        endpoint for endpoint in endpoints
+        if endpoint['security_policy_uri'].rsplit('#', 1)[-1] == security_policy
+        and (security_mode is None or int(endpoint['security_mode']) == int(security_mode))
+    ]
+    if not matches:
+        raise OPCUAError(f"Endpoints: no endpoint with security policy {security_policy}")
+    return max(matches, key=lambda endpoint: int(endpoint['security_level']))
+
+
+def start_session(config):
+    """
+    Open and feed one session described by an ingest config entry::
+
+        {"url": "opc.tcp://plc:4840", "security_policy": "None",
+         "subscriptions": [{"node_ids": [...], "interval": 500}],
+         "poll": [{"node_ids": [...], "period": 1000, "deadband_abs": 0.5}],
+         "events": [{"source": "i=2253", "where": {"min_severity": 500}, "interval": 500}]}
+    """
+    endpoints = OPCUAClient(config['url']).get_endpoints()
+    endpoint = select_endpoint(
+        endpoints, config.get('security_policy', 'None'), config.get('security_mode')
+    )
+    session_id, _ = pool.connect(endpoint, config.get('username'), config.get('password'))
+    client = pool.get(session_id)
+    client.resolve_paths(
+        [nid for group in config.get('subscriptions', []) + config.get('poll', []) for nid in group['node_ids']]
+        + [events.get('source', 'i=2253') for events in config.get('events', [])]
+    )
+    for subscription in config.get('subscriptions', []):
+        client.subscribe(subscription['node_ids'], subscription.get('interval', 500))
+    for poll in config.get('poll', []):
+        client.poller.add(
+            poll['node_ids'],
+            poll.get('period', 1000),
+            poll.get('deadband_abs', 0),
+            poll.get('deadband_pct', 0),
+            poll.get('range'),
+        )
+    for events in config.get('events', []):
+        client.subscribe_events(
+            events.get('source', 'i=2253'), events.get('select'), events.get('where'), events.get('interval', 500)
+        )
+    return session_id
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+
+def isoformat(timestamp):
+    return timestamp.isoformat() if timestamp is not None else None
+
+
+class LastValueCache:
+    """
+    Latest value, timestamps and status code per node of one session.
+
+    Filled from subscription notifications, the polling engine and direct
+    reads. New WebSocket clients get a snapshot from it and reads can be
+    answered from it when the caller accepts a maximum age.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def update(self, node_id, value, source_timestamp=None, server_timestamp=None, status="Good"):
+        """Store a value and return its entry"""
+        entry = {
+            "node_id": node_id,
+            "value": value,
+            "source_timestamp": isoformat(source_timestamp),
+            "server_timestamp": isoformat(server_timestamp),
+            "status": status,
+            "received": time.monotonic(),
+        }
+        with self._lock:
+            self._entries[node_id] = entry
+        return entry
+
+    def update_many(self, values):
+        """Store plain {node_id: value} results such as those of read_value"""
+        received = time.monotonic()
+        with self._lock:
+            for node_id, value in values.items():
+                self._entries[node_id] = {
+                    "node_id": node_id,
+                    "value": value,
+                    "source_timestamp": None,
+                    "server_timestamp": None,
+                    "status": "Good",
+                    "received": received,
+                }
+
+    def get(self, node_ids, max_age_ms=None):
+        """Return ({node_id: entry} no older than max_age_ms, [missing or stale node ids])"""
+        oldest = time.monotonic() - max_age_ms / 1000 if max_age_ms is not None else None
+        found = {}
+        missing = []
+        with self._lock:
+            for nid in node_ids:
+                entry = self._entries.get(nid)
+                if entry is None or (oldest is not None and entry["received"] < oldest):
+                    missing.append(nid)
+                else:
+                    found[nid] = entry
+        return found, missing
+
+    def snapshot(self, node_ids=None):
+        """Return entries for node_ids, or all of them"""
+        with self._lock:
+            if node_ids is None:
+                return list(self._entries.values())
+            return [self._entries[nid] for nid in node_ids if nid in self._entries]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def snapshot_updates(sessions, keys=None):
+    """
+    Return JSON-safe snapshot entries for (session_id, client) pairs.
+
+    keys is a set of (session_id, node_id) pairs like a socket's interest;
+    session_id None matches the node on any session. None means every node.
+    """
+    updates = []
+    for session_id, client in sessions:
+        for entry in client.last_values.snapshot():
+            if keys is None or (None, entry['node_id']) in keys or (session_id, entry['node_id']) in keys:
+                update = {key: value for key, value in entry.items() if key != 'received'}
+                update['session_id'] = session_id
+                updates.append(update)
+    return json.loads(json.dumps(updates, default=str))
@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from opc_ua.benchmark import Benchmark, SimulatedServer, regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the OPC UA client, REST views and WebSocket consumer against a local "
+        "simulated server and print the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variables', type=int, default=2000, help="Tags on the simulated server")
+        parser.add_argument('--changing', type=int, default=100, help="Tags the server keeps changing")
+        parser.add_argument('--rate', type=float, default=10, help="Changes per second of each changing tag")
+        parser.add_argument('--port', type=int, default=48500)
+        parser.add_argument(
+            '--batch-sizes', default="1,10,100,1000", help="Comma separated read/write batch sizes",
+        )
+        parser.add_argument('--seconds', type=float, default=2.0, help="Duration of every measurement")
+        parser.add_argument('--concurrency', type=int, default=16, help="Concurrent REST clients")
+        parser.add_argument('--interval', type=int, default=50, help="Publishing interval (ms) of the subscription")
+        parser.add_argument('--output', help="Write the JSON result to this file instead of stdout")
+        parser.add_argument('--baseline', help="JSON result of an earlier run to compare against")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2, help="Allowed slowdown against the baseline, as a fraction",
+        )
+
+    def handle(self, *args, **options):
+        batch_sizes = [int(size) for size in options['batch_sizes'].split(',') if size]
+        server = SimulatedServer(options['port'], options['variables'], options['changing'], options['rate'])
+        log = self.stderr.write
+        with server:
+            benchmark = Benchmark(
+                server, batch_sizes, options['seconds'], options['concurrency'], options['interval'], log=log,
+            )
+            result = benchmark.run()
+
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                worse = regressions(result, json.load(baseline_file), options['tolerance'])
+            for name, (before, after) in worse.items():
+                log(f"⚠️ {name}: {before} -> {after}")
+            if worse:
+                raise CommandError(f"{len(worse)} metric(s) regressed by more than {options['tolerance']:.0%}")
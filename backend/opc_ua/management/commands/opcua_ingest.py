@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from opc_ua.connection_pool import pool
+from opc_ua.ingest import SnapshotResponder, start_session
+
+
+class Command(BaseCommand):
+    help = (
+        "Run an OPC UA ingest worker: own the configured sessions and publish their "
+        "updates into the shared channel layer for the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--config',
+            help="JSON file with a list of sessions; defaults to settings.OPCUA_INGEST",
+        )
+
+    def handle(self, *args, **options):
+        if options['config']:
+            with open(options['config']) as config_file:
+                sessions = json.load(config_file)
+        else:
+            sessions = getattr(settings, 'OPCUA_INGEST', [])
+        if not sessions:
+            raise CommandError("No sessions configured; pass --config or set OPCUA_INGEST")
+
+        for config in sessions:
+            session_id = start_session(config)
+            self.stdout.write(f"📡 Ingesting {config['url']} as session {session_id}")
+
+        try:
+            asyncio.run(SnapshotResponder().serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.disconnect_all()
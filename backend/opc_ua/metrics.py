@@ -0,0 +1,267 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZES = (1, 10, 100, 1000, 10000)
+# Reconnects wait out backoff delays of up to OPCUA_RECONNECT_MAX_DELAY_MS
+OUTAGE_SECONDS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """One metric family; samples are kept per tuple of label values."""
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in pairs) + "}"
+
+    def samples(self):
+        """Yield (suffix, label key, extra labels, value) for render()"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", key, (), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{self._label_text(key, extra)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """A gauge set directly or read from a function at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """function() returns a number, or [(labels dict, number)] for labelled gauges"""
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            yield from super().samples()
+            return
+        try:
+            result = self._function()
+        except Exception:
+            return
+        if isinstance(result, (int, float)):
+            yield "", (), (), result
+            return
+        for labels, value in result:
+            yield "", self._key(labels), (), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def count(self, **labels):
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", key, (("le", _number(bound)),), cumulative
+            yield "_sum", key, (), counts[-1]
+            yield "_count", key, (), cumulative
+
+
+class Registry:
+    """The metrics exposed at /metrics."""
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.add(Histogram(
+    "opcua_request_duration_seconds", "Round trip of OPC UA service calls", ["operation"]
+))
+request_nodes = registry.add(Histogram(
+    "opcua_request_nodes", "Nodes per OPC UA service call", ["operation"], buckets=SIZES
+))
+request_errors = registry.add(Counter(
+    "opcua_request_errors_total", "OPC UA service calls that raised", ["operation"]
+))
+notifications = registry.add(Counter(
+    "opcua_notifications_total", "Data change notifications received from servers", ["server"]
+))
+events = registry.add(Counter(
+    "opcua_events_total", "Event notifications received from servers", ["server"]
+))
+fanout_seconds = registry.add(Histogram(
+    "opcua_fanout_flush_duration_seconds", "Time to hand one batch frame to the channel layer"
+))
+fanout_updates = registry.add(Histogram(
+    "opcua_fanout_batch_updates", "Updates per batch frame", buckets=SIZES
+))
+fanout_conflated = registry.add(Counter(
+    "opcua_fanout_conflated_total", "Updates replaced by a newer value of the same node before sending"
+))
+queue_depth = registry.add(Gauge(
+    "opcua_queue_depth", "Work waiting in a queue", ["queue"]
+))
+dropped_frames = registry.add(Counter(
+    "opcua_dropped_frames_total", "WebSocket frames that were not delivered", ["reason"]
+))
+rejected_requests = registry.add(Counter(
+    "opcua_rejected_requests_total", "REST requests refused by a server's executor", ["server", "reason"]
+))
+reconnects = registry.add(Counter(
+    "opcua_reconnects_total", "Sessions reconnected after a lost connection", ["server"]
+))
+reconnect_failures = registry.add(Counter(
+    "opcua_reconnect_failures_total", "Reconnect attempts that failed", ["server"]
+))
+reconnect_seconds = registry.add(Histogram(
+    "opcua_reconnect_duration_seconds", "Time for the reconnect that succeeded to open the session and replay it",
+    ["server"], buckets=OUTAGE_SECONDS
+))
+reconnect_gap_seconds = registry.add(Histogram(
+    "opcua_reconnect_gap_seconds", "Time from the last good keepalive to a recovered session", ["server"],
+    buckets=OUTAGE_SECONDS
+))
+write_superseded = registry.add(Counter(
+    "opcua_write_superseded_total", "Queued writes replaced by a newer value of the same node before they were sent"
+))
+websockets = registry.add(Gauge(
+    "opcua_websockets", "Open WebSocket connections in this process"
+))
+websocket_lag = registry.add(Gauge(
+    "opcua_websocket_lag_seconds", "Age of the oldest unacknowledged frame of the slowest WebSocket"
+))
+websocket_conflated = registry.add(Counter(
+    "opcua_websocket_conflated_total", "Updates held back for a slow WebSocket and replaced by a newer value"
+))
+sessions = registry.add(Gauge(
+    "opcua_sessions", "Open OPC UA sessions in this process"
+))
+
+_queues = {}
+
+
+def track_queue(name, function):
+    """Report function() as the depth of queue name on every scrape"""
+    _queues[name] = function
+
+
+queue_depth.set_function(lambda: [({"queue": name}, function()) for name, function in list(_queues.items())])
+
+
+def _node_count(args):
+    node_ids = args[1] if len(args) > 1 else None
+    return len(node_ids) if isinstance(node_ids, (list, tuple, set, dict)) else 1
+
+
+def timed(operation, nodes=False):
+    """
+    Decorator recording a client method's duration under operation. With
+    nodes, the length of its first argument is recorded as the batch size.
+    """
+    def decorate(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                except Exception:
+                    request_errors.inc(operation=operation)
+                    raise
+                finally:
+                    request_seconds.observe(time.perf_counter() - started, operation=operation)
+                    if nodes:
+                        request_nodes.observe(_node_count(args), operation=operation)
+        else:
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                except Exception:
+                    request_errors.inc(operation=operation)
+                    raise
+                finally:
+                    request_seconds.observe(time.perf_counter() - started, operation=operation)
+                    if nodes:
+                        request_nodes.observe(_node_count(args), operation=operation)
+        return wrapper
+    return decorate
@@ -1,228 +1,511 @@
+from django.conf import settings
 from opcua import Client, ua
-import os
-from channels.layers import get_channel_layer
-import json
-from asgiref.sync import async_to_sync
-
-class SubHandler:
-    """Handles subscription updates from OPC UA server."""
-    def datachange_notification(self, node, val, data):
-        print(f"📡 Data Change: Node {node}, New Value: {val}")
-        
-        # Send data to WebSocket group
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "opcua_updates",  # WebSocket group name
-            {
-                "type": "send_update",
-                "data": json.dumps({
-                    "node_id": str(node),
-                    "value": val
-                })
-            }
-        )
-
-class OPCUAError(Exception):
-    """Custom exception for OPC UA connection failures."""
-    pass
+from opcua.common import ua_utils
+from opcua.ua.ua_binary import struct_from_binary
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from .client_base import ClientBase, EventHandler, ModelChangeHandler, OPCUAError
+from .type_cache import TypeInfo
+from .variants import VariantConverter
+from .browse import BrowseRequest
+from .browse_paths import PathCache, browse_path
+from .reconnect import transfer_request
+from .operation_limits import OperationLimits, read_requests, value_ids, write_requests
+from .metrics import timed
 
-class OPCUAClient:
-    def __init__(self, url):
-        self.client = Client(url)
-        self.cert_path = os.path.join(os.path.dirname(__file__), 'certificates')
-        self.registered_nodes = {}
-        self.subscriptions = {} 
+logger = logging.getLogger(__name__)
 
-    def configure(self, endpoint, username, password):
-        self.endpoint = endpoint
-        self.username = username
-        self.password = password
+class OPCUAClient(ClientBase):
+    client_class = Client
+    ua = ua
+    converter = VariantConverter(ua)
+    lock_class = threading.Lock
 
-    
     def get_endpoints(self):
         """Get available endpoints from the OPC UA server."""
         try:
             endpoints = self.client.connect_and_get_server_endpoints()
-            endpoints_info = []
-            print(f"🔗 Found {len(endpoints)} available endpoints.")
-
-            for endpoint in endpoints:
-                endpoint_data = {
-                    "endpoint_url": str(endpoint.EndpointUrl),
-                    "security_mode": str(endpoint.SecurityMode),
-                    "security_policy_uri": str(endpoint.SecurityPolicyUri),
-                    "security_level": int(endpoint.SecurityLevel)
-                }
-                endpoints_info.append(endpoint_data)
-
-            return endpoints_info
+            logger.info("🔗 Found %d available endpoints.", len(endpoints))
+            return [self._endpoint_info(endpoint) for endpoint in endpoints]
         except Exception as e:
             raise OPCUAError(f"Endpoints: {str(e)}")
 
-
-
+    @timed("connect")
     def connect(self):
         """Connect to OPC UA server"""
-        if int(self.endpoint['security_level']) != 0:
-            print("🔒 Connecting with security...")
-            # Extract security policy and mode
-            security_policy = self.endpoint['security_policy_uri'].split("#")[1]
-            security_mode = int(self.endpoint['security_mode'])
-
-            # Get absolute paths for certificates
-            cert_file = os.path.join(self.cert_path, 'opcua_client_cert.pem')
-            private_key_file = os.path.join(self.cert_path, 'opcua_client_key.pem')
-            
-            mode = "Sign" if security_mode == 2 else "SignAndEncrypt"
-
-            security_string = f"{security_policy},{mode},{cert_file},{private_key_file}"
-            
-            self.client.set_security_string(security_string)
-            self.client.application_uri = "urn:example.org:ozkanerozcan.com"
-
-            self.client.set_user(self.username)
-            self.client.set_password(self.password)
-    
         try:
+            security_string = self._security_string()
+            if security_string:
+                logger.info("🔒 Connecting with security...")
+                self.client.set_security_string(security_string)
+                self._set_identity()
             self.client.connect()
-            print("✅ OPC UA Connected successfully!")
         except Exception as e:
             raise OPCUAError(f"Connect: {str(e)}")
 
+        self._session_opened()
+        self._watch_model_changes()
+
+    def _watch_model_changes(self):
+        """Subscribe to GeneralModelChangeEvents so cached metadata follows the address space"""
+        try:
+            subscription = self.client.create_subscription(1000, ModelChangeHandler(self))
+            subscription.subscribe_events(self.client.get_server_node(), ua.ObjectIds.GeneralModelChangeEventType)
+            self._model_change_subscription = subscription
+        except Exception as e:
+            logger.warning("⚠️ Model change events not available: %s", e)
+
+    def keepalive(self):
+        """Read the server state; raises once the session or connection is gone"""
+        self.client.get_node(ua.ObjectIds.Server_ServerStatus_State).get_value()
+
+    def _abandon_session(self):
+        """Stop the background work of the lost session and drop its socket, leaving the session open"""
+        old = self.client
+        if old.keepalive is not None:
+            old.keepalive.stop()
+        try:
+            old.disconnect_socket()
+        except Exception:
+            pass
+
+    def reconnect(self):
+        """
+        Open a new session and bring back registered nodes and subscriptions.
+
+        The old session is not closed: closing it would delete the subscriptions
+        that TransferSubscriptions may still move over. Returns the number of
+        (transferred, recreated) subscriptions.
+        """
+        self._abandon_session()
+        self.client = Client(self.url)
+        self.connect()
+
+        try:
+            # Browse paths were forgotten with the old session; translate them again in one call
+            self.resolve_paths(self._replay_node_ids())
+            self._replay_registrations()
+            counts = self._replay_subscriptions()
+            self._replay_event_subscriptions()
+        except Exception:
+            # The next attempt would abandon this session open, one more on the server per retry
+            self._close_session()
+            raise
+        return counts
+
+    def _close_session(self):
+        """Close the new session after a failed replay; the next attempt opens another one"""
+        try:
+            self.client.disconnect()
+        except Exception as e:
+            logger.warning("⚠️ Could not close the session to %s: %s", self.url, e)
+
+    def _replay_registrations(self):
+        """Register all previously registered nodes again with one RegisterNodes call"""
+        node_ids = list(self.registered_nodes)
+        if not node_ids:
+            return
+        try:
+            self._registered(node_ids, self.client.register_nodes(self._registration_nodes(node_ids)))
+        except Exception as e:
+            raise OPCUAError(f"Register: {str(e)}")
+
+    def _transfer_subscriptions(self, subscriptions):
+        """Move subscriptions of the lost session to this one; returns the ids the server kept"""
+        try:
+            data = self.client.uaclient._uasocket.send_request(
+                transfer_request(ua, [sub.subscription_id for sub in subscriptions])
+            )
+            response = struct_from_binary(ua.TransferSubscriptionsResponse, data)
+            response.ResponseHeader.ServiceResult.check()
+        except Exception as e:
+            logger.info("ℹ️ Subscriptions not transferred, recreating them: %s", e)
+            return set()
+
+        uaclient = self.client.uaclient
+        kept = set()
+        for sub, result in zip(subscriptions, response.Results):
+            if result.StatusCode.is_good():
+                # python-opcua has no transfer support; point the Subscription at the new session by hand
+                sub.server = uaclient
+                uaclient._publishcallbacks[sub.subscription_id] = sub.publish_callback
+                kept.add(sub.subscription_id)
+        if kept:
+            uaclient.publish()
+        return kept
+
+    def _replay_subscriptions(self):
+        """Transfer subscriptions where possible, recreate the others with one CreateMonitoredItems each"""
+        with self._subscription_lock:
+            if not self.subscriptions:
+                return 0, 0
+            kept = self._transfer_subscriptions([sub_data['subscription'] for sub_data in self.subscriptions.values()])
+            recreated = 0
+            for sub_id, sub_data in self.subscriptions.items():
+                if sub_data['subscription'].subscription_id in kept:
+                    continue
+                # The key stays the same so callers keep using the id they were given
+                sub_data['subscription'] = self.client.create_subscription(sub_data['interval'], sub_data['handler'])
+                node_ids = list(sub_data['handles'])
+                nodes = self.get_nodes(node_ids)
+                handles = sub_data['subscription'].subscribe_data_change(nodes)
+                sub_data['handles'] = {}
+                for nid, status in self._monitored(sub_data, node_ids, nodes, handles).items():
+                    logger.warning("⚠️ Could not monitor %s again on subscription %s: %s", nid, sub_id, status)
+                recreated += 1
+            return len(kept), recreated
+
     def disconnect(self):
         """Disconnect from OPC UA server"""
+        self._session_closing()
         try:
             self.client.disconnect()
-            self._connected = False
-            print("🔌 OPC UA Disconnected.")
+            logger.info("🔌 OPC UA Disconnected.")
         except Exception as e:
             raise OPCUAError(f"Disconnect: {str(e)}")
         finally:
             self.client = None
 
-    def read_value(self, node_id):
-        """Read single or multiple node values"""
+    def operation_limits(self):
+        """Return the server's OperationLimits, read once per session"""
+        if self.limits is None:
+            try:
+                self.limits = OperationLimits.from_results(
+                    self.client.uaclient.read(self._read_params(OperationLimits.node_ids(ua)))
+                )
+            except Exception as e:
+                logger.warning("⚠️ OperationLimits not available, using OPCUA_MAX_NODES_PER_REQUEST: %s", e)
+                self.limits = OperationLimits()
+        return self.limits
+
+    def _pipeline(self, requests, response_type):
+        """Send requests with up to OPCUA_PIPELINE_DEPTH awaiting an answer; return the responses in order"""
+        depth = getattr(settings, 'OPCUA_PIPELINE_DEPTH', 4)
+        uasocket = self.client.uaclient._uasocket
+        pending = deque()
+        responses = []
+
+        def answer(answered):
+            data = answered.result(uasocket.timeout).result()
+            uasocket.check_answer(data, f" in response to {response_type.__name__}")
+            response = struct_from_binary(response_type, data)
+            response.ResponseHeader.ServiceResult.check()
+            return response
+
+        for request in requests:
+            if len(pending) >= depth:
+                responses.append(answer(pending.popleft()))
+            answered = Future()
+            # With a callback send_request returns at once; the callback gets the response future
+            uasocket.send_request(request, answered.set_result)
+            pending.append(answered)
+        while pending:
+            responses.append(answer(pending.popleft()))
+        return responses
+
+    def _read_chunks(self, read_ids):
+        """DataValues for ReadValueIds, read in chunks of the server's MaxNodesPerRead"""
+        requests = read_requests(ua, read_ids, self.operation_limits().read_size)
+        return [result for response in self._pipeline(requests, ua.ReadResponse) for result in response.Results]
+
+    def read_status(self, node_id):
+        """Return {node_id: (value, status name)}; nodes the server refuses get None and their StatusCode"""
         try:
-            nodes = [self.client.get_node(nid) for nid in node_id]
-            values = self.client.get_values(nodes)
-            return dict(zip(node_id, values))
+            return self.reads.read(node_id, self._read_values)
         except Exception as e:
             raise OPCUAError(f"Read: {str(e)}")
 
-    def write_value(self, node_id, value):
-        """Write single or multiple values to nodes with automatic data type detection"""
+    def read_value(self, node_id):
+        """Read single or multiple node values, sharing the Read with concurrent callers"""
+        return {nid: value for nid, (value, _) in self.read_status(node_id).items()}
+
+    @timed("read", nodes=True)
+    def _read_values(self, node_ids):
+        nodes = self.get_nodes(node_ids)
+        return self._read_results(node_ids, self._read_chunks(value_ids(ua, [node.nodeid for node in nodes])))
+
+    def history_read(self, node_ids, start, end=None, page_size=1000, aggregate=None, interval_ms=None):
+        """Yield history pages of node_ids, following continuation points until every node is done"""
+        reader = self._history_reader(node_ids, start, end, page_size, aggregate, interval_ms)
+        try:
+            while not reader.done:
+                try:
+                    results = self.client.uaclient.history_read(reader.params())
+                except Exception as e:
+                    raise OPCUAError(f"HistoryRead: {str(e)}")
+                yield from reader.consume(results)
+        finally:
+            if not reader.done:
+                # Stopped early, e.g. the HTTP client went away; free the server's continuation points
+                try:
+                    self.client.uaclient.history_read(reader.params(release=True))
+                except Exception:
+                    pass
+
+    def _variant_type(self, data_type):
+        """Map a DataType NodeId to the VariantType used to encode its values"""
+        variant_type = self._known_variant_type(data_type)
+        if variant_type is None:
+            variant_type = ua_utils.data_type_to_variant_type(self.client.get_node(data_type))
+            self.type_cache.set_data_type(data_type.to_string(), variant_type)
+        return variant_type
+
+    def get_type_info(self, node_ids):
+        """
+        Return ({node_id: TypeInfo}, {node_id: status name} of nodes whose type can't be read),
+        reading metadata of uncached nodes in one batched Read
+        """
+        found, missing = self.type_cache.get_many(node_ids)
+        if not missing:
+            return found, {}
+
+        attributes, failed = self._type_attributes(missing, self._read_chunks(self._type_info_reads(missing)))
+        entries = {
+            nid: TypeInfo(self._variant_type(data_type), value_rank, array_dimensions)
+            for nid, data_type, value_rank, array_dimensions in attributes
+        }
+        self.type_cache.update(entries)
+        found.update(entries)
+        return found, failed
+
+    def translate_paths(self, paths, namespace=None):
+        """Return {path: node id string}, translating uncached browse paths in one batched call"""
         try:
-            # Get node objects
-            nodes = [self.client.get_node(nodeid) for nodeid in node_id]
+            if self.path_cache is None:
+                self.path_cache = PathCache(self.url, self.client.get_namespace_array())
+            keys, found, missing = self._path_lookup(paths, namespace)
+            if missing:
+                results = self.client.uaclient.translate_browsepaths_to_nodeids(
+                    [browse_path(ua, key) for key in missing]
+                )
+                found.update(self._translated(missing, results))
+            return self._remember_paths(keys, found)
+        except Exception as e:
+            raise OPCUAError(f"Translate: {str(e)}")
 
-            # Write multiple values with correct data types
-            variant_values = []
+    def resolve_paths(self, node_ids):
+        """Translate the browse paths among node_ids that this session has not seen yet"""
+        paths = self._unresolved_paths(node_ids)
+        if paths:
+            self.translate_paths(paths)
+
+    def browse(self, node_ids):
+        """Return {node_id: [child]} with BrowseName, NodeClass and DataType of each child"""
+        try:
+            keys = self._browse_keys(node_ids)
+            found, missing = self.browse_cache.get_many(keys)
+            if missing:
+                request = BrowseRequest(ua, missing)
+                try:
+                    request.consume(self.client.uaclient.browse(request.browse_params()))
+                    while request.continuation:
+                        request.consume(self.client.uaclient.browse_next(request.next_params()))
+                except ValueError:
+                    self._release_browse(request)
+                    raise
+                data_types = self._read_chunks(request.read_ids()) if request.variables() else []
+                entries = request.children(data_types)
+                self.browse_cache.update(entries)
+                found.update(entries)
+            return {nid: found[key] for nid, key in zip(node_ids, keys)}
+        except Exception as e:
+            raise OPCUAError(f"Browse: {str(e)}")
+
+    def _release_browse(self, request):
+        """Free the continuation points the server still holds for a failed browse"""
+        if not request.continuation:
+            return
+        try:
+            self.client.uaclient.browse_next(request.next_params(release=True))
+        except Exception as e:
+            logger.warning("⚠️ Could not release browse continuation points: %s", e)
+
+    def write_value(self, node_id, value):
+        """
+        Write single or multiple values to nodes with automatic data type detection.
+
+        Returns {node_id: status name}; a node the server refuses does not fail the others.
+        """
+        try:
+            node_ids, data_values, failed = self.prepare_write(node_id, value)
+            statuses = self._write_values(node_ids, data_values) if node_ids else {}
+            return self._merge_statuses(node_id, statuses, failed)
+        except Exception as e:
+            raise OPCUAError(f"Write: {str(e)}")
 
-            for idx, node in enumerate(nodes):
-                variant_type = node.get_data_type_as_variant_type()
-                if variant_type == ua.VariantType.Double:
-                    variant_values.append(ua.DataValue(ua.Variant(float(value[idx]), variant_type)))
-                elif variant_type == ua.VariantType.Int16:
-                    variant_values.append(ua.DataValue(ua.Variant(int(value[idx]), variant_type)))
-                elif variant_type == ua.VariantType.Boolean:
-                    variant_values.append(ua.DataValue(ua.Variant(value[idx] == "True", variant_type)))
-                else:
-                    print(f"Unsupported data type for Node {node.nodeid}")
+    def queue_write(self, node_id, value, flush=False):
+        """Convert values and queue them on the session's WriteQueue; returns a WriteTicket"""
+        try:
+            return self.writes.submit(*self.prepare_write(node_id, value), flush=flush)
+        except Exception as e:
+            raise OPCUAError(f"Write: {str(e)}")
 
-            # Write values
-            self.client.set_values(nodes, variant_values)
-            print("✅ Values written successfully!")
+    def write_queued(self, node_id, value, flush=False):
+        """
+        write_value() through the WriteQueue, merged with concurrent writes of the session;
+        flush sends the batch without waiting out the coalescing window
+        """
+        ticket = self.queue_write(node_id, value, flush)
+        try:
+            return ticket.result()
         except Exception as e:
             raise OPCUAError(f"Write: {str(e)}")
 
+    def prepare_write(self, node_id, value):
+        """
+        Return (node ids, DataValues) of value converted to the data types of the nodes, and
+        {node_id: status name} of the nodes left out because their data type can't be read
+        """
+        type_info, failed = self.get_type_info(node_id)
+        return (*self._data_values(node_id, value, type_info, failed), failed)
+
+    @timed("write", nodes=True)
+    def _write_values(self, node_ids, data_values):
+        nodes = self.get_nodes(node_ids)
+        # Write values in chunks of the server's MaxNodesPerWrite
+        requests = write_requests(
+            ua, [node.nodeid for node in nodes], data_values, self.operation_limits().write_size
+        )
+        results = [result for response in self._pipeline(requests, ua.WriteResponse) for result in response.Results]
+        logger.debug("✅ Values written successfully!")
+        return self._write_results(node_ids, results)
+
+    @timed("register", nodes=True)
     def register_nodes(self, node_ids):
         """Register nodes with the server for optimized access"""
         try:
-            print("Registering nodes...")
-            nodes_to_register = [self.client.get_node(nid) for nid in node_ids]
-            
-            # Register the nodes
-            registered_nodes = self.client.register_nodes(nodes_to_register)
-            print('Registered Nodes Response: ', registered_nodes)
-            print("Nodes registered successfully!")
-            
-            # Prepare a dictionary to store the registered nodes
-            for idx, reg_node in enumerate(registered_nodes):
-                self.registered_nodes[node_ids[idx]] = reg_node
-            
-            # Instead of printing `self.registered_nodes` directly, serialize it
-            # Serialize the dictionary with meaningful data (e.g., NodeId, BrowseName):
-            serialized_nodes = {
-                node_id: {
-                    "node": str(reg_node.nodeid),  # Convert NodeId to string representation
-                }
-                for node_id, reg_node in self.registered_nodes.items()
-            }
-            print("Serialized Registered Nodes: ", serialized_nodes)  # JSON-serializable data
-            
-            # Optionally return the serialized data
-            return serialized_nodes
+            registered_nodes = self.client.register_nodes(self._registration_nodes(node_ids))
+            logger.debug("Registered Nodes Response: %s", registered_nodes)
+            return self._registered(node_ids, registered_nodes)
         except Exception as e:
             raise OPCUAError(f"Register: {str(e)}")
 
     def unregister_nodes(self, node_ids):
         """Unregister previously registered nodes"""
         try:
-            print("Unregistering nodes...")
-            registered_nodes = []
-            for nid in node_ids:
-                if nid in self.registered_nodes:
-                    registered_nodes.append(self.registered_nodes[nid])
-                    del self.registered_nodes[nid]
-            
+            registered_nodes = self._unregistered(node_ids)
             if registered_nodes:
                 self.client.unregister_nodes(registered_nodes)
-                print("Nodes unregistered successfully!")
-            
-            print('REgistered Nodes After Delete', self.registered_nodes)
+                logger.debug("Nodes unregistered successfully!")
         except Exception as e:
             raise OPCUAError(f"Unregister: {str(e)}")
 
-    def subscribe(self, node_id, interval=500):
-        """Subscribe to nodes with specified interval (ms)"""
+    def _subscription_for_interval(self, interval):
+        """Return the id of the shared subscription for a publishing interval, creating it if needed"""
+        sub_id = self._interval_subscription(interval)
+        if sub_id is None:
+            logger.info("Creating subscription with interval %sms...", interval)
+            handler = self._sub_handler()
+            sub_id = self._add_subscription(self.client.create_subscription(interval, handler), handler, interval)
+        return sub_id
+
+    @timed("subscribe", nodes=True)
+    def subscribe(self, node_ids, interval=500):
+        """Subscribe to nodes with specified interval (ms), sharing one subscription per interval"""
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
         try:
-            print(f"Creating subscription with interval {interval}ms...")
-            subscription = self.client.create_subscription(interval, SubHandler())
-            
-            node = self.client.get_node(node_id)
+            with self._subscription_lock:
+                sub_id = self._subscription_for_interval(interval)
+                sub_data = self.subscriptions[sub_id]
 
-            handle = subscription.subscribe_data_change(node)
+                new_ids = self._unmonitored(sub_data, node_ids)
+                if not new_ids:
+                    return sub_id
 
-            print(f"Subscribed to node: {node}")
+                # One CreateMonitoredItems call for all new nodes
+                nodes = self.get_nodes(new_ids)
+                handles = sub_data['subscription'].subscribe_data_change(nodes)
+                failed = self._monitored(sub_data, new_ids, nodes, handles)
+                logger.info("Subscribed to %d node(s) on subscription %s", len(new_ids) - len(failed), sub_id)
 
-            # Store subscription and handles for later
-            sub_id = str(subscription.subscription_id)
-            self.subscriptions[sub_id] = {
-                'subscription': subscription,
-                'handle': handle,
-                'node': node_id,
-                'interval': interval  # Store the interval value
-            }
-            
+                if not sub_data['handles']:
+                    # Nothing could be monitored, don't leave an empty subscription behind
+                    sub_data['subscription'].delete()
+                    del self.subscriptions[sub_id]
+            if failed:
+                raise ValueError(f"Could not monitor {failed}")
             return sub_id
 
         except Exception as e:
             raise OPCUAError(f"Subscribe: {str(e)}")
 
-    def unsubscribe(self, subscription_id):
-        """Unsubscribe from nodes"""
+    def unsubscribe(self, subscription_id=None, node_ids=None):
+        """Remove monitored items for node_ids, or delete a whole subscription"""
         try:
-            if subscription_id in self.subscriptions:
-                print(f"Unsubscribing from subscription {subscription_id}...")
-                sub_data = self.subscriptions[subscription_id]
-                
-                # Delete subscription
-                sub_data['subscription'].delete()
-                del self.subscriptions[subscription_id]
-                print("Unsubscribed successfully!")
-            else:
-                raise ValueError(f"Subscription ID {subscription_id} not found")
-
+            with self._subscription_lock:
+                for sub_data, handles, delete in self._unsubscribe_plan(subscription_id, node_ids):
+                    # Deleting the subscription removes its monitored items too
+                    if delete:
+                        sub_data['subscription'].delete()
+                    elif handles:
+                        # One DeleteMonitoredItems call for all nodes of the subscription
+                        sub_data['subscription'].unsubscribe(handles)
+                logger.debug("Unsubscribed successfully!")
         except Exception as e:
             raise OPCUAError(f"Unsubscribe: {str(e)}")
 
+    def _create_event_subscription(self, dispatcher, interval):
+        """Create a subscription monitoring the events of the dispatcher's source through its EventFilter"""
+        spec = dispatcher.spec
+        subscription = self.client.create_subscription(interval, EventHandler(dispatcher, self.url))
+        try:
+            handle = subscription.subscribe_events(self._event_source(spec), evfilter=spec.event_filter(ua))
+        except Exception:
+            subscription.delete()
+            raise
+        return self._add_event_subscription(subscription, dispatcher, interval, handle)
+
+    @timed("subscribe_events")
+    def subscribe_events(self, source="i=2253", select=None, where=None, interval=500):
+        """
+        Monitor the events of source (the Server object by default) with an
+        EventFilter the server applies, then ask for its retained conditions
+        """
+        try:
+            with self._subscription_lock:
+                sub_id = self._create_event_subscription(self._event_dispatcher(source, select, where), interval)
+            logger.info("Subscribed to events of %s on subscription %s", source, sub_id)
+        except Exception as e:
+            raise OPCUAError(f"Subscribe events: {str(e)}")
+        self.condition_refresh(sub_id)
+        return sub_id
+
+    def unsubscribe_events(self, subscription_id=None):
+        """Delete one event subscription, or all of them"""
+        try:
+            with self._subscription_lock:
+                for subscription in self._pop_event_subscriptions(subscription_id):
+                    subscription.delete()
+        except Exception as e:
+            raise OPCUAError(f"Unsubscribe events: {str(e)}")
+
+    def condition_refresh(self, subscription_id=None):
+        """
+        Ask the server to send the retained conditions of event subscriptions
+        again; they reach WebSockets as one alarms frame each. Returns
+        {subscription id: status name}.
+        """
+        method = self.client.get_node(ua.ObjectIds.ConditionType)
+        results = {}
+        for sub_id, sub_data in self._refresh_targets(subscription_id):
+            try:
+                method.call_method(*self._refresh_arguments(sub_data))
+                results[sub_id] = "Good"
+            except Exception as e:
+                results[sub_id] = self._refresh_failed(sub_id, sub_data, e)
+        return results
+
+    def _replay_event_subscriptions(self):
+        """Recreate event subscriptions on the new session and refresh their conditions"""
+        with self._subscription_lock:
+            for sub_id, sub_data in list(self.event_subscriptions.items()):
+                try:
+                    # The dispatcher keeps its id and alarm cache; ConditionRefresh then prunes it
+                    self._create_event_subscription(sub_data['dispatcher'], sub_data['interval'])
+                except Exception as e:
+                    logger.warning("⚠️ Could not subscribe to events again on %s: %s", sub_id, e)
+                    del self.event_subscriptions[sub_id]
+        self.condition_refresh()
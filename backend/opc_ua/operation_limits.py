@@ -0,0 +1,93 @@
+from django.conf import settings
+
+
+def chunked(items, size):
+    """Split items into lists of at most size items; size 0 means one list"""
+    if not size or len(items) <= size:
+        return [items]
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class OperationLimits:
+    """
+    Nodes per Read and per Write request for one session.
+
+    Taken from the server's OperationLimits (MaxNodesPerRead, MaxNodesPerWrite),
+    where 0 means the server sets no limit, and capped by
+    OPCUA_MAX_NODES_PER_REQUEST so a huge batch never turns into one message
+    that holds up every other request while it runs.
+    """
+    def __init__(self, max_read=0, max_write=0):
+        self.max_read = int(max_read or 0)
+        self.max_write = int(max_write or 0)
+
+    @staticmethod
+    def node_ids(ua):
+        return [
+            ua.NodeId(ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerRead),
+            ua.NodeId(ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerWrite),
+        ]
+
+    @classmethod
+    def from_results(cls, results):
+        """Limits from the DataValues read from node_ids(); unreadable limits count as none"""
+        return cls(*(result.Value.Value if result.StatusCode.is_good() else 0 for result in results))
+
+    @staticmethod
+    def _size(server_limit):
+        cap = getattr(settings, 'OPCUA_MAX_NODES_PER_REQUEST', 1000)
+        return min(limit for limit in (server_limit, cap) if limit) if server_limit or cap else 0
+
+    @property
+    def read_size(self):
+        return self._size(self.max_read)
+
+    @property
+    def write_size(self):
+        return self._size(self.max_write)
+
+    def stats(self):
+        return {
+            "max_nodes_per_read": self.max_read,
+            "max_nodes_per_write": self.max_write,
+            "read_chunk": self.read_size,
+            "write_chunk": self.write_size,
+        }
+
+
+def read_requests(ua, value_ids, size):
+    """ReadRequests for ReadValueIds with at most size nodes each"""
+    requests = []
+    for chunk in chunked(value_ids, size):
+        request = ua.ReadRequest()
+        request.Parameters.TimestampsToReturn = ua.TimestampsToReturn.Both
+        request.Parameters.NodesToRead = list(chunk)
+        requests.append(request)
+    return requests
+
+
+def value_ids(ua, nodeids):
+    """ReadValueIds of the Value attribute of nodeids"""
+    ids = []
+    for nodeid in nodeids:
+        value_id = ua.ReadValueId()
+        value_id.NodeId = nodeid
+        value_id.AttributeId = ua.AttributeIds.Value
+        ids.append(value_id)
+    return ids
+
+
+def write_requests(ua, nodeids, data_values, size):
+    """WriteRequests of the Value attribute with at most size nodes each"""
+    requests = []
+    for chunk in chunked(list(zip(nodeids, data_values)), size):
+        request = ua.WriteRequest()
+        request.Parameters.NodesToWrite = []
+        for nodeid, data_value in chunk:
+            write_value = ua.WriteValue()
+            write_value.NodeId = nodeid
+            write_value.AttributeId = ua.AttributeIds.Value
+            write_value.Value = data_value
+            request.Parameters.NodesToWrite.append(write_value)
+        requests.append(request)
+    return requests
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+class Outbox:
+    """
+    Flow control for one WebSocket.
+
+    The client reports how many frames it has received with
+    ``{"action": "ack", "frames": n}``. Once it does, at most
+    OPCUA_WS_MAX_IN_FLIGHT frames may be unacknowledged; updates that arrive
+    meanwhile wait here, and only the latest one per (session, node) is kept.
+    A socket whose outbox grows beyond OPCUA_WS_OUTBOX_SIZE nodes, or whose
+    oldest unacknowledged frame is older than OPCUA_WS_MAX_LAG_MS, is too
+    slow and gets disconnected. Clients that never acknowledge are sent
+    everything at once, as before; they are only bounded by how long
+    batches wait for the socket and how long a send to it takes.
+    """
+    def __init__(self, max_in_flight=None, max_nodes=None, max_lag_ms=None):
+        self.max_in_flight = max_in_flight or getattr(settings, 'OPCUA_WS_MAX_IN_FLIGHT', 8)
+        self.max_nodes = max_nodes if max_nodes is not None else getattr(settings, 'OPCUA_WS_OUTBOX_SIZE', 10000)
+        self.max_lag_ms = max_lag_ms if max_lag_ms is not None else getattr(settings, 'OPCUA_WS_MAX_LAG_MS', 30000)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._sent_at = deque()  # monotonic send time of every unacknowledged frame
+        self._replaced = 0  # updates replaced since the last frame was taken
+        self.acking = False
+        self.frames_sent = 0
+        self.frames_acked = 0
+        self.conflated = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, updates):
+        """Hold updates back, replacing older values of the same nodes"""
+        with self._lock:
+            for update in updates:
+                key = (update['session_id'], update['node_id'])
+                if key in self._pending:
+                    self._replaced += 1
+                self._pending[key] = update
+
+    def take(self):
+        """Return (updates, number of older values they replaced) for the next frame and empty the outbox"""
+        with self._lock:
+            updates, self._pending = list(self._pending.values()), {}
+            replaced, self._replaced = self._replaced, 0
+            self.conflated += replaced
+            return updates, replaced
+
+    def sent(self):
+        """Count a frame handed to the socket"""
+        with self._lock:
+            self.frames_sent += 1
+            if self.acking:
+                self._sent_at.append(time.monotonic())
+
+    def ack(self, frames):
+        """The client has received its first frames frames"""
+        with self._lock:
+            frames = max(self.frames_acked, min(int(frames), self.frames_sent))
+            if not self.acking:
+                # Send times are only kept from the first acknowledgement on
+                self.acking = True
+                self._sent_at = deque([time.monotonic()] * (self.frames_sent - frames))
+                self.frames_acked = frames
+                return
+            while self.frames_acked < frames:
+                self.frames_acked += 1
+                self._sent_at.popleft()
+
+    def can_send(self):
+        return not self.acking or len(self._sent_at) < self.max_in_flight
+
+    def lag_ms(self):
+        """Age of the oldest frame the client has not acknowledged, 0 when it does not acknowledge"""
+        with self._lock:
+            if not self.acking or not self._sent_at:
+                return 0.0
+            return (time.monotonic() - self._sent_at[0]) * 1000
+
+    @property
+    def send_timeout(self):
+        """Seconds a single send may take before the socket counts as too slow, or None"""
+        return self.max_lag_ms / 1000 if self.max_lag_ms else None
+
+    def too_slow(self, queued_ms=0.0):
+        """Return why the socket should be dropped, or None; queued_ms is how long a batch waited for it"""
+        if self.max_nodes and len(self._pending) > self.max_nodes:
+            return f"{len(self._pending)} nodes waiting"
+        if self.max_lag_ms and self.lag_ms() > self.max_lag_ms:
+            return f"no acknowledgement for {self.lag_ms():.0f}ms"
+        if self.max_lag_ms and queued_ms > self.max_lag_ms:
+            return f"a batch waited {queued_ms:.0f}ms for the socket"
+        return None
+
+    def stats(self):
+        lag_ms = self.lag_ms()
+        with self._lock:
+            return {
+                "acking": self.acking,
+                "frames_sent": self.frames_sent,
+                "frames_acked": self.frames_acked,
+                "in_flight": len(self._sent_at) if self.acking else None,
+                "pending": len(self._pending),
+                "conflated": self.conflated,
+                "lag_ms": round(lag_ms, 1),
+            }
@@ -0,0 +1,201 @@
+import asyncio
+import inspect
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .fanout import batcher
+from .recorder import recorder
+
+logger = logging.getLogger(__name__)
+
+
+class PolledTag:
+    """
+    Deadband state of one polled node.
+
+    A numeric value is pushed when it moved more than deadband_abs and, with
+    deadband_pct, more than that percent of the span of eu_range, like an
+    OPC UA PercentDeadband. Without eu_range the percent applies to the last
+    pushed value instead, so a tag resting at 0 pushes every change. NaN is
+    pushed once when it appears and once when it goes away; other values are
+    pushed whenever they differ.
+    """
+    def __init__(self, deadband_abs=0.0, deadband_pct=0.0, eu_range=None):
+        self.deadband_abs = float(deadband_abs or 0)
+        self.deadband_pct = float(deadband_pct or 0)
+        self.eu_range = eu_range
+        self.last = None
+        self.has_value = False
+
+    def changed(self, value):
+        """Return True when value should be pushed, remembering it as the last pushed value"""
+        if not self.has_value:
+            self.has_value = True
+            self.last = value
+            return True
+
+        last = self.last
+        numeric = (
+            isinstance(value, (int, float)) and not isinstance(value, bool)
+            and isinstance(last, (int, float)) and not isinstance(last, bool)
+        )
+        if not numeric:
+            if value == last:
+                return False
+            self.last = value
+            return True
+
+        if math.isnan(value) or math.isnan(last):
+            # NaN never equals itself, so compare whether the value is NaN at all
+            if math.isnan(value) and math.isnan(last):
+                return False
+            self.last = value
+            return True
+
+        delta = abs(value - last)
+        if delta == 0 or delta <= self.deadband_abs:
+            return False
+        if self.deadband_pct:
+            # Percent of the engineering range, else of the last pushed value
+            if self.eu_range:
+                span = abs(self.eu_range[1] - self.eu_range[0])
+            else:
+                span = abs(last)
+            if delta <= span * self.deadband_pct / 100:
+                return False
+        self.last = value
+        return True
+
+
+class PollingEngine:
+    """
+    Polls tags on the server side and pushes only changed values.
+
+    Tags are grouped by period; every group issues one batched read per tick,
+    so any number of browser tabs cost one OPC UA read. Changes go through the
+    same batcher as subscription notifications.
+    """
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._groups = {}  # period_ms -> {node_id: PolledTag}
+        self._running = set()
+
+    @property
+    def is_async(self):
+        return inspect.iscoroutinefunction(self.client.read_value)
+
+    def add(self, node_ids, period_ms, deadband_abs=0.0, deadband_pct=0.0, eu_range=None):
+        """Poll node_ids every period_ms; a node moves groups if it was polled at another period"""
+        period_ms = max(int(period_ms), getattr(settings, 'OPCUA_MIN_POLL_PERIOD_MS', 50))
+        with self._lock:
+            for group in self._groups.values():
+                for nid in node_ids:
+                    group.pop(nid, None)
+            group = self._groups.setdefault(period_ms, {})
+            for nid in node_ids:
+                group[nid] = PolledTag(deadband_abs, deadband_pct, eu_range)
+            start = period_ms not in self._running
+            self._running.add(period_ms)
+            self._drop_empty_groups()
+
+        if start:
+            if self.is_async:
+                # asyncio sessions are bound to the ASGI event loop, where their views run, so poll there too
+                asyncio.get_running_loop().create_task(self._run_async(period_ms))
+            else:
+                threading.Thread(
+                    target=self._run, args=(period_ms,), name=f"opcua-poll-{period_ms}", daemon=True
+                ).start()
+        return period_ms
+
+    def remove(self, node_ids=None):
+        """Stop polling node_ids, or everything"""
+        with self._lock:
+            for group in self._groups.values():
+                if node_ids is None:
+                    group.clear()
+                else:
+                    for nid in node_ids:
+                        group.pop(nid, None)
+            self._drop_empty_groups()
+
+    def stop(self):
+        self.remove()
+
+    def tags(self):
+        with self._lock:
+            return {
+                nid: {
+                    "period": period_ms,
+                    "deadband_abs": tag.deadband_abs,
+                    "deadband_pct": tag.deadband_pct,
+                    "range": tag.eu_range,
+                }
+                for period_ms, group in self._groups.items()
+                for nid, tag in group.items()
+            }
+
+    def _drop_empty_groups(self):
+        # Runners notice their group is gone and exit
+        for period_ms in [p for p, group in self._groups.items() if not group]:
+            del self._groups[period_ms]
+
+    def _snapshot(self, period_ms):
+        with self._lock:
+            group = self._groups.get(period_ms)
+            if group is None:
+                self._running.discard(period_ms)
+                return None
+            return list(group)
+
+    def _publish(self, period_ms, values):
+        with self._lock:
+            group = self._groups.get(period_ms, {})
+            changed = [
+                (nid, value) for nid, value in values.items()
+                if nid in group and group[nid].changed(value)
+            ]
+        for nid, value in changed:
+            batcher.add(self.client.session_id, nid, value)
+            recorder.append(self.client.url, nid, value)
+
+    def _run(self, period_ms):
+        period = period_ms / 1000
+        next_tick = time.monotonic()
+        while True:
+            node_ids = self._snapshot(period_ms)
+            if node_ids is None:
+                return
+            try:
+                self._publish(period_ms, self.client.read_value(node_ids))
+            except Exception as e:
+                logger.warning("⚠️ Poll group %sms failed: %s", period_ms, e)
+            # Fixed-rate schedule; skip missed ticks instead of bursting
+            next_tick += period
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now
+            time.sleep(next_tick - now)
+
+    async def _run_async(self, period_ms):
+        period = period_ms / 1000
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            node_ids = self._snapshot(period_ms)
+            if node_ids is None:
+                return
+            try:
+                self._publish(period_ms, await self.client.read_value(node_ids))
+            except Exception as e:
+                logger.warning("⚠️ Poll group %sms failed: %s", period_ms, e)
+            next_tick += period
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
@@ -0,0 +1,173 @@
+import asyncio
+import inspect
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import reconnect_failures, reconnect_gap_seconds, reconnect_seconds, reconnects
+
+logger = logging.getLogger(__name__)
+
+
+def transfer_request(ua, subscription_ids):
+    """TransferSubscriptionsRequest moving subscription_ids to the session that sends it"""
+    request = ua.TransferSubscriptionsRequest()
+    request.Parameters.SubscriptionIds = list(subscription_ids)
+    # Values do not survive the gap reliably, so have the server resend the current ones
+    request.Parameters.SendInitialValues = True
+    return request
+
+
+class ReconnectSupervisor:
+    """
+    Watches a session with keepalive reads and reconnects it when they fail.
+
+    The client's keepalive() reads the server state every
+    OPCUA_KEEPALIVE_INTERVAL_MS. On failure reconnect() is retried with
+    exponential backoff between OPCUA_RECONNECT_MIN_DELAY_MS and
+    OPCUA_RECONNECT_MAX_DELAY_MS; the client rebuilds its registrations and
+    subscriptions on the new session. Sync sessions are watched from a thread,
+    asyncio sessions from a task on their event loop.
+    """
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task = None
+        self.state = "idle"
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.transferred = 0
+        self.recreated = 0
+        self.last_reconnect_ms = None
+        self.last_gap_ms = None
+        self.total_gap_ms = 0.0
+        self.last_error = None
+        self._last_ok = None
+
+    @property
+    def is_async(self):
+        return inspect.iscoroutinefunction(self.client.keepalive)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'OPCUA_KEEPALIVE_INTERVAL_MS', 5000) / 1000
+
+    def delays(self):
+        """Backoff delays in seconds, doubling up to the maximum with some jitter"""
+        delay = getattr(settings, 'OPCUA_RECONNECT_MIN_DELAY_MS', 500) / 1000
+        max_delay = getattr(settings, 'OPCUA_RECONNECT_MAX_DELAY_MS', 30000) / 1000
+        while True:
+            # Jitter keeps many sessions of one PLC from reconnecting in lockstep
+            yield delay * random.uniform(0.8, 1.2)
+            delay = min(delay * 2, max_delay)
+
+    def start(self):
+        """Start watching; asyncio sessions must call this on their event loop"""
+        self._stop.clear()
+        self._last_ok = time.monotonic()
+        self.state = "connected"
+        if self.is_async:
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+        else:
+            threading.Thread(target=self._run, name="opcua-keepalive", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.state = "stopped"
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "reconnects": self.reconnects,
+                "failed_attempts": self.failed_attempts,
+                "transferred_subscriptions": self.transferred,
+                "recreated_subscriptions": self.recreated,
+                "last_reconnect_ms": self.last_reconnect_ms,
+                "last_gap_ms": self.last_gap_ms,
+                "total_gap_ms": round(self.total_gap_ms, 1),
+                "last_error": self.last_error,
+            }
+
+    def _lost(self, error):
+        logger.warning("⚠️ Keepalive to %s failed, reconnecting: %s", self.client.url, error)
+        with self._lock:
+            self.state = "reconnecting"
+            self.last_error = str(error)
+
+    def _failed(self, error, delay):
+        logger.warning("⚠️ Reconnect to %s failed, retrying in %.1fs: %s", self.client.url, delay, error)
+        reconnect_failures.inc(server=self.client.url)
+        with self._lock:
+            self.failed_attempts += 1
+            self.last_error = str(error)
+
+    def _recovered(self, started, result):
+        now = time.monotonic()
+        transferred, recreated = result
+        with self._lock:
+            self.state = "connected"
+            self.reconnects += 1
+            self.transferred += transferred
+            self.recreated += recreated
+            self.last_reconnect_ms = round((now - started) * 1000, 1)
+            # No data arrived since the last good keepalive at best
+            self.last_gap_ms = round((now - self._last_ok) * 1000, 1)
+            self.total_gap_ms += self.last_gap_ms
+            self._last_ok = now
+        reconnects.inc(server=self.client.url)
+        reconnect_seconds.observe(self.last_reconnect_ms / 1000, server=self.client.url)
+        reconnect_gap_seconds.observe(self.last_gap_ms / 1000, server=self.client.url)
+        logger.info(
+            "🔁 Reconnected to %s in %sms (gap %sms), %d subscription(s) transferred, %d recreated",
+            self.client.url, self.last_reconnect_ms, self.last_gap_ms, transferred, recreated
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.client.keepalive()
+                self._last_ok = time.monotonic()
+                continue
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                self._lost(e)
+            for delay in self.delays():
+                started = time.monotonic()
+                try:
+                    result = self.client.reconnect()
+                except Exception as e:
+                    self._failed(e, delay)
+                    if self._stop.wait(delay):
+                        return
+                    continue
+                self._recovered(started, result)
+                break
+
+    async def _run_async(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.client.keepalive()
+                self._last_ok = time.monotonic()
+                continue
+            except Exception as e:
+                self._lost(e)
+            for delay in self.delays():
+                started = time.monotonic()
+                try:
+                    result = await self.client.reconnect()
+                except Exception as e:
+                    self._failed(e, delay)
+                    await asyncio.sleep(delay)
+                    continue
+                self._recovered(started, result)
+                break
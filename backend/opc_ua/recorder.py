@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import timezone
+
+import numpy as np
+from django.conf import settings
+
+from .binary_frames import finite
+
+logger = logging.getLogger(__name__)
+
+# Both columns are little-endian float64: timestamps in seconds since the epoch, values as numbers
+DTYPE = np.dtype('<f8')
+
+
+def epoch_seconds(timestamp):
+    """Seconds since the epoch for a datetime; python-opcua hands out naive UTC"""
+    if timestamp is None:
+        return time.time()
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def as_number(value):
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+class TagSeries:
+    """
+    Append-only timestamp and value columns of one tag.
+
+    New samples collect in memory and are appended to ``ts.f8`` and ``val.f8``
+    in chunks; reads memory-map the files and add the unflushed tail. Timestamps
+    are kept non-decreasing so ranges can be found with a binary search.
+    """
+    def __init__(self, path, chunk_rows):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._timestamps = []
+        self._values = []
+        self._last = -math.inf
+        ts_path = os.path.join(path, 'ts.f8')
+        if os.path.exists(ts_path) and os.path.getsize(ts_path):
+            self._last = float(np.memmap(ts_path, dtype=DTYPE, mode='r')[-1])
+
+    def append(self, timestamp, value):
+        with self._lock:
+            timestamp = max(timestamp, self._last)
+            self._last = timestamp
+            self._timestamps.append(timestamp)
+            self._values.append(value)
+            if len(self._timestamps) >= self.chunk_rows:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._timestamps:
+            return
+        with open(os.path.join(self.path, 'ts.f8'), 'ab') as ts_file, \
+                open(os.path.join(self.path, 'val.f8'), 'ab') as val_file:
+            # Values first: a crash between the two writes leaves no timestamp without a value
+            np.asarray(self._values, dtype=DTYPE).tofile(val_file)
+            np.asarray(self._timestamps, dtype=DTYPE).tofile(ts_file)
+        self._timestamps = []
+        self._values = []
+
+    def _column(self, name):
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return np.empty(0, dtype=DTYPE)
+        return np.memmap(path, dtype=DTYPE, mode='r')
+
+    def read(self, start, end):
+        """Return (timestamps, values) arrays with start <= timestamp <= end"""
+        with self._lock:
+            tail_ts = np.asarray(self._timestamps, dtype=DTYPE)
+            tail_values = np.asarray(self._values, dtype=DTYPE)
+            timestamps = self._column('ts.f8')
+            values = self._column('val.f8')
+        rows = min(len(timestamps), len(values))
+        timestamps, values = timestamps[:rows], values[:rows]
+        first = np.searchsorted(timestamps, start, side='left')
+        last = np.searchsorted(timestamps, end, side='right')
+        tail_first = np.searchsorted(tail_ts, start, side='left')
+        tail_last = np.searchsorted(tail_ts, end, side='right')
+        return (
+            np.concatenate((timestamps[first:last], tail_ts[tail_first:tail_last])),
+            np.concatenate((values[first:last], tail_values[tail_first:tail_last])),
+        )
+
+
+def downsample(timestamps, values, start, bucket):
+    """Min, max, average and count per bucket of `bucket` seconds, vectorized over sorted samples"""
+    if not len(timestamps):
+        empty = np.empty(0, dtype=DTYPE)
+        return {"timestamps": empty, "min": empty, "max": empty, "avg": empty, "count": empty}
+    index = ((timestamps - start) // bucket).astype(np.int64)
+    # Samples are sorted, so each bucket is one contiguous run
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+    counts = np.diff(np.concatenate((starts, [len(values)])))
+    return {
+        "timestamps": start + index[starts] * bucket,
+        "min": np.minimum.reduceat(values, starts),
+        "max": np.maximum.reduceat(values, starts),
+        "avg": np.add.reduceat(values, starts) / counts,
+        "count": counts,
+    }
+
+
+class Recorder:
+    """
+    Local time-series store for subscribed tags.
+
+    Enabled by setting OPCUA_RECORDER_DIR. Every numeric data change is appended
+    to the series of its server and node, so recordings outlive sessions and
+    trends can be served without asking the PLC again.
+    """
+    def __init__(self, directory=None, chunk_rows=None):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._series = {}
+        self._thread = None
+
+    @property
+    def root(self):
+        return self.directory or getattr(settings, 'OPCUA_RECORDER_DIR', None)
+
+    @property
+    def enabled(self):
+        return bool(self.root)
+
+    def series(self, server, node_id, create=True):
+        key = (server, node_id)
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                return series
+            path = os.path.join(self.root, hashlib.sha1(f"{server}|{node_id}".encode()).hexdigest()[:20])
+            if not create and not os.path.isdir(path):
+                return None
+            os.makedirs(path, exist_ok=True)
+            meta_path = os.path.join(path, 'meta.json')
+            if not os.path.exists(meta_path):
+                with open(meta_path, 'w') as meta:
+                    json.dump({"server": server, "node_id": node_id}, meta)
+            chunk_rows = self.chunk_rows or getattr(settings, 'OPCUA_RECORDER_CHUNK_ROWS', 1024)
+            series = self._series[key] = TagSeries(path, chunk_rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="opcua-recorder", daemon=True)
+                self._thread.start()
+            return series
+
+    def append(self, server, node_id, value, timestamp=None):
+        """Record one data change; values that are not numbers are skipped"""
+        if not self.enabled:
+            return
+        value = as_number(value)
+        if value is None:
+            return
+        self.series(server, node_id).append(epoch_seconds(timestamp), value)
+
+    def flush(self):
+        with self._lock:
+            series = list(self._series.values())
+        for tag in series:
+            tag.flush()
+
+    def query(self, server, node_id, start, end, bucket=None):
+        """Samples of one tag between start and end (epoch seconds), or per-bucket aggregates"""
+        series = self.series(server, node_id, create=False)
+        if series is None:
+            timestamps = values = np.empty(0, dtype=DTYPE)
+        else:
+            timestamps, values = series.read(start, end)
+        # Recorded NaN and infinities go out as null, which JSON.parse accepts
+        if bucket:
+            return {name: finite(column.tolist()) for name, column in downsample(timestamps, values, start, bucket).items()}
+        return {"timestamps": timestamps.tolist(), "values": finite(values.tolist())}
+
+    def _run(self):
+        # Partial chunks reach the disk within a few seconds even for slow tags
+        while True:
+            time.sleep(5)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("⚠️ Recorder flush failed: %s", e)
+
+
+recorder = Recorder()
@@ -1,3 +1,1493 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import datetime
+import inspect
+import json
+import math
+import socket
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from channels_redis.pubsub import RedisPubSubChannelLayer
+from django.test import SimpleTestCase, override_settings
+from fakeredis.aioredis import FakeConnection
+from opcua import ua
+from rest_framework.test import APIRequestFactory
+
+from .async_client import AsyncOPCUAClient
+from .opc_ua_client import OPCUAClient, OPCUAError
+from .benchmark import regressions
+from .binary_frames import BATCH, DOUBLE, FRAME_HEADER, JSON, RECORD_HEADER, STRING, FrameEncoder
+from .browse import BrowseCache, BrowseRequest
+from .browse_paths import PathCache, canonical_path, is_browse_path, parse_path
+from .client_base import ModelChangeHandler
+from .coalesce import ReadCoalescer
+from .connection_pool import OPCUAConnectionPool, pool
+from .consumers import OPCConsumer
+from .events import EventDispatcher, EventFilterSpec
+from .executor import ServerBusy, ServerExecutor
+from .fanout import NotificationBatcher, batch_frame, select_entries
+from .history import HistoryReader, ndjson_stream
+from .ingest import SnapshotResponder, select_endpoint
+from .last_value import LastValueCache, snapshot_updates
+from .metrics import Counter, Histogram, reconnect_gap_seconds, reconnect_seconds, request_errors, request_nodes, timed
+from .operation_limits import OperationLimits, chunked
+from .outbox import Outbox
+from .polling import PolledTag
+from .reconnect import ReconnectSupervisor
+from .recorder import Recorder
+from .type_cache import NodeTypeCache, TypeInfo
+from .variants import VariantConverter
+from .views import OPCUAConnectView, OPCUADataView, OPCUARecorderView, OPCUASessionView
+from .write_queue import WriteQueue
+
+
+class ShardedDeploymentTests(SimpleTestCase):
+    """
+    Ingest worker and web worker talking through a Redis channel layer.
+
+    fakeredis stands in for the broker: the web side uses the layer from
+    settings, the ingest side its own layer instance on the same fake server,
+    like two processes sharing one Redis.
+    """
+    def setUp(self):
+        self.host = {"connection_class": FakeConnection, "server": fakeredis.FakeServer()}
+        self.settings_override = override_settings(CHANNEL_LAYERS={
+            "default": {
+                "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+                "CONFIG": {"hosts": [self.host]},
+            }
+        })
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    async def connect_socket(self):
+        communicator = WebsocketCommunicator(OPCConsumer.as_asgi(), "/ws/socket-server/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def publish(self, layer, updates):
+        batcher = NotificationBatcher(channel_layer=layer)
+        for session_id, node_id, value in updates:
+            batcher.add(session_id, node_id, value)
+        await layer.group_send(batcher.group, batcher.take())
+
+    async def test_ingest_updates_reach_web_socket(self):
+        ingest_layer = RedisPubSubChannelLayer(hosts=[self.host])
+        communicator = await self.connect_socket()
+
+        await self.publish(ingest_layer, [("s1", "ns=2;s=Speed", 1.5)])
+
+        frame = await communicator.receive_json_from(timeout=3)
+        self.assertEqual(frame["type"], "batch")
+        self.assertEqual(frame["updates"][0]["node_id"], "ns=2;s=Speed")
+        self.assertEqual(frame["updates"][0]["value"], 1.5)
+        await communicator.disconnect()
+        await ingest_layer.flush()
+
+    async def test_socket_filter_applies_to_remote_updates(self):
+        ingest_layer = RedisPubSubChannelLayer(hosts=[self.host])
+        communicator = await self.connect_socket()
+        await communicator.send_json_to({"action": "subscribe", "node_ids": ["ns=2;s=Count"]})
+        self.assertEqual((await communicator.receive_json_from(timeout=3))["type"], "interest")
+
+        await self.publish(ingest_layer, [("s1", "ns=2;s=Speed", 1.5), ("s1", "ns=2;s=Count", 3)])
+
+        frame = await communicator.receive_json_from(timeout=3)
+        self.assertEqual([update["node_id"] for update in frame["updates"]], ["ns=2;s=Count"])
+        await communicator.disconnect()
+        await ingest_layer.flush()
+
+    async def test_snapshot_comes_from_ingest_worker(self):
+        ingest_layer = RedisPubSubChannelLayer(hosts=[self.host])
+        cache = LastValueCache()
+        cache.update("ns=2;s=Speed", 7.0)
+        responder = SnapshotResponder(
+            sessions=lambda: [("s1", SimpleNamespace(last_values=cache))],
+            channel_layer=ingest_layer,
+        )
+        task = asyncio.create_task(responder.serve())
+        await asyncio.sleep(0.1)
+
+        communicator = await self.connect_socket()
+        frame = await communicator.receive_json_from(timeout=3)
+        self.assertEqual(frame["type"], "snapshot")
+        self.assertEqual(frame["updates"][0]["session_id"], "s1")
+        self.assertEqual(frame["updates"][0]["value"], 7.0)
+
+        await communicator.disconnect()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await ingest_layer.flush()
+
+
+class SelectEndpointTests(SimpleTestCase):
+    endpoints = [
+        {"security_policy_uri": "http://opcfoundation.org/UA/SecurityPolicy#None",
+         "security_mode": "1", "security_level": 0},
+        {"security_policy_uri": "http://opcfoundation.org/UA/SecurityPolicy#Basic256Sha256",
+         "security_mode": "2", "security_level": 3},
+        {"security_policy_uri": "http://opcfoundation.org/UA/SecurityPolicy#Basic256Sha256",
+         "security_mode": "3", "security_level": 4},
+    ]
+
+    def test_defaults_to_no_security(self):
+        self.assertEqual(select_endpoint(self.endpoints)["security_level"], 0)
+
+    def test_prefers_most_secure_match(self):
+        self.assertEqual(select_endpoint(self.endpoints, "Basic256Sha256")["security_mode"], "3")
+        self.assertEqual(select_endpoint(self.endpoints, "Basic256Sha256", 2)["security_mode"], "2")
+
+
+class FrameEncoderTests(SimpleTestCase):
+    def test_records_use_handles_announced_once(self):
+        encoder = FrameEncoder()
+        updates = [
+            {"session_id": "s1", "node_id": 'ns=3;s="DB_Line1"."Motor"."Speed"', "value": 12.5,
+             "source_timestamp": "2024-05-01T10:00:00+00:00", "status": "Good"},
+            {"session_id": "s1", "node_id": "ns=3;s=Name", "value": "M1", "status": "BadNoCommunication"},
+        ]
+        handles, frame = encoder.encode(BATCH, updates)
+        self.assertEqual(handles[0]["node_id"], 'ns=3;s="DB_Line1"."Motor"."Speed"')
+
+        kind, count = FRAME_HEADER.unpack_from(frame)
+        self.assertEqual((kind, count), (BATCH, 2))
+        offset = FRAME_HEADER.size
+        handle, value_type, status, timestamp = RECORD_HEADER.unpack_from(frame, offset)
+        offset += RECORD_HEADER.size
+        self.assertEqual((handle, value_type, status), (0, DOUBLE, 0))
+        self.assertEqual(timestamp, 1714557600000.0)
+        self.assertEqual(struct.unpack_from("<d", frame, offset)[0], 12.5)
+        offset += 8
+        handle, value_type, status, _ = RECORD_HEADER.unpack_from(frame, offset)
+        self.assertEqual((handle, value_type, status), (1, STRING, 2))
+
+        handles, _ = encoder.encode(BATCH, updates[:1])
+        self.assertEqual(handles, {})
+
+    def test_arrays_fall_back_to_json(self):
+        _, frame = FrameEncoder().encode(BATCH, [{"session_id": "s1", "node_id": "a", "value": [1, 2]}])
+        _, value_type, _, _ = RECORD_HEADER.unpack_from(frame, FRAME_HEADER.size)
+        self.assertEqual(value_type, JSON)
+
+    def test_json_records_have_no_nan(self):
+        value = [1.5, math.nan, {"high": math.inf, "low": -math.inf}]
+        _, frame = FrameEncoder().encode(BATCH, [{"session_id": "s1", "node_id": "a", "value": value}])
+        offset = FRAME_HEADER.size + RECORD_HEADER.size
+        (length,) = struct.unpack_from("<I", frame, offset)
+        data = frame[offset + 4:offset + 4 + length].decode()
+        self.assertEqual(data, '[1.5, null, {"high": null, "low": null}]')
+
+
+class RecorderTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.recorder = Recorder(directory.name, chunk_rows=4)
+
+    def record(self, samples):
+        for seconds, value in samples:
+            self.recorder.series("opc.tcp://plc", "ns=2;s=Speed").append(seconds, value)
+
+    def test_range_reads_flushed_and_buffered_samples(self):
+        self.record([(t, t * 10.0) for t in range(10)])
+        result = self.recorder.query("opc.tcp://plc", "ns=2;s=Speed", 3, 8)
+        self.assertEqual(result["timestamps"], [3, 4, 5, 6, 7, 8])
+        self.assertEqual(result["values"], [30, 40, 50, 60, 70, 80])
+
+    def test_downsampling_per_bucket(self):
+        self.record([(0, 1.0), (1, 3.0), (2, 5.0), (5, 7.0), (6, 9.0)])
+        result = self.recorder.query("opc.tcp://plc", "ns=2;s=Speed", 0, 10, bucket=5)
+        self.assertEqual(result["timestamps"], [0, 5])
+        self.assertEqual(result["min"], [1.0, 7.0])
+        self.assertEqual(result["max"], [5.0, 9.0])
+        self.assertEqual(result["avg"], [3.0, 8.0])
+        self.assertEqual(result["count"], [3, 2])
+
+    def test_non_finite_samples_are_null(self):
+        self.record([(0, 1.0), (1, math.nan), (2, math.inf)])
+        result = self.recorder.query("opc.tcp://plc", "ns=2;s=Speed", 0, 10)
+        self.assertEqual(result["values"], [1.0, None, None])
+        self.assertEqual(json.loads(json.dumps(result, allow_nan=False))["values"], [1.0, None, None])
+
+    async def test_view_rejects_a_bad_bucket(self):
+        view = OPCUARecorderView.as_view()
+        session = SimpleNamespace(url="opc.tcp://plc")
+        with override_settings(OPCUA_RECORDER_DIR=self.recorder.directory), \
+                mock.patch('opc_ua.views.pool.get', return_value=session):
+            for bucket in (0, -5, 2.5, "soon", True):
+                request = APIRequestFactory().post(
+                    "/", {"node_ids": ["ns=2;s=Speed"], "start": "2024-05-01T10:00:00Z", "bucket": bucket}, format="json"
+                )
+                response = await view(request, session_id="s1")
+                self.assertEqual(response.status_code, 400, bucket)
+            request = APIRequestFactory().post(
+                "/", {"node_ids": ["ns=2;s=Speed"], "start": "2024-05-01T10:00:00Z", "bucket": 60000}, format="json"
+            )
+            response = await view(request, session_id="s1")
+            self.assertEqual(response.status_code, 200)
+
+    def test_unknown_tag_is_empty(self):
+        result = self.recorder.query("opc.tcp://plc", "ns=2;s=Missing", 0, 10)
+        self.assertEqual(result, {"timestamps": [], "values": []})
+
+
+class BrowsePathTests(SimpleTestCase):
+    def test_paths_are_told_apart_from_node_ids(self):
+        self.assertTrue(is_browse_path("Objects/PLC1/Motor/Speed"))
+        self.assertFalse(is_browse_path('ns=3;s="DB_Line1"/Speed'))
+        self.assertFalse(is_browse_path("i=85"))
+
+    def test_unprefixed_segments_use_the_default_namespace(self):
+        elements = parse_path("/Objects/PLC1/4:Motor/Speed", namespace=3)
+        self.assertEqual(canonical_path(elements), "0:Objects/3:PLC1/4:Motor/3:Speed")
+
+    def test_cache_survives_restart_for_same_namespace_array(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        namespaces = ["http://opcfoundation.org/UA/", "urn:plc"]
+        PathCache("opc.tcp://plc", namespaces, directory.name).update({"0:Objects/1:Speed": "ns=1;i=7"})
+
+        found, missing = PathCache("opc.tcp://plc", namespaces, directory.name).get_many(["0:Objects/1:Speed"])
+        self.assertEqual((found, missing), ({"0:Objects/1:Speed": "ns=1;i=7"}, []))
+
+        reordered = PathCache("opc.tcp://plc", list(reversed(namespaces)), directory.name)
+        self.assertEqual(len(reordered), 0)
+        self.assertEqual(reordered.namespace_index("urn:plc"), 0)
+
+
+def reference(name, node_class=ua.NodeClass.Variable):
+    description = ua.ReferenceDescription()
+    description.NodeId = ua.ExpandedNodeId(name, 2)
+    description.BrowseName = ua.QualifiedName(name, 2)
+    description.DisplayName = ua.LocalizedText(name)
+    description.NodeClass = node_class
+    description.TypeDefinition = ua.ExpandedNodeId()
+    return description
+
+
+def browse_result(references, continuation_point=None, status=ua.StatusCodes.Good):
+    result = ua.BrowseResult()
+    result.StatusCode = ua.StatusCode(status)
+    result.References = references
+    result.ContinuationPoint = continuation_point
+    return result
+
+
+def data_type_value(identifier):
+    return ua.DataValue(ua.Variant(ua.NodeId(identifier), ua.VariantType.NodeId))
+
+
+class BrowseCacheTests(SimpleTestCase):
+    def test_counts_hits_and_drops_least_recently_used(self):
+        cache = BrowseCache(max_entries=2)
+        cache.update({"i=85": [], "ns=2;s=Plant": []})
+        cache.get_many(["i=85"])  # ns=2;s=Plant is now the least recently used
+        cache.update({"ns=2;s=Line": []})
+        found, missing = cache.get_many(["i=85", "ns=2;s=Plant", "ns=2;s=Line"])
+        self.assertEqual(list(found), ["i=85", "ns=2;s=Line"])
+        self.assertEqual(missing, ["ns=2;s=Plant"])
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 3, "misses": 1})
+
+    def test_invalidate_parents_of_a_child(self):
+        cache = BrowseCache()
+        cache.update({
+            "i=85": [{"node_id": "ns=2;s=Plant"}],
+            "ns=2;s=Plant": [{"node_id": "ns=2;s=Speed"}],
+        })
+        cache.invalidate_parents(["ns=2;s=Speed"])
+        self.assertEqual(cache.get_many(["i=85", "ns=2;s=Plant"])[1], ["ns=2;s=Plant"])
+
+
+class BrowseRequestTests(SimpleTestCase):
+    def test_follows_continuation_points_of_paged_nodes(self):
+        request = BrowseRequest(ua, ["ns=2;s=Plant", "i=85"], max_references=2)
+        self.assertEqual(request.browse_params().RequestedMaxReferencesPerNode, 2)
+        request.consume([
+            browse_result([reference("Speed"), reference("Count")], b"page-2"),
+            browse_result([reference("Plant", ua.NodeClass.Object)]),
+        ])
+        # Only the node that has more references is browsed again
+        self.assertEqual(request.next_params().ContinuationPoints, [b"page-2"])
+        request.consume([browse_result([reference("Name")])])
+        self.assertFalse(request.continuation)
+
+        self.assertEqual(len(request.read_ids()), 3)
+        children = request.children([data_type_value(11), data_type_value(6), data_type_value(12)])
+        self.assertEqual(
+            [(child["node_id"], child["data_type"]) for child in children["ns=2;s=Plant"]],
+            [("ns=2;s=Speed", "Double"), ("ns=2;s=Count", "Int32"), ("ns=2;s=Name", "String")],
+        )
+        self.assertEqual(children["i=85"][0]["node_class"], "Object")
+        self.assertIsNone(children["i=85"][0]["data_type"])
+
+    def test_bad_node_fails_the_browse(self):
+        request = BrowseRequest(ua, ["ns=2;s=Nope", "ns=2;s=Plant"])
+        request.browse_params()
+        with self.assertRaisesRegex(ValueError, "ns=2;s=Nope: BadNodeIdUnknown"):
+            request.consume([
+                browse_result([], status=ua.StatusCodes.BadNodeIdUnknown),
+                browse_result([reference("Speed")], b"page-2"),
+            ])
+        # The other node's continuation point is still held by the server
+        params = request.next_params(release=True)
+        self.assertTrue(params.ReleaseContinuationPoints)
+        self.assertEqual(params.ContinuationPoints, [b"page-2"])
+
+
+class ModelChangeHandlerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.client = SimpleNamespace(
+            ua=ua,
+            type_cache=NodeTypeCache(),
+            browse_cache=BrowseCache(),
+            path_cache=PathCache("opc.tcp://plc:4840", ["http://opcfoundation.org/UA/"], directory.name),
+            _paths={"Objects/2:Plant/2:Speed": "ns=2;s=Speed", "Objects/2:Line": "ns=2;s=Line"},
+        )
+        self.client.browse_cache.update({
+            "i=85": [{"node_id": "ns=2;s=Plant"}, {"node_id": "ns=2;s=Line"}],
+            "ns=2;s=Plant": [{"node_id": "ns=2;s=Speed"}],
+            "ns=2;s=Line": [{"node_id": "ns=2;s=Count"}],
+        })
+        self.client.path_cache.update({
+            "0:Objects/2:Plant": "ns=2;s=Plant",
+            "0:Objects/2:Plant/2:Speed": "ns=2;s=Speed",
+            "0:Objects/2:Line": "ns=2;s=Line",
+        })
+        self.handler = ModelChangeHandler(self.client)
+
+    def notify(self, *changes):
+        self.handler.event_notification(SimpleNamespace(Changes=[
+            SimpleNamespace(Affected=ua.NodeId.from_string(node_id), Verb=verb) for node_id, verb in changes
+        ]))
+
+    def browse_cached(self):
+        return sorted(self.client.browse_cache.get_many(["i=85", "ns=2;s=Plant", "ns=2;s=Line"])[0])
+
+    def paths_cached(self):
+        return sorted(self.client.path_cache.get_many(
+            ["0:Objects/2:Plant", "0:Objects/2:Plant/2:Speed", "0:Objects/2:Line"]
+        )[0])
+
+    def test_reference_added_drops_only_its_source(self):
+        self.notify(("ns=2;s=Plant", ua.ModelChangeStructureVerbMask.ReferenceAdded))
+        self.assertEqual(self.browse_cached(), ["i=85", "ns=2;s=Line"])
+        self.assertEqual(len(self.paths_cached()), 3)
+
+    def test_node_added_without_parent_clears_browse_cache_only(self):
+        self.notify(("ns=2;s=New", ua.ModelChangeStructureVerbMask.NodeAdded))
+        self.assertEqual(self.browse_cached(), [])
+        self.assertEqual(len(self.paths_cached()), 3)
+        self.assertEqual(len(self.client._paths), 2)
+
+    def test_node_deleted_drops_its_parents_and_paths_through_it(self):
+        self.notify(("ns=2;s=Plant", ua.ModelChangeStructureVerbMask.NodeDeleted))
+        self.assertEqual(self.browse_cached(), ["ns=2;s=Line"])
+        self.assertEqual(self.paths_cached(), ["0:Objects/2:Line"])
+        self.assertEqual(self.client._paths, {"Objects/2:Line": "ns=2;s=Line"})
+        # The file on disk was updated too
+        reloaded = PathCache("opc.tcp://plc:4840", ["http://opcfoundation.org/UA/"], self.client.path_cache.directory)
+        self.assertEqual(len(reloaded), 1)
+
+    def test_reference_deleted_drops_paths_below_its_source(self):
+        self.notify(("ns=2;s=Plant", ua.ModelChangeStructureVerbMask.ReferenceDeleted))
+        self.assertEqual(self.paths_cached(), ["0:Objects/2:Line", "0:Objects/2:Plant"])
+        self.assertEqual(self.client._paths, {"Objects/2:Line": "ns=2;s=Line"})
+
+    def test_reference_deleted_below_an_untranslated_source_clears_paths(self):
+        self.notify(("ns=2;s=Elsewhere", ua.ModelChangeStructureVerbMask.ReferenceDeleted))
+        self.assertEqual(self.paths_cached(), [])
+        self.assertEqual(self.client._paths, {})
+
+    def test_change_event_without_changes_clears_everything(self):
+        self.handler.event_notification(SimpleNamespace())
+        self.assertEqual(self.browse_cached(), [])
+        self.assertEqual(self.paths_cached(), [])
+
+
+class NotificationBatcherTests(SimpleTestCase):
+    def take(self):
+        batcher = NotificationBatcher()
+        batcher.add("s1", "ns=2;s=Speed", 1.5)
+        batcher.add("s1", "ns=2;s=Count", 3)
+        batcher.add("s2", "ns=2;s=Speed", 2.5)
+        return batcher.take()
+
+    def test_entries_are_encoded_once(self):
+        message = self.take()
+        self.assertEqual(set(message), {"type", "updates", "nodes", "created"})
+        self.assertEqual(message["nodes"], {"ns=2;s=Speed": [["s1", 0], ["s2", 2]], "ns=2;s=Count": [["s1", 1]]})
+        frame = json.loads(batch_frame(message["updates"]))
+        self.assertEqual([update["value"] for update in frame["updates"]], [1.5, 3, 2.5])
+
+    def test_selects_by_session_and_node(self):
+        message = self.take()
+
+        def values(interest):
+            return [json.loads(entry)["value"] for entry in select_entries(message, interest)]
+
+        self.assertEqual(values(None), [1.5, 3, 2.5])
+        self.assertEqual(values({("s2", "ns=2;s=Speed")}), [2.5])
+        # A key without a session matches the node on every session
+        self.assertEqual(values({(None, "ns=2;s=Speed")}), [1.5, 2.5])
+        # Larger interests walk the index instead of looking every key up, with the same result
+        self.assertEqual(values({(None, "ns=2;s=Speed"), ("s1", "ns=2;s=Speed"), ("s1", "ns=2;s=Count")}), [1.5, 3, 2.5])
+        self.assertEqual(values({("s3", "ns=2;s=Count"), ("s1", "ns=2;s=Other"), (None, "ns=2;s=Other")}), [])
+
+
+def history_result(values, continuation_point=None, status=ua.StatusCodes.Good):
+    result = ua.HistoryReadResult()
+    result.StatusCode = ua.StatusCode(status)
+    result.ContinuationPoint = continuation_point
+    result.HistoryData = ua.HistoryData()
+    result.HistoryData.DataValues = [ua.DataValue(ua.Variant(value, ua.VariantType.Double)) for value in values]
+    return result
+
+
+class HistoryReaderTests(SimpleTestCase):
+    start = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+
+    def reader(self, **kwargs):
+        return HistoryReader(ua, ["a", "b"], [ua.NodeId("A", 2), ua.NodeId("B", 2)], self.start, **kwargs)
+
+    def test_only_nodes_with_a_continuation_point_are_read_again(self):
+        reader = self.reader(page_size=2)
+        params = reader.params()
+        self.assertEqual(params.HistoryReadDetails.NumValuesPerNode, 2)
+        self.assertEqual([value_id.NodeId for value_id in params.NodesToRead], [ua.NodeId("A", 2), ua.NodeId("B", 2)])
+
+        pages = reader.consume([history_result([1.0, 2.0], b"next"), history_result([5.0])])
+        self.assertEqual([(page["node_id"], [v["value"] for v in page["values"]]) for page in pages],
+                         [("a", [1.0, 2.0]), ("b", [5.0])])
+        params = reader.params()
+        self.assertEqual([(value_id.NodeId, value_id.ContinuationPoint) for value_id in params.NodesToRead],
+                         [(ua.NodeId("A", 2), b"next")])
+        self.assertTrue(reader.params(release=True).ReleaseContinuationPoints)
+
+        reader.consume([history_result([3.0])])
+        self.assertTrue(reader.done)
+
+    def test_refused_node_gets_an_error_page(self):
+        reader = self.reader()
+        pages = reader.consume([history_result([1.0]), history_result([], status=ua.StatusCodes.BadHistoryOperationUnsupported)])
+        self.assertEqual(pages[1], {"node_id": "b", "error": "BadHistoryOperationUnsupported"})
+        self.assertTrue(reader.done)
+
+    def test_processed_history(self):
+        details = self.reader(aggregate="Average", interval_ms=60000).params().HistoryReadDetails
+        self.assertEqual(details.ProcessingInterval, 60000)
+        self.assertEqual(details.AggregateType, [ua.NodeId(ua.ObjectIds.AggregateFunction_Average)] * 2)
+        with self.assertRaisesRegex(ValueError, "Unknown aggregate"):
+            self.reader(aggregate="Median", interval_ms=1000)
+        with self.assertRaisesRegex(ValueError, "interval is required"):
+            self.reader(aggregate="Average")
+
+
+class NdjsonStreamTests(SimpleTestCase):
+    async def lines(self, pages, timeout=3):
+        first = next(pages) if not inspect.isasyncgen(pages) else await pages.__anext__()
+        executor = ServerExecutor("history-tests", workers=1, queue=1)
+        return [json.loads(line) async for line in ndjson_stream(first, pages, executor, timeout)]
+
+    async def test_pages_are_read_on_the_server_executor(self):
+        threads = []
+        closed = []
+
+        def pages():
+            try:
+                for index in range(3):
+                    threads.append(threading.current_thread().name)
+                    yield {"page": index}
+            finally:
+                closed.append(True)
+
+        self.assertEqual(await self.lines(pages()), [{"page": 0}, {"page": 1}, {"page": 2}])
+        self.assertTrue(all(name.startswith("opcua-history-tests") for name in threads[1:]))
+        self.assertEqual(closed, [True])
+
+    async def test_slow_page_ends_the_stream_after_the_timeout(self):
+        def pages():
+            yield {"page": 0}
+            time.sleep(0.5)
+            yield {"page": 1}
+
+        lines = await self.lines(pages(), timeout=0.1)
+        self.assertEqual(lines[0], {"page": 0})
+        self.assertIn("did not answer within 0.1s", lines[1]["error"])
+
+    async def test_asyncio_pages_and_errors(self):
+        async def pages():
+            yield {"page": 0}
+            yield {"page": 1}
+            raise ConnectionError("Connection is closed")
+
+        self.assertEqual(await self.lines(pages()), [{"page": 0}, {"page": 1}, {"error": "Connection is closed"}])
+
+
+class NodeTypeCacheTests(SimpleTestCase):
+    def test_counts_hits_and_misses(self):
+        cache = NodeTypeCache()
+        info = TypeInfo(ua.VariantType.Double, -1, None)
+        self.assertEqual(cache.get_many(["a", "b", "a"]), ({}, ["a", "b"]))
+        cache.update({"a": info})
+        self.assertEqual(cache.get_many(["a", "b"]), ({"a": info}, ["b"]))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 4})
+
+    def test_invalidate(self):
+        cache = NodeTypeCache()
+        info = TypeInfo(ua.VariantType.Int32, -1, None)
+        cache.update({"a": info, "b": info})
+        cache.set_data_type("i=294", ua.VariantType.DateTime)
+
+        cache.invalidate(["a"])
+        self.assertEqual(cache.get_many(["a", "b"]), ({"b": info}, ["a"]))
+        self.assertEqual(cache.data_type("i=294"), ua.VariantType.DateTime)
+
+        cache.invalidate()
+        self.assertEqual(cache.stats()["size"], 0)
+        self.assertIsNone(cache.data_type("i=294"))
+
+
+class LastValueCacheTests(SimpleTestCase):
+    def test_update_replaces_the_entry_of_a_node(self):
+        cache = LastValueCache()
+        stamp = datetime.datetime(2024, 5, 1, 10, tzinfo=datetime.timezone.utc)
+        cache.update("ns=2;s=Speed", 1.0)
+        entry = cache.update("ns=2;s=Speed", 2.0, source_timestamp=stamp, status="Uncertain")
+        self.assertEqual(
+            {key: entry[key] for key in ("value", "source_timestamp", "server_timestamp", "status")},
+            {"value": 2.0, "source_timestamp": "2024-05-01T10:00:00+00:00", "server_timestamp": None, "status": "Uncertain"},
+        )
+        cache.update_many({"ns=2;s=Count": 3, "ns=2;s=Speed": 4.0})
+        self.assertEqual([(e["node_id"], e["value"]) for e in cache.snapshot()], [("ns=2;s=Speed", 4.0), ("ns=2;s=Count", 3)])
+        self.assertEqual([e["value"] for e in cache.snapshot(["ns=2;s=Count", "ns=2;s=Nope"])], [3])
+
+    def test_get_leaves_out_stale_entries(self):
+        cache = LastValueCache()
+        cache.update("ns=2;s=Speed", 1.0)
+        cache._entries["ns=2;s=Speed"]["received"] -= 5
+        cache.update("ns=2;s=Count", 3)
+        found, missing = cache.get(["ns=2;s=Speed", "ns=2;s=Count", "ns=2;s=Nope"], max_age_ms=1000)
+        self.assertEqual(list(found), ["ns=2;s=Count"])
+        self.assertEqual(missing, ["ns=2;s=Speed", "ns=2;s=Nope"])
+        self.assertEqual(len(cache.get(["ns=2;s=Speed"])[0]), 1)
+
+    def test_snapshot_updates_filters_by_session_and_node(self):
+        first, second = LastValueCache(), LastValueCache()
+        first.update("ns=2;s=Speed", 1.0)
+        first.update("ns=2;s=Count", 3)
+        second.update("ns=2;s=Speed", 2.0)
+        sessions = [("s1", SimpleNamespace(last_values=first)), ("s2", SimpleNamespace(last_values=second))]
+
+        def keys(updates):
+            return [(update["session_id"], update["node_id"], update["value"]) for update in updates]
+
+        self.assertEqual(len(snapshot_updates(sessions)), 3)
+        self.assertEqual(keys(snapshot_updates(sessions, {("s2", "ns=2;s=Speed")})), [("s2", "ns=2;s=Speed", 2.0)])
+        # A key without a session matches the node on every session
+        self.assertEqual(
+            keys(snapshot_updates(sessions, {(None, "ns=2;s=Speed")})),
+            [("s1", "ns=2;s=Speed", 1.0), ("s2", "ns=2;s=Speed", 2.0)],
+        )
+        self.assertEqual(snapshot_updates(sessions, set()), [])
+        self.assertNotIn("received", snapshot_updates(sessions)[0])
+
+
+class PolledTagTests(SimpleTestCase):
+    def pushed(self, tag, values):
+        return [value for value in values if tag.changed(value)]
+
+    def test_absolute_deadband(self):
+        tag = PolledTag(deadband_abs=0.5)
+        self.assertEqual(self.pushed(tag, [10, 10.4, 10.6, 10.2, 11.2, 11.2]), [10, 10.6, 11.2])
+
+    def test_percent_of_the_range(self):
+        tag = PolledTag(deadband_pct=1, eu_range=[0, 1500])
+        # 1 % of 1500 is 15
+        self.assertEqual(self.pushed(tag, [100, 110, 116, 130, 132]), [100, 116, 132])
+
+    def test_percent_of_the_last_value_without_range(self):
+        tag = PolledTag(deadband_pct=10)
+        self.assertEqual(self.pushed(tag, [100, 105, 111, 120, 125]), [100, 111, 125])
+        # A tag at 0 has no span to take a percent of, so every change goes out
+        tag = PolledTag(deadband_pct=10)
+        self.assertEqual(self.pushed(tag, [0, 0, 0.001]), [0, 0.001])
+
+    def test_nan_is_pushed_when_it_appears_and_goes_away(self):
+        nan = float("nan")
+        tag = PolledTag(deadband_abs=1)
+        pushed = self.pushed(tag, [1.0, nan, nan, 1.5, 1.6, 3.0])
+        self.assertEqual(len(pushed), 4)
+        self.assertTrue(math.isnan(pushed[1]))
+        self.assertEqual([pushed[0], pushed[2], pushed[3]], [1.0, 1.5, 3.0])
+
+    def test_non_numeric_values_push_on_any_change(self):
+        tag = PolledTag(deadband_abs=10)
+        self.assertEqual(self.pushed(tag, ["Run", "Run", "Stop", "Stop", "Run"]), ["Run", "Stop", "Run"])
+
+
+class FlakyClient:
+    """Session whose first keepalive fails and whose first reconnect attempt is refused"""
+    url = "opc.tcp://plc"
+
+    def __init__(self):
+        self.keepalives = 0
+        self.attempts = 0
+
+    def keepalive(self):
+        self.keepalives += 1
+        if self.keepalives == 1:
+            raise ConnectionError("Connection is closed")
+
+    def reconnect(self):
+        self.attempts += 1
+        if self.attempts == 1:
+            raise ConnectionRefusedError("Connection refused")
+        return 0, 2
+
+
+@override_settings(
+    OPCUA_KEEPALIVE_INTERVAL_MS=10, OPCUA_RECONNECT_MIN_DELAY_MS=10, OPCUA_RECONNECT_MAX_DELAY_MS=40
+)
+class ReconnectSupervisorTests(SimpleTestCase):
+    def test_backoff_doubles_up_to_the_maximum(self):
+        delays = ReconnectSupervisor(FlakyClient()).delays()
+        for expected in (0.01, 0.02, 0.04, 0.04):
+            self.assertAlmostEqual(next(delays), expected, delta=expected * 0.2)
+
+    def test_reconnects_after_failed_keepalive(self):
+        observed = (reconnect_seconds.count(server=FlakyClient.url), reconnect_gap_seconds.count(server=FlakyClient.url))
+        supervisor = ReconnectSupervisor(FlakyClient())
+        supervisor.start()
+        self.addCleanup(supervisor.stop)
+        deadline = time.monotonic() + 3
+        while supervisor.stats()["reconnects"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        stats = supervisor.stats()
+        self.assertEqual(stats["state"], "connected")
+        self.assertEqual((stats["reconnects"], stats["failed_attempts"], stats["recreated_subscriptions"]), (1, 1, 2))
+        self.assertGreaterEqual(stats["last_gap_ms"], stats["last_reconnect_ms"])
+        self.assertEqual(
+            (reconnect_seconds.count(server=FlakyClient.url), reconnect_gap_seconds.count(server=FlakyClient.url)),
+            (observed[0] + 1, observed[1] + 1)
+        )
+
+
+class ServerExecutorTests(SimpleTestCase):
+    async def test_full_executor_rejects_and_timeouts_drop_queued_calls(self):
+        executor = ServerExecutor("test", workers=1, queue=1)
+        release = threading.Event()
+        calls = []
+
+        def slow_read(name):
+            calls.append(name)
+            release.wait(3)
+            return name
+
+        running = asyncio.ensure_future(executor.run(slow_read, "running"))
+        await asyncio.sleep(0.05)
+        with self.assertRaises(asyncio.TimeoutError):
+            await executor.run(slow_read, "queued", timeout=0.05)
+        queued = asyncio.ensure_future(executor.run(slow_read, "second"))
+        await asyncio.sleep(0.05)
+        with self.assertRaises(ServerBusy):
+            await executor.run(slow_read, "rejected")
+
+        release.set()
+        self.assertEqual(await running, "running")
+        self.assertEqual(await queued, "second")
+        # The call that timed out in the queue never reached the server
+        self.assertEqual(calls, ["running", "second"])
+        self.assertEqual(executor.stats()["pending"], 0)
+        self.assertEqual((executor.stats()["rejected"], executor.stats()["timed_out"]), (1, 1))
+
+
+class ReadCoalescerTests(SimpleTestCase):
+    def read_concurrently(self, coalescer, requests, fetch):
+        results = {}
+
+        def read(index, node_ids):
+            try:
+                results[index] = coalescer.read(node_ids, fetch)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=read, args=item) for item in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_reads_behind_a_read_in_flight_share_one_read(self):
+        reads = []
+        first_started = threading.Event()
+        release = threading.Event()
+
+        def fetch(node_ids):
+            reads.append(sorted(node_ids))
+            if len(reads) == 1:
+                first_started.set()
+                release.wait(3)
+            return {nid: nid.upper() for nid in node_ids}
+
+        coalescer = ReadCoalescer(window_ms=200)
+        results = {}
+        threads = [
+            threading.Thread(target=lambda index=index, node_ids=node_ids: results.update({
+                index: coalescer.read(node_ids, fetch)
+            }))
+            for index, node_ids in enumerate([["a", "b"], ["b", "c"], ["c"], ["a"]])
+        ]
+        threads[0].start()
+        self.assertTrue(first_started.wait(3))
+        for thread in threads[1:]:
+            thread.start()
+        while coalescer.stats()["requests"] < 4:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+        # ["a"] waited for the read in flight; the others were merged into the next one
+        self.assertEqual(reads, [["a", "b"], ["b", "c"]])
+        self.assertEqual(results, {0: {"a": "A", "b": "B"}, 1: {"b": "B", "c": "C"}, 2: {"c": "C"}, 3: {"a": "A"}})
+
+    def test_uncontended_read_skips_the_window(self):
+        coalescer = ReadCoalescer(window_ms=10000)
+        started = time.monotonic()
+        self.assertEqual(coalescer.read(["a"], lambda node_ids: {"a": 1}), {"a": 1})
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_bad_node_only_fails_its_caller(self):
+        def fetch(node_ids):
+            if "bad" in node_ids:
+                raise ValueError("BadNodeIdUnknown")
+            return {nid: 1 for nid in node_ids}
+
+        results = self.read_concurrently(ReadCoalescer(window_ms=50), [["a"], ["bad"]], fetch)
+        self.assertEqual(results[0], {"a": 1})
+        self.assertIsInstance(results[1], ValueError)
+
+
+class OperationLimitsTests(SimpleTestCase):
+    def test_chunks_keep_order(self):
+        self.assertEqual(chunked([1, 2, 3, 4, 5], 2), [[1, 2], [3, 4], [5]])
+        self.assertEqual(chunked([1, 2, 3], 0), [[1, 2, 3]])
+
+    @override_settings(OPCUA_MAX_NODES_PER_REQUEST=1000)
+    def test_lower_of_server_limit_and_setting(self):
+        limits = OperationLimits(max_read=250, max_write=0)
+        self.assertEqual((limits.read_size, limits.write_size), (250, 1000))
+
+    @override_settings(OPCUA_MAX_NODES_PER_REQUEST=0)
+    def test_no_limit_at_all(self):
+        self.assertEqual(OperationLimits().read_size, 0)
+
+
+class BenchmarkRegressionTests(SimpleTestCase):
+    baseline = {
+        "config": {"seconds": 2.0},
+        "read": [{"batch": 10, "values_per_s": 1000.0, "p99_ms": 10.0}],
+        "memory": {"item_bytes": 600.0},
+    }
+
+    def test_direction_depends_on_unit(self):
+        result = {
+            "config": {"seconds": 1.0},
+            "read": [{"batch": 10, "values_per_s": 700.0, "p99_ms": 8.0}],
+            "memory": {"item_bytes": 800.0},
+        }
+        self.assertEqual(regressions(result, self.baseline, tolerance=0.2), {
+            "read.batch=10.values_per_s": (1000.0, 700.0),
+            "memory.item_bytes": (600.0, 800.0),
+        })
+
+    def test_within_tolerance(self):
+        result = {"read": [{"batch": 10, "values_per_s": 900.0, "p99_ms": 11.0}], "memory": {"item_bytes": 650.0}}
+        self.assertEqual(regressions(result, self.baseline, tolerance=0.2), {})
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("opcua_test_seconds", "Test", ["operation"], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, operation="read")
+        lines = histogram.render()
+        self.assertIn('opcua_test_seconds_bucket{operation="read",le="0.1"} 1', lines)
+        self.assertIn('opcua_test_seconds_bucket{operation="read",le="1.0"} 2', lines)
+        self.assertIn('opcua_test_seconds_bucket{operation="read",le="+Inf"} 3', lines)
+        self.assertIn('opcua_test_seconds_count{operation="read"} 3', lines)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("opcua_test_total", "Test", ["server"])
+        counter.inc(server='opc.tcp://"plc"')
+        self.assertIn('opcua_test_total{server="opc.tcp://\\"plc\\""} 1', counter.render())
+
+    def test_timed_counts_errors(self):
+        class Client:
+            @timed("test_write", nodes=True)
+            def write_value(self, node_ids, values):
+                raise ValueError("BadTypeMismatch")
+
+        with self.assertRaises(ValueError):
+            Client().write_value(["a", "b"], [1, 2])
+        self.assertEqual(request_errors.value(operation="test_write"), 1)
+        self.assertEqual(request_nodes.count(operation="test_write"), 1)
+
+
+class OutboxTests(SimpleTestCase):
+    def update(self, node_id, value):
+        return {"session_id": "s1", "node_id": node_id, "value": value}
+
+    def test_keeps_latest_value_per_node(self):
+        outbox = Outbox(max_in_flight=1)
+        outbox.add([self.update("a", 1), self.update("b", 1)])
+        outbox.add([self.update("a", 2)])
+        updates, replaced = outbox.take()
+        self.assertEqual([(u["node_id"], u["value"]) for u in updates], [("a", 2), ("b", 1)])
+        self.assertEqual(replaced, 1)
+        self.assertEqual(len(outbox), 0)
+
+    def test_window_counts_unacknowledged_frames(self):
+        outbox = Outbox(max_in_flight=2)
+        for _ in range(3):
+            outbox.sent()
+        # Clients that never acknowledge are not held back
+        self.assertTrue(outbox.can_send())
+        outbox.ack(1)
+        self.assertFalse(outbox.can_send())
+        outbox.ack(2)
+        self.assertTrue(outbox.can_send())
+        self.assertEqual(outbox.stats()["in_flight"], 1)
+
+    def test_too_many_nodes_is_too_slow(self):
+        outbox = Outbox(max_nodes=1)
+        outbox.add([self.update("a", 1)])
+        self.assertIsNone(outbox.too_slow())
+        outbox.add([self.update("b", 1)])
+        self.assertIsNotNone(outbox.too_slow())
+
+    def test_batch_that_waited_too_long_is_too_slow_without_acks(self):
+        outbox = Outbox(max_lag_ms=1000)
+        self.assertFalse(outbox.acking)
+        self.assertIsNone(outbox.too_slow(queued_ms=500))
+        self.assertIn("waited 1500ms", outbox.too_slow(queued_ms=1500))
+        self.assertEqual(outbox.send_timeout, 1)
+        self.assertIsNone(Outbox(max_lag_ms=0).too_slow(queued_ms=10 ** 6))
+
+
+@override_settings(OPCUA_WS_MAX_IN_FLIGHT=1)
+class SlowSocketTests(SimpleTestCase):
+    async def publish(self, node_id, value):
+        batcher = NotificationBatcher()
+        batcher.add("s1", node_id, value)
+        await get_channel_layer().group_send(batcher.group, batcher.take())
+
+    async def test_held_back_updates_are_conflated(self):
+        communicator = WebsocketCommunicator(OPCConsumer.as_asgi(), "/ws/socket-server/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({"action": "ack", "frames": 0})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+
+        await self.publish("ns=2;s=Speed", 1)
+        first = await communicator.receive_json_from(timeout=3)
+        self.assertNotIn("conflated", first)
+        # The first frame is not acknowledged yet, so these wait and only the last one is kept
+        await self.publish("ns=2;s=Speed", 2)
+        await self.publish("ns=2;s=Speed", 3)
+        self.assertTrue(await communicator.receive_nothing(0.1))
+
+        await communicator.send_json_to({"action": "ack", "frames": 1})
+        frame = await communicator.receive_json_from(timeout=3)
+        self.assertTrue(frame["conflated"])
+        self.assertEqual([update["value"] for update in frame["updates"]], [3])
+        await communicator.disconnect()
+
+    async def test_socket_behind_the_channel_layer_is_closed_without_acks(self):
+        communicator = WebsocketCommunicator(OPCConsumer.as_asgi(), "/ws/socket-server/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        batcher = NotificationBatcher()
+        batcher.add("s1", "ns=2;s=Speed", 1)
+        message = batcher.take()
+        message["created"] -= 60
+        await get_channel_layer().group_send(batcher.group, message)
+        output = await communicator.receive_output(timeout=3)
+        self.assertEqual(output, {"type": "websocket.close", "code": 4008})
+
+    @override_settings(OPCUA_WS_MAX_LAG_MS=100)
+    async def test_socket_whose_send_blocks_is_dropped(self):
+        communicator = WebsocketCommunicator(OPCConsumer.as_asgi(), "/ws/socket-server/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        async def blocked(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        with mock.patch.object(AsyncWebsocketConsumer, "send", blocked):
+            await communicator.send_json_to({"action": "subscribe", "node_ids": ["ns=2;s=Speed"]})
+            # The consumer gives up on the socket instead of waiting for the client to read
+            await communicator.wait(timeout=3)
+
+
+class ConsumerMessageTests(SimpleTestCase):
+    async def test_malformed_messages_are_answered_with_errors(self):
+        communicator = WebsocketCommunicator(OPCConsumer.as_asgi(), "/ws/socket-server/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({"action": "subscribe", "node_ids": ["ns=2;s=Speed"]})
+        self.assertEqual((await communicator.receive_json_from(timeout=3))["node_ids"], ["ns=2;s=Speed"])
+
+        for message, error in [
+            (["subscribe"], "Messages must be JSON objects"),
+            ("subscribe", "Messages must be JSON objects"),
+            ({"action": "unsubscribe", "node_ids": "ns=2;s=Speed"}, "node_ids must be a list or '*'"),
+        ]:
+            await communicator.send_json_to(message)
+            self.assertEqual(await communicator.receive_json_from(timeout=3), {"type": "error", "message": error})
+
+        # The socket is still served and its interest untouched
+        await communicator.send_json_to({"action": "unsubscribe", "node_ids": ["ns=2;s=Speed"]})
+        self.assertEqual(await communicator.receive_json_from(timeout=3), {"type": "interest", "node_ids": []})
+        await communicator.disconnect()
+
+
+class VariantConverterTests(SimpleTestCase):
+    converter = VariantConverter(ua)
+
+    # (VariantType name, ValueRank, JSON value, Python value or the exception it raises)
+    cases = [
+        ("Boolean", -1, "on", True),
+        ("Boolean", -1, 0, False),
+        ("Boolean", -1, "maybe", ValueError),
+        ("SByte", -1, "-5", -5),
+        ("SByte", -1, 200, OverflowError),
+        ("Byte", -1, "0x10", 16),
+        ("Byte", -1, -1, OverflowError),
+        ("Int16", -1, 7.0, 7),
+        ("Int16", -1, 7.5, ValueError),
+        ("Int16", -1, 40000, OverflowError),
+        ("UInt16", -1, "65535", 65535),
+        ("Int32", -1, " 12 ", 12),
+        ("UInt32", -1, 4294967295, 4294967295),
+        ("UInt32", 1, [1, "2"], [1, 2]),
+        ("UInt32", 1, [1, -2], OverflowError),
+        ("Int64", -1, 2 ** 40, 2 ** 40),
+        ("UInt64", -1, 2 ** 63, 2 ** 63),
+        ("Float", -1, "1.5", 1.5),
+        ("Float", -1, 1e39, OverflowError),
+        ("Float", 1, [1, "2.5"], [1.0, 2.5]),
+        ("Float", 1, [0.5, float("inf")], [0.5, float("inf")]),
+        ("Float", 1, [0.5, 1e39], OverflowError),
+        ("Double", -1, "2.25", 2.25),
+        ("Double", 1, "[1, 2.5]", [1.0, 2.5]),
+        ("Double", 1, ["x"], ValueError),
+        ("String", -1, 5, "5"),
+        ("String", 1, ["a", 1], ["a", "1"]),
+        ("DateTime", -1, "2024-05-01T10:00:00", datetime.datetime(2024, 5, 1, 10, tzinfo=datetime.timezone.utc)),
+        ("DateTime", -1, 0, datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)),
+        ("DateTime", -1, "yesterday", ValueError),
+        ("Guid", -1, "72962b91-fa75-4ae6-8d28-b404dc7daf63", uuid.UUID("72962b91-fa75-4ae6-8d28-b404dc7daf63")),
+        ("Guid", -1, "not-a-guid", ValueError),
+        ("ByteString", -1, "AQI=", b"\x01\x02"),
+        ("ByteString", -1, [1, 2], b"\x01\x02"),
+        ("ByteString", -1, [256], ValueError),
+        ("XmlElement", -1, "<a/>", "<a/>"),
+        ("NodeId", -1, "ns=2;s=Speed", ua.NodeId("Speed", 2)),
+        ("NodeId", -1, "nonsense", Exception),
+        ("ExpandedNodeId", -1, "ns=2;i=5", ua.ExpandedNodeId(5, 2)),
+        ("StatusCode", -1, "0x80340000", ua.StatusCode(0x80340000)),
+        ("QualifiedName", -1, "2:Speed", ua.QualifiedName("Speed", 2)),
+        ("LocalizedText", -1, "Speed", ua.LocalizedText("Speed")),
+        ("DiagnosticInfo", -1, 1, ValueError),
+    ]
+
+    # BaseDataType nodes: (JSON value, VariantType name it is written as, or the exception)
+    variant_cases = [
+        (True, "Boolean"),
+        (1, "Int32"),
+        (2 ** 40, "Int64"),
+        (1.5, "Double"),
+        ("x", "String"),
+        ([1, 2 ** 40], "Int64"),
+        ([1, 2.5], "Double"),
+        ([1, "a"], ValueError),
+        ([], ValueError),
+        (None, ValueError),
+        ({"a": 1}, ValueError),
+    ]
+
+    def type_info(self, name, value_rank):
+        return TypeInfo(getattr(ua.VariantType, name), value_rank, None)
+
+    def test_every_variant_type(self):
+        for name, value_rank, value, expected in self.cases:
+            with self.subTest(name=name, value=value):
+                if isinstance(expected, type) and issubclass(expected, Exception):
+                    with self.assertRaises(expected):
+                        self.converter.convert(value, self.type_info(name, value_rank))
+                else:
+                    self.assertEqual(self.converter.convert(value, self.type_info(name, value_rank)), expected)
+
+    def test_base_data_type_takes_the_type_of_the_value(self):
+        for value, expected in self.variant_cases:
+            with self.subTest(value=value):
+                type_info = self.type_info("Variant", -2)
+                if isinstance(expected, type):
+                    with self.assertRaises(expected):
+                        self.converter.to_data_value(value, type_info)
+                else:
+                    data_value = self.converter.to_data_value(value, type_info)
+                    self.assertEqual(data_value.Value.VariantType, getattr(ua.VariantType, expected))
+                    self.assertEqual(data_value.Value.Value, value)
+
+
+class WriteQueueTests(SimpleTestCase):
+    def test_writes_in_window_share_one_write(self):
+        writes = []
+
+        def write(node_ids, values):
+            writes.append(dict(zip(node_ids, values)))
+            return {nid: "Good" for nid in node_ids}
+
+        queue = WriteQueue(write, window_ms=50)
+        first = queue.submit(["a", "b"], [1, 1])
+        second = queue.submit(["a"], [2])
+        self.assertEqual(first.result(3), {"a": "Superseded", "b": "Good"})
+        self.assertEqual(second.result(3), {"a": "Good"})
+        # Last value wins
+        self.assertEqual(writes, [{"b": 1, "a": 2}])
+        self.assertEqual(queue.stats()["superseded"], 1)
+
+    def test_full_batch_goes_out_before_the_window(self):
+        queue = WriteQueue(lambda node_ids, values: {nid: "Good" for nid in node_ids}, window_ms=10000, max_nodes=2)
+        ticket = queue.submit(["a", "b"], [1, 2])
+        self.assertEqual(ticket.result(3), {"a": "Good", "b": "Good"})
+
+    def test_batches_are_written_in_the_order_they_closed(self):
+        writes = []
+        first_started = threading.Event()
+        release = threading.Event()
+
+        def write(node_ids, values):
+            if not writes:
+                first_started.set()
+                release.wait(3)
+            writes.append(values)
+            return {nid: "Good" for nid in node_ids}
+
+        queue = WriteQueue(write, window_ms=10000, max_nodes=1)
+        first = queue.submit(["a"], [1])
+        self.assertTrue(first_started.wait(3))
+        # Each closes its own batch while the first is still being written
+        later = [queue.submit(["a"], [value]) for value in range(2, 6)]
+        self.assertEqual(queue.stats()["queued"], 4)
+        release.set()
+        for ticket in [first] + later:
+            ticket.result(3)
+        self.assertEqual(writes, [[1], [2], [3], [4], [5]])
+
+    def test_flush_skips_the_window(self):
+        writes = []
+
+        def write(node_ids, values):
+            writes.append(node_ids)
+            return {nid: "Good" for nid in node_ids}
+
+        queue = WriteQueue(write, window_ms=10000)
+        queue.submit(["a"], [1])
+        started = time.monotonic()
+        ticket = queue.submit(["b"], [2], flush=True)
+        self.assertEqual(ticket.result(3), {"b": "Good"})
+        self.assertLess(time.monotonic() - started, 1)
+        # The write queued before it went out in the same batch
+        self.assertEqual(writes, [["a", "b"]])
+
+    def test_tracked_tickets_are_bounded(self):
+        queue = WriteQueue(lambda node_ids, values: {nid: "Good" for nid in node_ids}, window_ms=0, max_tickets=2)
+        tickets = [queue.track(queue.submit([nid], [1])) for nid in "abc"]
+        self.assertIsNone(queue.ticket(tickets[0].id))
+        self.assertEqual(queue.ticket(tickets[2].id).result(3), {"c": "Good"})
+
+    def test_failed_write_reaches_every_caller(self):
+        def write(node_ids, values):
+            raise ConnectionError("Connection is closed")
+
+        queue = WriteQueue(write, window_ms=20)
+        tickets = [queue.submit(["a"], [1]), queue.submit(["b"], [2])]
+        for ticket in tickets:
+            with self.assertRaises(ConnectionError):
+                ticket.result(3)
+
+    async def test_wait_from_event_loop(self):
+        queue = WriteQueue(lambda node_ids, values: {nid: "BadTypeMismatch" for nid in node_ids}, window_ms=20)
+        ticket = queue.submit(["a"], [1])
+        self.assertEqual(await asyncio.wait_for(ticket.wait(), 3), {"a": "BadTypeMismatch"})
+
+
+class EventFilterTests(SimpleTestCase):
+    def test_where_clause_is_a_tree_rooted_at_the_first_element(self):
+        spec = EventFilterSpec(where={"min_severity": 500, "event_types": ["i=2915", "i=2782"]})
+        event_filter = spec.event_filter(ua)
+        elements = event_filter.WhereClause.Elements
+        self.assertEqual(elements[0].FilterOperator, ua.FilterOperator.And)
+        operators = [elements[operand.Index].FilterOperator for operand in elements[0].FilterOperands]
+        self.assertEqual(operators, [ua.FilterOperator.GreaterThanOrEqual, ua.FilterOperator.Or])
+        # Selected fields plus the ConditionId operand
+        self.assertEqual(len(event_filter.SelectClauses), len(spec.fields))
+        self.assertIn("Retain", spec.fields)
+
+    def test_unknown_where_clause_is_refused(self):
+        with self.assertRaises(ValueError):
+            EventFilterSpec(where={"severity": 500})
+
+
+class EventDispatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.events = []
+        self.published = []
+        batcher = SimpleNamespace(add_event=self.events.append, publish=self.published.append)
+        self.dispatcher = EventDispatcher("s1", "events-1", EventFilterSpec(select=["Message"]), batcher)
+
+    def notify(self, event_type, message=None, retain=None, condition_id=None):
+        # Fields in the order of spec.fields: Message, EventType, Retain, ConditionId
+        self.dispatcher.dispatch([
+            ua.Variant(message), ua.Variant(ua.NodeId.from_string(event_type)),
+            ua.Variant(retain), ua.Variant(ua.NodeId.from_string(condition_id) if condition_id else None),
+        ])
+
+    def test_refresh_replaces_alarms_in_one_frame(self):
+        self.notify("i=2915", "old", True, "ns=2;s=Old")
+        self.notify("i=2915", "kept", True, "ns=2;s=Kept")
+        self.notify("i=2787")
+        self.notify("i=2915", "kept", True, "ns=2;s=Kept")
+        self.notify("i=2788")
+        # Refreshed conditions are not events; the alarms frame carries them
+        self.assertEqual([event["Message"] for event in self.events], ["old", "kept"])
+        self.assertEqual(len(self.published), 1)
+        self.assertEqual([alarm["Message"] for alarm in self.published[0]["alarms"]], ["kept"])
+
+    def test_condition_no_longer_retained_is_dropped(self):
+        self.notify("i=2915", "on", True, "ns=2;s=A")
+        self.notify("i=2915", "off", False, "ns=2;s=A")
+        self.notify("i=2041", "plain")
+        self.assertEqual(self.dispatcher.alarms.snapshot(), [])
+        self.assertEqual(len(self.events), 3)
+
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class PlantServerTestCase(SimpleTestCase):
+    """
+    Runs a python-opcua server in this process for client tests.
+
+    Objects/2:Plant holds the writable variables Speed (Double), Count (Int32)
+    and Name (String), all in namespace 2.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from opcua import Server
+
+        cls.url = f"opc.tcp://127.0.0.1:{free_port()}/"
+        cls.server = Server()
+        cls.server.set_endpoint(cls.url)
+        cls.server.register_namespace("urn:opcua-tests")
+        cls.plant = cls.server.get_objects_node().add_folder(ua.NodeId("Plant", 2), "2:Plant")
+        for name, value, variant_type in (
+            ("Speed", 1.5, ua.VariantType.Double),
+            ("Count", 3, ua.VariantType.Int32),
+            ("Name", "Line 1", ua.VariantType.String),
+        ):
+            cls.plant.add_variable(ua.NodeId(name, 2), f"2:{name}", value, variant_type).set_writable()
+        cls.server.start()
+        cls.cache_dir = tempfile.TemporaryDirectory()
+        cls.settings_override = override_settings(OPCUA_PATH_CACHE_DIR=cls.cache_dir.name)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.cache_dir.cleanup()
+        cls.server.stop()
+        super().tearDownClass()
+
+    def endpoint(self):
+        return {"endpoint_url": self.url, "security_level": 0, "security_mode": "1", "security_policy_uri": ""}
+
+
+class OPCUAClientTests(PlantServerTestCase):
+    @contextlib.contextmanager
+    def session(self):
+        client = OPCUAClient(self.url, session_id="sync-tests")
+        client.configure(self.endpoint(), None, None)
+        client.connect()
+        try:
+            yield client
+        finally:
+            client.disconnect()
+
+    def test_unknown_node_fails_alone_in_a_write_batch(self):
+        with self.session() as client:
+            statuses = client.write_value(["ns=2;s=Speed", "ns=2;s=Nope"], [4.0, 1])
+            self.assertEqual(statuses, {"ns=2;s=Speed": "Good", "ns=2;s=Nope": "BadNodeIdUnknown"})
+            self.assertEqual(client.read_value(["ns=2;s=Speed"]), {"ns=2;s=Speed": 4.0})
+
+            # Through the write queue too, and the unknown node is not cached as a type
+            statuses = client.write_queued(["ns=2;s=Nope", "ns=2;s=Count"], [1, 5])
+            self.assertEqual(statuses, {"ns=2;s=Nope": "BadNodeIdUnknown", "ns=2;s=Count": "Good"})
+            self.assertEqual(client.type_cache.get_many(["ns=2;s=Nope"])[0], {})
+
+    def test_batch_of_unknown_nodes_writes_nothing(self):
+        with self.session() as client:
+            self.assertEqual(client.write_queued(["ns=2;s=Nope"], [1]), {"ns=2;s=Nope": "BadNodeIdUnknown"})
+            self.assertEqual(client.writes.stats()["writes"], 0)
+
+    def test_write_types_are_read_once(self):
+        with self.session() as client:
+            with mock.patch.object(client, '_type_attributes', wraps=client._type_attributes) as lookup:
+                client.write_value(["ns=2;s=Speed", "ns=2;s=Count"], [2.5, 4])
+                client.write_value(["ns=2;s=Count", "ns=2;s=Speed"], [5, 3.5])
+            self.assertEqual(lookup.call_count, 1)
+            self.assertEqual(client.type_cache.stats(), {"size": 2, "hits": 2, "misses": 2})
+            self.assertEqual(client.read_value(["ns=2;s=Speed", "ns=2;s=Count"]), {"ns=2;s=Speed": 3.5, "ns=2;s=Count": 5})
+
+    def test_resolved_data_types_are_memoized(self):
+        with self.session() as client:
+            utc_time = ua.NodeId(294)
+            with mock.patch.object(client.client, 'get_node', wraps=client.client.get_node) as get_node:
+                self.assertEqual(client._variant_type(utc_time), ua.VariantType.DateTime)
+                self.assertEqual(client._variant_type(utc_time), ua.VariantType.DateTime)
+            self.assertEqual(get_node.call_count, 1)
+            self.assertEqual(client.type_cache.data_type("i=294"), ua.VariantType.DateTime)
+
+            # A new session starts from scratch
+            client.reconnect()
+            self.assertIsNone(client.type_cache.data_type("i=294"))
+            self.assertEqual(client.type_cache.stats()["size"], 0)
+
+    def test_registered_handles_are_used_on_the_hot_path(self):
+        with self.session() as client:
+            speed = client.get_nodes(["ns=2;s=Speed"])[0]
+            self.assertIs(client.get_nodes(["ns=2;s=Speed"])[0], speed)
+
+            client.register_nodes(["ns=2;s=Speed", "ns=2;s=Count"])
+            registered = client.registered_nodes["ns=2;s=Speed"]
+            self.assertIs(client.get_nodes(["ns=2;s=Speed"])[0], registered)
+            self.assertEqual(client.read_value(["ns=2;s=Speed", "ns=2;s=Count"]), {"ns=2;s=Speed": 1.5, "ns=2;s=Count": 3})
+
+            # Registrations come back with a new session
+            client.reconnect()
+            self.assertIs(client.get_nodes(["ns=2;s=Count"])[0], client.registered_nodes["ns=2;s=Count"])
+
+            client.unregister_nodes(["ns=2;s=Speed"])
+            self.assertNotIn("ns=2;s=Speed", client.registered_nodes)
+            self.assertIsNot(client.get_nodes(["ns=2;s=Speed"])[0], registered)
+            self.assertEqual(client.read_value(["ns=2;s=Speed"]), {"ns=2;s=Speed": 1.5})
+
+    def test_failed_replay_closes_the_new_session(self):
+        with self.session() as client:
+            client.register_nodes(["ns=2;s=Speed"])
+            refused = OPCUAError("Register: BadTooManyOperations")
+            with mock.patch("opcua.Client.close_session", autospec=True) as close_session, \
+                    mock.patch.object(client, "_replay_registrations", side_effect=refused):
+                with self.assertRaises(OPCUAError):
+                    client.reconnect()
+            close_session.assert_called_once_with(client.client)
+
+            client.reconnect()
+            self.assertEqual(client.read_value(["ns=2;s=Speed"]), {"ns=2;s=Speed": 1.5})
+
+    @override_settings(OPCUA_MAX_NODES_PER_REQUEST=2)
+    def test_browse_reads_data_types_in_chunks(self):
+        with self.session() as client:
+            with mock.patch.object(client, '_read_chunks', wraps=client._read_chunks) as read_chunks:
+                children = client.browse(["ns=2;s=Plant"])["ns=2;s=Plant"]
+            self.assertEqual(len(read_chunks.call_args.args[0]), 3)
+            self.assertEqual(
+                sorted((child["browse_name"], child["data_type"]) for child in children),
+                [("2:Count", "Int32"), ("2:Name", "String"), ("2:Speed", "Double")],
+            )
+
+    def test_subscriptions_are_shared_per_interval(self):
+        with self.session() as client:
+            sub_id = client.subscribe(["ns=2;s=Speed", "ns=2;s=Count"], 250)
+            self.assertEqual(client.subscribe(["ns=2;s=Name", "ns=2;s=Speed"], 250), sub_id)
+            self.assertEqual(set(client.subscriptions[sub_id]['handles']), {"ns=2;s=Speed", "ns=2;s=Count", "ns=2;s=Name"})
+
+            other_id = client.subscribe(["ns=2;s=Speed"], 1000)
+            self.assertNotEqual(other_id, sub_id)
+            self.assertEqual(len(client.subscriptions), 2)
+
+            # Dropping some nodes keeps the shared subscription, dropping the last one deletes it
+            client.unsubscribe(sub_id, ["ns=2;s=Speed", "ns=2;s=Count"])
+            self.assertEqual(list(client.subscriptions[sub_id]['handles']), ["ns=2;s=Name"])
+            self.assertEqual(list(client.subscriptions[sub_id]['handler'].node_names.values()), ["ns=2;s=Name"])
+            client.unsubscribe(sub_id, ["ns=2;s=Name"])
+            self.assertEqual(list(client.subscriptions), [other_id])
+
+
+
+class ConnectionPoolTests(PlantServerTestCase):
+    def test_key_tells_passwords_apart(self):
+        endpoint = self.endpoint()
+        key = OPCUAConnectionPool.make_key(endpoint, "operator", password="secret")
+        self.assertEqual(key, OPCUAConnectionPool.make_key(endpoint, "operator", password="secret"))
+        self.assertNotEqual(key, OPCUAConnectionPool.make_key(endpoint, "operator", password="guess"))
+        self.assertNotEqual(key, OPCUAConnectionPool.make_key(endpoint, "operator"))
+        self.assertNotIn("secret", repr(key))
+
+    def test_last_release_disconnects_a_shared_session(self):
+        pool = OPCUAConnectionPool()
+        session_id, created = pool.connect(self.endpoint())
+        self.assertTrue(created)
+        self.assertEqual(pool.connect(self.endpoint()), (session_id, False))
+        self.assertEqual(pool.references(session_id), 2)
+
+        self.assertEqual(pool.release(session_id), 1)
+        client = pool.get(session_id)
+        self.assertEqual(client.read_value(["ns=2;s=Count"]), {"ns=2;s=Count": 3})
+
+        self.assertEqual(pool.release(session_id), 0)
+        self.assertIsNone(pool.get(session_id))
+        self.assertIsNone(client.client)
+        with self.assertRaisesRegex(OPCUAError, "not found"):
+            pool.release(session_id)
+
+
+class SessionViewTests(PlantServerTestCase):
+    async def connect(self, use_asyncio):
+        request = APIRequestFactory().post("/", {"endpoint": self.endpoint(), "asyncio": use_asyncio}, format="json")
+        response = await OPCUAConnectView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["session_id"]
+
+    async def read_thread(self, session_id):
+        """Name of the thread the client's read ran on, going through the read view"""
+        client = pool.get(session_id)
+        threads = []
+        read_status = client.read_status
+
+        def record(node_ids):
+            threads.append(threading.current_thread().name)
+            return read_status(node_ids)
+
+        async def record_async(node_ids):
+            threads.append(threading.current_thread().name)
+            return await read_status(node_ids)
+
+        request = APIRequestFactory().post("/", {"node_ids": ["ns=2;s=Count"]}, format="json")
+        wrapper = record_async if inspect.iscoroutinefunction(read_status) else record
+        with mock.patch.object(client, "read_status", wrapper):
+            response = await OPCUADataView.as_view()(request, session_id=session_id)
+        self.assertEqual(response.data, {"ns=2;s=Count": 3})
+        return threads[0]
+
+    async def release(self, session_id):
+        response = await OPCUASessionView.as_view()(APIRequestFactory().delete("/"), session_id=session_id)
+        self.assertEqual(response.data["references"], 0)
+        self.assertIsNone(pool.get(session_id))
+
+    async def test_asyncio_session_is_served_on_the_event_loop(self):
+        session_id = await self.connect(True)
+        self.assertEqual(await self.read_thread(session_id), threading.current_thread().name)
+        await self.release(session_id)
+
+    async def test_sync_session_is_served_on_its_server_executor(self):
+        session_id = await self.connect(False)
+        self.assertTrue((await self.read_thread(session_id)).startswith("opcua-"))
+        await self.release(session_id)
+
+
+class AsyncClientTests(PlantServerTestCase):
+    @contextlib.asynccontextmanager
+    async def session(self):
+        client = AsyncOPCUAClient(self.url, session_id="async-tests")
+        client.configure(self.endpoint(), None, None)
+        await client.connect()
+        try:
+            yield client
+        finally:
+            await client.disconnect()
+
+    async def test_write_then_read(self):
+        async with self.session() as client:
+            node_ids = ["ns=2;s=Speed", "ns=2;s=Count"]
+            # Form input arrives as text and is converted to the node's data type
+            self.assertEqual(await client.write_value(node_ids, [2.5, "7"]), {nid: "Good" for nid in node_ids})
+            self.assertEqual(await client.read_value(node_ids), {"ns=2;s=Speed": 2.5, "ns=2;s=Count": 7})
+            self.assertEqual(client.last_values.snapshot(["ns=2;s=Count"])[0]["value"], 7)
+
+    async def test_failed_replay_closes_the_new_session(self):
+        async with self.session() as client:
+            refused = OPCUAError("Register: BadTooManyOperations")
+            with mock.patch("asyncua.Client.close_session", autospec=True) as close_session, \
+                    mock.patch.object(client, "_replay_registrations", side_effect=refused):
+                with self.assertRaises(OPCUAError):
+                    await client.reconnect()
+            close_session.assert_awaited_once_with(client.client)
+
+            await client.reconnect()
+            self.assertEqual(await client.read_value(["ns=2;s=Count"]), {"ns=2;s=Count": 3})
+
+    async def test_unknown_node_fails_alone_in_a_write_batch(self):
+        async with self.session() as client:
+            statuses = await client.write_queued(["ns=2;s=Name", "ns=2;s=Nope"], ["Line 2", 1])
+            self.assertEqual(statuses, {"ns=2;s=Name": "Good", "ns=2;s=Nope": "BadNodeIdUnknown"})
+            self.assertEqual(await client.read_value(["ns=2;s=Name"]), {"ns=2;s=Name": "Line 2"})
+
+    async def test_browse_path_works_as_node_id(self):
+        async with self.session() as client:
+            path = "Objects/2:Plant/2:Name"
+            self.assertEqual(await client.translate_paths([path]), {path: "ns=2;s=Name"})
+            self.assertEqual(await client.write_value([path], ["Line 3"]), {path: "Good"})
+            self.assertEqual(await client.read_value([path]), {path: "Line 3"})
+
+    async def test_browse_lists_children_with_data_types(self):
+        async with self.session() as client:
+            children = (await client.browse(["ns=2;s=Plant"]))["ns=2;s=Plant"]
+            self.assertEqual(
+                {child["browse_name"]: child["data_type"] for child in children},
+                {"2:Speed": "Double", "2:Count": "Int32", "2:Name": "String"},
+            )
+
+    async def test_unsubscribe_deletes_monitored_items_in_one_call(self):
+        async with self.session() as client:
+            node_ids = ["ns=2;s=Speed", "ns=2;s=Count", "ns=2;s=Name"]
+            sub_id = await client.subscribe(node_ids, 100)
+            subscription = client.subscriptions[sub_id]['subscription']
+            calls = []
+            unsubscribe = subscription.unsubscribe
+
+            async def record(handles):
+                calls.append(list(handles))
+                await unsubscribe(handles)
+
+            subscription.unsubscribe = record
+            await client.unsubscribe(sub_id, node_ids[:2])
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len(calls[0]), 2)
+            self.assertEqual(list(client.subscriptions[sub_id]['handles']), ["ns=2;s=Name"])
+
+            # The last monitored item takes the subscription with it
+            await client.unsubscribe(sub_id, ["ns=2;s=Name"])
+            self.assertEqual(client.subscriptions, {})
@@ -0,0 +1,67 @@
+import threading
+from collections import namedtuple
+
+
+TypeInfo = namedtuple('TypeInfo', ['variant_type', 'value_rank', 'array_dimensions'])
+
+
+class NodeTypeCache:
+    """
+    Per-session cache of node id -> TypeInfo used on the write path.
+
+    The cache only stores entries and counts lookups; the owning client fills
+    misses with one batched Read of DataType, ValueRank and ArrayDimensions.
+    Entries are dropped on reconnect and when the server reports a model change.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._data_types = {}  # DataType NodeId string -> VariantType
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, node_ids):
+        """Return ({node_id: TypeInfo} for cached nodes, [uncached node ids])"""
+        found = {}
+        missing = []
+        with self._lock:
+            for nid in node_ids:
+                info = self._entries.get(nid)
+                if info is None:
+                    missing.append(nid)
+                else:
+                    found[nid] = info
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, list(dict.fromkeys(missing))
+
+    def update(self, entries):
+        with self._lock:
+            self._entries.update(entries)
+
+    def data_type(self, data_type_id):
+        """Return the memoized VariantType for a DataType node id, or None"""
+        with self._lock:
+            return self._data_types.get(data_type_id)
+
+    def set_data_type(self, data_type_id, variant_type):
+        with self._lock:
+            self._data_types[data_type_id] = variant_type
+
+    def invalidate(self, node_ids=None):
+        """Forget all entries, or only those for node_ids"""
+        with self._lock:
+            if node_ids is None:
+                self._entries.clear()
+                self._data_types.clear()
+            else:
+                for nid in node_ids:
+                    self._entries.pop(nid, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
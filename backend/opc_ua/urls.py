@@ -1,9 +1,20 @@
 from django.urls import path
-from .views import OPCUAConnectView, OPCUADataView, OPCUARegisterView, OPCUASubscribeView
+from .views import OPCUAConnectView, OPCUASessionView, OPCUADataView, OPCUAWriteStatusView, OPCUARegisterView, OPCUASubscribeView, OPCUAEventsView, OPCUAConditionRefreshView, OPCUAPollView, OPCUAHistoryView, OPCUARecorderView, OPCUABrowseView, OPCUATranslateView, OPCUASocketView
 
 urlpatterns = [
     path("connection/", OPCUAConnectView.as_view(), name="opcua-connection"),
-    path("read-write/", OPCUADataView.as_view(), name="opcua-read-write"),
-    path("register/", OPCUARegisterView.as_view(), name="opcua-register"),
-    path("subscribe/", OPCUASubscribeView.as_view(), name="opcua-subscribe"),
-]
\ No newline at end of file
+    path("sessions/", OPCUASessionView.as_view(), name="opcua-sessions"),
+    path("sessions/<str:session_id>/", OPCUASessionView.as_view(), name="opcua-session"),
+    path("sessions/<str:session_id>/read-write/", OPCUADataView.as_view(), name="opcua-read-write"),
+    path("sessions/<str:session_id>/writes/<str:write_id>/", OPCUAWriteStatusView.as_view(), name="opcua-write-status"),
+    path("sessions/<str:session_id>/register/", OPCUARegisterView.as_view(), name="opcua-register"),
+    path("sessions/<str:session_id>/subscribe/", OPCUASubscribeView.as_view(), name="opcua-subscribe"),
+    path("sessions/<str:session_id>/events/", OPCUAEventsView.as_view(), name="opcua-events"),
+    path("sessions/<str:session_id>/events/refresh/", OPCUAConditionRefreshView.as_view(), name="opcua-condition-refresh"),
+    path("sessions/<str:session_id>/poll/", OPCUAPollView.as_view(), name="opcua-poll"),
+    path("sessions/<str:session_id>/history/", OPCUAHistoryView.as_view(), name="opcua-history"),
+    path("sessions/<str:session_id>/recorder/", OPCUARecorderView.as_view(), name="opcua-recorder"),
+    path("sessions/<str:session_id>/browse/", OPCUABrowseView.as_view(), name="opcua-browse"),
+    path("sessions/<str:session_id>/translate/", OPCUATranslateView.as_view(), name="opcua-translate"),
+    path("sockets/", OPCUASocketView.as_view(), name="opcua-sockets"),
+]
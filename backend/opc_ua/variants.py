@@ -0,0 +1,208 @@
+import array
+import base64
+import json
+import math
+import uuid
+from datetime import datetime, timezone
+
+
+# array.array typecodes give C-speed conversion and range checks for numeric arrays
+ARRAY_TYPECODES = {
+    'SByte': 'b',
+    'Byte': 'B',
+    'Int16': 'h',
+    'UInt16': 'H',
+    'Int32': 'i',
+    'UInt32': 'I',
+    'Int64': 'q',
+    'UInt64': 'Q',
+    'Float': 'f',
+    'Double': 'd',
+}
+
+FLOAT32_MAX = 3.4028234663852886e38
+INT32_RANGE = range(-2 ** 31, 2 ** 31)
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ('true', '1', 'yes', 'on'):
+            return True
+        if text in ('false', '0', 'no', 'off'):
+            return False
+        raise ValueError(f"'{value}' is not a boolean")
+    return bool(value)
+
+
+def to_int(value):
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return int(value, 0)
+        except ValueError:
+            value = float(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{value} is not an integer")
+    return int(value)
+
+
+def to_float(value):
+    return float(value)
+
+
+def to_float32(value):
+    value = float(value)
+    if math.isfinite(value) and abs(value) > FLOAT32_MAX:
+        raise OverflowError(f"{value} is out of range for Float")
+    return value
+
+
+def to_str(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        # Unix epoch seconds
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    parsed = datetime.fromisoformat(value.strip())
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def to_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if isinstance(value, list):
+        return bytes(value)
+    # JSON carries binary data as base64 text
+    return base64.b64decode(value)
+
+
+def to_guid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def json_type(value):
+    """VariantType name a JSON scalar implies, for nodes of any data type (BaseDataType)"""
+    if isinstance(value, bool):
+        return 'Boolean'
+    if isinstance(value, int):
+        return 'Int32' if value in INT32_RANGE else 'Int64'
+    if isinstance(value, float):
+        return 'Double'
+    if isinstance(value, str):
+        return 'String'
+    raise ValueError(f"Can't tell the data type of {value!r}")
+
+
+def implied_type(value):
+    """VariantType name of a JSON scalar or array; numbers mixing integers and floats are Double"""
+    if not isinstance(value, (list, tuple)):
+        return json_type(value)
+    if not value:
+        raise ValueError("Can't tell the data type of an empty array")
+    names = {json_type(item) for item in value}
+    if len(names) == 1:
+        return names.pop()
+    if names <= {'Int32', 'Int64'}:
+        return 'Int64'
+    if names <= {'Int32', 'Int64', 'Double'}:
+        return 'Double'
+    raise ValueError("Array items must share one data type")
+
+
+def typed_array(value, typecode):
+    """List of an array converted at C speed; array.array('f') turns overflows into inf, so Float is checked"""
+    if typecode != 'f':
+        return array.array(typecode, value).tolist()
+    doubles = array.array('d', value)
+    floats = array.array('f', doubles)
+    infinite = (math.inf, -math.inf)
+    if sum(map(floats.count, infinite)) != sum(map(doubles.count, infinite)):
+        raise OverflowError("Array value out of range for Float")
+    return doubles.tolist()
+
+
+class VariantConverter:
+    """
+    Table-driven conversion of JSON values into typed DataValues.
+
+    Takes the ``ua`` module of the OPC UA library in use so python-opcua and
+    asyncua sessions share one table.
+    """
+    def __init__(self, ua):
+        self.ua = ua
+        self.converters = {
+            'Boolean': to_bool,
+            'SByte': to_int,
+            'Byte': to_int,
+            'Int16': to_int,
+            'UInt16': to_int,
+            'Int32': to_int,
+            'UInt32': to_int,
+            'Int64': to_int,
+            'UInt64': to_int,
+            'Float': to_float32,
+            'Double': to_float,
+            'String': to_str,
+            'DateTime': to_datetime,
+            'Guid': to_guid,
+            'ByteString': to_bytes,
+            'XmlElement': to_str,
+            'NodeId': lambda value: ua.NodeId.from_string(value),
+            'ExpandedNodeId': lambda value: ua.ExpandedNodeId.from_string(value),
+            'StatusCode': lambda value: ua.StatusCode(to_int(value)),
+            'QualifiedName': lambda value: ua.QualifiedName.from_string(value),
+            'LocalizedText': lambda value: ua.LocalizedText(to_str(value)),
+        }
+
+    @staticmethod
+    def is_array(value, type_info):
+        if isinstance(value, (list, tuple)):
+            # A list for a scalar ByteString is its raw bytes
+            return not (type_info.variant_type.name == 'ByteString' and type_info.value_rank == -1)
+        return False
+
+    def typed(self, value, type_info):
+        """Return (Python value, VariantType name) for a JSON value written to a node"""
+        name = type_info.variant_type.name
+
+        # Array values typed into an input field arrive as JSON text
+        if isinstance(value, str) and type_info.value_rank not in (-1, -2) and value.lstrip().startswith('['):
+            value = json.loads(value)
+
+        if name == 'Variant':
+            # BaseDataType takes any value; the JSON value decides its type
+            name = implied_type(value)
+        converter = self.converters.get(name)
+        if converter is None:
+            raise ValueError(f"Unsupported data type {name}")
+
+        typecode = ARRAY_TYPECODES.get(name)
+        if not self.is_array(value, type_info):
+            value = converter(value)
+            if typecode:
+                typed_array([value], typecode)  # raises OverflowError when out of range
+            return value, name
+
+        if typecode:
+            try:
+                return typed_array(value, typecode), name
+            except TypeError:
+                # Mixed input such as strings from a form; convert item by item
+                return typed_array(map(converter, value), typecode), name
+        return [converter(item) for item in value], name
+
+    def convert(self, value, type_info):
+        """Return the Python value for a JSON value, typed for the node's VariantType"""
+        return self.typed(value, type_info)[0]
+
+    def to_data_value(self, value, type_info):
+        ua = self.ua
+        value, name = self.typed(value, type_info)
+        return ua.DataValue(ua.Variant(value, getattr(ua.VariantType, name)))
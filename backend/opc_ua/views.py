@@ -1,18 +1,136 @@
+import asyncio
+import inspect
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from asgiref.sync import sync_to_async
 from .opc_ua_client import OPCUAClient
-from opcua import ua
+from .async_client import AsyncOPCUAClient, await_client
+from .connection_pool import pool
+from .consumers import sockets
+from .events import EventFilterSpec, snapshot_alarms
+from .executor import ServerBusy, executor_for
+from .history import first_page, ndjson_stream
+from .metrics import CONTENT_TYPE, registry
+from .recorder import recorder
+from .variants import to_datetime
+from .write_queue import write_status
+
+
+def session_not_found(session_id):
+    return Response({
+        "message": f"Session {session_id} not found. Please connect first."
+    }, status=status.HTTP_404_NOT_FOUND)
+
+
+def server_timeout(client, timeout):
+    return JsonResponse({
+        "message": f"Server {client.url} did not answer within {timeout:g}s"
+    }, status=504)
+
+
+def run_coroutine(coroutine):
+    """
+    Run a coroutine that never suspends to its end without an event loop.
+
+    A handler of a sync session only awaits await_client(), which calls the
+    blocking client in place, so it finishes on the first step.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("A handler of a sync session awaited something that needs an event loop")
+
+
+class ServerAPIView(APIView):
+    """
+    APIView that keeps OPC UA calls off the ASGI event loop, or on it for asyncio sessions.
+
+    Handlers that call the client are coroutines awaiting await_client(). For
+    an asyncio session, or without a session, they run on the event loop and
+    await the client directly. Requests for a sync session run on the bounded
+    executor of its server, where the same handlers make plain blocking calls,
+    so a slow PLC only holds up requests to that PLC; a full executor answers
+    503 at once. Session requests give up after OPCUA_REQUEST_TIMEOUT_MS.
+    Handlers that are not coroutines run in a worker thread of their own.
+    """
+    # Django's check wants all handlers sync or all async; async_view picks per request instead
+    view_is_async = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
 
-client = None
+        async def async_view(request, *args, **kwargs):
+            client = pool.get(kwargs['session_id']) if 'session_id' in kwargs else None
+            timeout = getattr(settings, 'OPCUA_REQUEST_TIMEOUT_MS', 10000) / 1000
+            handler = getattr(cls, request.method.lower(), None)
+            if inspect.iscoroutinefunction(handler) and (client is None or isinstance(client, AsyncOPCUAClient)):
+                self = cls(**initkwargs)
+                self.setup(request, *args, **kwargs)
+                if client is None:
+                    return await self.dispatch_async(request, *args, **kwargs)
+                try:
+                    return await asyncio.wait_for(self.dispatch_async(request, *args, **kwargs), timeout)
+                except asyncio.TimeoutError:
+                    return server_timeout(client, timeout)
+            if client is None:
+                return await sync_to_async(view, thread_sensitive=False)(request, *args, **kwargs)
+            try:
+                return await executor_for(client.url).run(view, request, *args, timeout=timeout, **kwargs)
+            except ServerBusy as e:
+                response = JsonResponse({"message": f"Server {client.url} is busy: {e}"}, status=503)
+                response['Retry-After'] = '1'
+                return response
+            except asyncio.TimeoutError:
+                return server_timeout(client, timeout)
 
-class OPCUAConnectView(APIView):
+        # csrf_exempt, cls and initkwargs set by APIView.as_view
+        async_view.__dict__.update(view.__dict__)
+        return async_view
+
+    def perform_authentication(self, request):
+        # The API has no users; authenticating eagerly would load the Django session from the database
+        pass
+
+    async def dispatch_async(self, request, *args, **kwargs):
+        """APIView.dispatch awaiting coroutine handlers"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def dispatch(self, request, *args, **kwargs):
+        # On a worker thread; handlers of sync sessions never suspend
+        return run_coroutine(self.dispatch_async(request, *args, **kwargs))
+
+
+class OPCUAConnectView(ServerAPIView):
 
     def get(self, request):
         """
         Retrieve available endpoints from the OPC UA server.
         """
-        global client
         url = request.query_params.get('url')
         if not url:
             return Response(
@@ -30,94 +148,149 @@ class OPCUAConnectView(APIView):
                 )
         except Exception as e:
             return Response(
-                {"message": {str(e)}},
+                {"message": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         finally:
             client_endpoint = None
 
+        sessions = pool.find(url)
+        status_msg = "connected" if sessions else "disconnected"
+        return Response({
+            "status": status_msg,
+            "sessions": sessions,
+            "endpoints": endpoints
+        }, status=status.HTTP_200_OK)
 
-        status_msg = "connected" if client else "disconnected"
-        return Response({"status": status_msg, "endpoints": endpoints}, status=status.HTTP_200_OK)
-
-    def post(self, request):
+    async def post(self, request):
         """Connect to OPC UA server with selected endpoint"""
-        global client
         endpoint = request.data.get('endpoint')
         username = request.data.get('username')
         password = request.data.get('password')
-        print(endpoint, username, password)
-        if client:
-            return Response({
-                "message": "Already connected to OPC UA server. Please disconnect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+        use_asyncio = bool(request.data.get('asyncio', False))
 
         if not endpoint:
             return Response({
                 "message": "Endpoint selection is required"
             }, status=status.HTTP_400_BAD_REQUEST)
-        
+
         if int(endpoint["security_level"]) != 0:
             if not username or not password:
                 return Response({
                     "message": "Username and password are required for secure connection"
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-        client = OPCUAClient(endpoint['endpoint_url'])
-        client.configure(endpoint, username, password)
         try:
-            # Connect with configured security
-            client.connect()
+            # Connect with configured security, or reuse a matching open session
+            if use_asyncio:
+                # asyncio sessions live on the ASGI event loop next to the consumers
+                session_id, created = await pool.connect_async(endpoint, username, password)
+            else:
+                session_id, created = await sync_to_async(pool.connect, thread_sensitive=False)(
+                    endpoint, username, password
+                )
         except Exception as e:
-            client = None
             return Response(
                 {"message": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        
-        return Response({"message": "Connected to OPC UA Server"}, status=status.HTTP_200_OK)
 
-    def delete(self, request):
-        """Disconnect from OPC UA server"""
-        global client
+        return Response({
+            "message": "Connected to OPC UA Server" if created else "Already connected to OPC UA Server",
+            "session_id": session_id
+        }, status=status.HTTP_200_OK)
+
+
+class OPCUASessionView(ServerAPIView):
+    def get(self, request, session_id=None):
+        """List pooled sessions, or describe a single one"""
+        if session_id is None:
+            sessions = {
+                sid: {
+                    "endpoint_url": client.url,
+                    "security_policy_uri": client.endpoint.get('security_policy_uri'),
+                    "security_mode": client.endpoint.get('security_mode'),
+                    "username": client.username,
+                }
+                for sid, client in pool.sessions()
+            }
+            return Response({"sessions": sessions}, status=status.HTTP_200_OK)
+
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server"
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
+        return Response({
+            "session_id": session_id,
+            "endpoint_url": client.url,
+            "security_policy_uri": client.endpoint.get('security_policy_uri'),
+            "security_mode": client.endpoint.get('security_mode'),
+            "username": client.username,
+            "references": pool.references(session_id),
+            "registered_nodes": len(client.registered_nodes),
+            "subscriptions": len(client.subscriptions),
+            "type_cache": client.type_cache.stats(),
+            "browse_cache": client.browse_cache.stats(),
+            "reconnect": client.supervisor.stats(),
+            "executor": executor_for(client.url).stats(),
+            "reads": client.reads.stats(),
+            "writes": client.writes.stats(),
+            "operation_limits": client.limits.stats() if client.limits else None,
+        }, status=status.HTTP_200_OK)
+
+    async def delete(self, request, session_id=None):
+        """Release a session, disconnecting it from its OPC UA server once no caller holds it"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
         try:
-            client.disconnect()
-            return Response({
-                "message": "Disconnected from OPC UA Server"
+            if isinstance(client, AsyncOPCUAClient):
+                remaining = await pool.release_async(session_id)
+            else:
+                remaining = pool.release(session_id)
+            return Response({
+                "message": "Disconnected from OPC UA Server" if not remaining else "Released OPC UA session",
+                "session_id": session_id,
+                "references": remaining,
             }, status=status.HTTP_200_OK)
-        except ConnectionError as e:
+        except Exception as e:
             return Response({
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        finally:
-            client = None
 
-class OPCUADataView(APIView):
-    def post(self, request):
+
+class OPCUADataView(ServerAPIView):
+    async def post(self, request, session_id):
         """Read value(s) from OPC UA node(s)"""
         node_ids = request.data.get('node_ids')
         if not node_ids:
             return Response({
                 "message": "node_ids is required"
             }, status=status.HTTP_400_BAD_REQUEST)
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
+        max_age = request.data.get('max_age')
+        with_status = bool(request.data.get('status', False))
         try:
-
-            values = client.read_value(node_ids)
+            await await_client(client.resolve_paths, node_ids)
+            if max_age is None:
+                cached, missing = {}, node_ids
+            else:
+                # Serve values the cache saw within max_age ms; read only the rest from the server
+                cached, missing = client.last_values.get(node_ids, float(max_age))
+            results = await await_client(client.read_status, missing) if missing else {}
+            results.update((nid, (entry["value"], entry["status"])) for nid, entry in cached.items())
+            if with_status:
+                values = {nid: {"value": results[nid][0], "status": results[nid][1]} for nid in node_ids}
+            else:
+                values = {nid: results[nid][0] for nid in node_ids}
             return Response(values, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def put(self, request):
+    async def put(self, request, session_id):
         """Write value(s) to OPC UA node(s)"""
         data = request.data
         if not data:
@@ -126,37 +299,70 @@ class OPCUADataView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         node_id = data.get('node_id')
         value = data.get('value')
-        print(node_id)
-        print(value)
         if not node_id or value is None:
             return Response({
                 "message": "node_id and value are required"
             }, status=status.HTTP_400_BAD_REQUEST)
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
         try:
-            client.write_value(node_id, value)
+            await await_client(client.resolve_paths, node_id)
+            if data.get('wait', True) is False:
+                # Answer now; the caller fetches the statuses from the writes endpoint
+                ticket = client.writes.track(await await_client(client.queue_write, node_id, value))
+                return Response({
+                    "message": "Value(s) queued",
+                    "data": data,
+                    "write_id": ticket.id
+                }, status=status.HTTP_202_ACCEPTED)
+            # The caller is waiting, so the batch goes out without waiting for other writers
+            statuses = await await_client(client.write_queued, node_id, value, True)
+            failed = [nid for nid, name in statuses.items() if not name.startswith("Good")]
+            if failed:
+                # The other nodes were written; report per node instead of failing the whole request
+                return Response({
+                    "message": f"{len(failed)} of {len(statuses)} value(s) were not written",
+                    "data": data,
+                    "status": statuses
+                }, status=status.HTTP_207_MULTI_STATUS)
             return Response({
                 "message": "Value(s) written successfully",
-                "data": data
+                "data": data,
+                "status": statuses
             }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class OPCUARegisterView(APIView):
-    def get(self, request):
-        """Get all active subscriptions"""
-        global client
+
+class OPCUAWriteStatusView(ServerAPIView):
+    def get(self, request, session_id, write_id):
+        """Statuses of a write queued with "wait": false"""
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
+        ticket = client.writes.ticket(write_id)
+        if ticket is None:
+            return Response({
+                "message": f"Write {write_id} not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+        if not ticket.done():
+            return Response({
+                "message": "Write still queued",
+                "write_id": write_id
+            }, status=status.HTTP_202_ACCEPTED)
+        return Response(write_status(session_id, ticket), status=status.HTTP_200_OK)
+
+
+class OPCUARegisterView(ServerAPIView):
+    def get(self, request, session_id):
+        """Get all registered nodes"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
         try:
-            # Get active subscriptions directly from client
             serialized_nodes = {
                 node_id: {
                     "node": str(reg_node.nodeid),  # Convert NodeId to string representation
@@ -170,13 +376,12 @@ class OPCUARegisterView(APIView):
             return Response({
                 "message": str(e)}
             , status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-    def post(self, request):
+
+    async def post(self, request, session_id):
         """Register nodes with OPC UA server"""
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
         data = request.data
         if not data or 'node_ids' not in data:
             return Response({
@@ -186,7 +391,8 @@ class OPCUARegisterView(APIView):
         if not isinstance(node_ids, list):
             node_ids = [node_ids]
         try:
-            registered_nodes = client.register_nodes(node_ids)
+            await await_client(client.resolve_paths, node_ids)
+            registered_nodes = await await_client(client.register_nodes, node_ids)
             return Response({
                 "message": "Nodes registered successfully",
                 "registered_nodes": registered_nodes
@@ -196,12 +402,11 @@ class OPCUARegisterView(APIView):
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def delete(self, request):
+    async def delete(self, request, session_id):
         """Unregister nodes from OPC UA server"""
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
         data = request.data
         if not data or 'node_ids' not in data:
             return Response({
@@ -211,7 +416,7 @@ class OPCUARegisterView(APIView):
         if not isinstance(node_ids, list):
             node_ids = [node_ids]
         try:
-            client.unregister_nodes(node_ids)
+            await await_client(client.unregister_nodes, node_ids)
             return Response({
                 "message": "Nodes unregistered successfully"
             }, status=status.HTTP_200_OK)
@@ -220,25 +425,18 @@ class OPCUARegisterView(APIView):
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class OPCUASubscribeView(APIView):
-    def get(self, request):
+
+class OPCUASubscribeView(ServerAPIView):
+    def get(self, request, session_id):
         """Get all active subscriptions"""
-        global client
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
         try:
-            # Get active subscriptions directly from client
-            print("Deneme")
-            print(client.subscriptions)
-            print("Deneme2")
             active_subs = {}
-            for sub_id, sub_data in client.subscriptions.items():
-                print("sun_id", sub_id)
-                print("sub_data", sub_data['subscription'])
+            for sub_id, sub_data in list(client.subscriptions.items()):
                 active_subs[sub_id] = {
-                    'node': sub_data['node'],
+                    'nodes': list(sub_data['handles']),
                     'interval': sub_data['interval']
                 }
 
@@ -250,25 +448,27 @@ class OPCUASubscribeView(APIView):
                 "message": str(e)}
             , status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def post(self, request):
+    async def post(self, request, session_id):
         """Subscribe to nodes"""
+        client = pool.get(session_id)
         if not client:
-            return Response({
-                "message": "Not connected to OPC UA server. Please connect first."
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return session_not_found(session_id)
         data = request.data
-        if not data or 'node_id' not in data:
+        node_ids = data.get('node_ids', data.get('node_id')) if data else None
+        if not node_ids:
             return Response({
-                "message": "node_id is required in request body"
+                "message": "node_ids is required in request body"
             }, status=status.HTTP_400_BAD_REQUEST)
-        node_id = data['node_id']
+        if not isinstance(node_ids, list):
+            node_ids = [node_ids]
         interval = int(data.get('interval', 500))  # Default 500ms
         try:
-            subscription_id = client.subscribe(node_id, interval)
+            await await_client(client.resolve_paths, node_ids)
+            subscription_id = await await_client(client.subscribe, node_ids, interval)
             return Response({
                 "message": "Subscription created successfully",
                 "subscription_id": subscription_id,
-                "node": node_id,
+                "nodes": node_ids,
                 "interval": interval
             }, status=status.HTTP_200_OK)
         except Exception as e:
@@ -276,28 +476,313 @@ class OPCUASubscribeView(APIView):
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def delete(self, request):
-        """Unsubscribe from nodes"""
+    async def delete(self, request, session_id):
+        """Remove monitored nodes, or a whole subscription"""
         try:
+            client = pool.get(session_id)
             if not client:
-                return Response({
-                    "message": "Not connected to OPC UA server. Please connect first."
-                }, status=status.HTTP_400_BAD_REQUEST)
+                return session_not_found(session_id)
 
             data = request.data
-            if not data or 'subscription_id' not in data:
+            if not data or ('node_ids' not in data and 'subscription_id' not in data):
                 return Response({
-                    "message": "subscription_id is required in request body"
+                    "message": "node_ids or subscription_id is required in request body"
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            subscription_id = data['subscription_id']
-            client.unsubscribe(subscription_id)
-            
+            subscription_id = data.get('subscription_id')
+            node_ids = data.get('node_ids')
+            if node_ids is not None and not isinstance(node_ids, list):
+                node_ids = [node_ids]
+            await await_client(client.unsubscribe, subscription_id, node_ids)
+
             return Response({
                 "message": "Unsubscribed successfully",
+                "subscription_id": subscription_id,
+                "nodes": node_ids
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OPCUAEventsView(ServerAPIView):
+    def get(self, request, session_id):
+        """Get event subscriptions and the alarms they retain"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        event_subs = {}
+        for sub_id, sub_data in list(client.event_subscriptions.items()):
+            event_subs[sub_id] = {
+                **sub_data['dispatcher'].spec.as_dict(),
+                'interval': sub_data['interval'],
+            }
+        return Response({
+            "event_subscriptions": event_subs,
+            "alarms": snapshot_alarms([(session_id, client)]),
+        }, status=status.HTTP_200_OK)
+
+    async def post(self, request, session_id):
+        """Subscribe to events with a server-side select and where clause"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        data = request.data or {}
+        source = data.get('source', 'i=2253')
+        select = data.get('select')
+        where = data.get('where')
+        interval = int(data.get('interval', 500))
+        if select is not None and not isinstance(select, list):
+            return Response({
+                "message": "select must be a list of event fields"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if where is not None and not isinstance(where, dict):
+            return Response({
+                "message": "where must be an object"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            spec = EventFilterSpec(source, select, where)
+        except ValueError as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            await await_client(client.resolve_paths, source)
+            subscription_id = await await_client(client.subscribe_events, source, select, where, interval)
+            return Response({
+                "message": "Event subscription created successfully",
+                "subscription_id": subscription_id,
+                **spec.as_dict(),
+                "interval": interval
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def delete(self, request, session_id):
+        """Delete one event subscription, or all of them"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        subscription_id = (request.data or {}).get('subscription_id')
+        try:
+            await await_client(client.unsubscribe_events, subscription_id)
+            return Response({
+                "message": "Unsubscribed from events successfully",
                 "subscription_id": subscription_id
             }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
                 "message": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OPCUAConditionRefreshView(ServerAPIView):
+    async def post(self, request, session_id):
+        """Have the server resend retained conditions; they reach WebSockets as alarms frames"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        subscription_id = (request.data or {}).get('subscription_id')
+        try:
+            results = await await_client(client.condition_refresh, subscription_id)
+            return Response({
+                "message": "Condition refresh requested",
+                "results": results
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OPCUAPollView(ServerAPIView):
+    def get(self, request, session_id):
+        """Get all polled tags"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        return Response({
+            "polled_tags": client.poller.tags()
+        }, status=status.HTTP_200_OK)
+
+    async def post(self, request, session_id):
+        """Poll nodes on the server side and push changes to the WebSocket group"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        data = request.data
+        if not data or 'node_ids' not in data:
+            return Response({
+                "message": "node_ids is required in request body"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        node_ids = data['node_ids']
+        if not isinstance(node_ids, list):
+            node_ids = [node_ids]
+        eu_range = data.get('range')
+        if eu_range is not None and (not isinstance(eu_range, list) or len(eu_range) != 2):
+            return Response({
+                "message": "range must be a [low, high] list"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            await await_client(client.resolve_paths, node_ids)
+            period = client.poller.add(
+                node_ids,
+                int(data.get('period', 1000)),
+                deadband_abs=float(data.get('deadband_abs', 0)),
+                deadband_pct=float(data.get('deadband_pct', 0)),
+                eu_range=eu_range,
+            )
+            return Response({
+                "message": "Polling started",
+                "nodes": node_ids,
+                "period": period
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def delete(self, request, session_id):
+        """Stop polling nodes, or all nodes when node_ids is omitted"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        node_ids = request.data.get('node_ids') if request.data else None
+        if node_ids is not None and not isinstance(node_ids, list):
+            node_ids = [node_ids]
+        client.poller.remove(node_ids)
+        return Response({
+            "message": "Polling stopped",
+            "nodes": node_ids
+        }, status=status.HTTP_200_OK)
+
+
+class OPCUAHistoryView(ServerAPIView):
+    async def post(self, request, session_id):
+        """Stream raw or processed history of nodes over a time range as NDJSON"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        data = request.data
+        node_ids = data.get('node_ids')
+        if not node_ids or not data.get('start'):
+            return Response({
+                "message": "node_ids and start are required"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(node_ids, list):
+            node_ids = [node_ids]
+        try:
+            start = to_datetime(data['start'])
+            end = to_datetime(data['end']) if data.get('end') else None
+            await await_client(client.resolve_paths, node_ids)
+            pages = client.history_read(
+                node_ids,
+                start,
+                end,
+                page_size=int(data.get('page_size', 1000)),
+                aggregate=data.get('aggregate'),
+                interval_ms=data.get('interval'),
+            )
+            first = await first_page(pages)
+        except ValueError as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        timeout = getattr(settings, 'OPCUA_REQUEST_TIMEOUT_MS', 10000) / 1000
+        return StreamingHttpResponse(
+            ndjson_stream(first, pages, executor_for(client.url), timeout), content_type="application/x-ndjson"
+        )
+
+
+class OPCUARecorderView(ServerAPIView):
+    def post(self, request, session_id):
+        """Read recorded samples of nodes over a time range, optionally downsampled per bucket"""
+        if not recorder.enabled:
+            return Response({
+                "message": "The recorder is disabled. Set OPCUA_RECORDER_DIR to enable it."
+            }, status=status.HTTP_400_BAD_REQUEST)
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        data = request.data
+        node_ids = data.get('node_ids')
+        if not node_ids or not data.get('start'):
+            return Response({
+                "message": "node_ids and start are required"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(node_ids, list):
+            node_ids = [node_ids]
+        bucket = data.get('bucket')
+        if bucket is not None:
+            if isinstance(bucket, bool) or not str(bucket).isdigit() or int(bucket) <= 0:
+                return Response({
+                    "message": "bucket must be a positive whole number of milliseconds"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            bucket = int(bucket) / 1000
+        try:
+            start = to_datetime(data['start']).timestamp()
+            end = to_datetime(data['end']).timestamp() if data.get('end') else datetime.now(timezone.utc).timestamp()
+        except (TypeError, ValueError) as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            nid: recorder.query(client.url, nid, start, end, bucket)
+            for nid in node_ids
+        }, status=status.HTTP_200_OK)
+
+
+class OPCUABrowseView(ServerAPIView):
+    async def get(self, request, session_id):
+        """Return the children of one or more nodes, the Objects folder by default"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        node_ids = request.query_params.getlist('node_id') or ['i=85']
+        try:
+            await await_client(client.resolve_paths, node_ids)
+            children = await await_client(client.browse, node_ids)
+            return Response(children, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OPCUATranslateView(ServerAPIView):
+    async def post(self, request, session_id):
+        """Translate browse paths such as Objects/PLC1/Motor/Speed to node ids"""
+        client = pool.get(session_id)
+        if not client:
+            return session_not_found(session_id)
+        paths = request.data.get('paths')
+        if not paths:
+            return Response({
+                "message": "paths is required"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(paths, list):
+            paths = [paths]
+        try:
+            node_ids = await await_client(client.translate_paths, paths, request.data.get('namespace'))
+            return Response(node_ids, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                "message": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OPCUASocketView(ServerAPIView):
+    def get(self, request):
+        """Flow control state of the WebSockets served by this process"""
+        return Response([socket.stats() for socket in list(sockets)], status=status.HTTP_200_OK)
+
+
+class OPCUAMetricsView(ServerAPIView):
+    def get(self, request):
+        """Counters and histograms of this process in the Prometheus text format"""
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
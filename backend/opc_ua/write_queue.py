@@ -0,0 +1,277 @@
+import asyncio
+import collections
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+
+from .metrics import write_superseded
+
+logger = logging.getLogger(__name__)
+
+# Status of a queued value that a later write of the same node replaced before it went out
+SUPERSEDED = "Superseded"
+
+
+class WriteBatch:
+    """Values of one session waiting to go out in a single Write."""
+    def __init__(self):
+        self.values = {}  # node id -> DataValue, insertion ordered
+        self.owners = {}  # node id -> id of the ticket whose value is written
+        self.statuses = None
+        self.error = None
+        self.done = threading.Event()
+        self.full = None  # set when the batch reaches OPCUA_WRITE_BATCH_SIZE nodes
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_done_callback(self, callback):
+        """Call callback() once the batch is written, right away if it already is"""
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def finish(self, statuses=None, error=None):
+        self.statuses = statuses
+        self.error = error
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("⚠️ Write status callback failed: %s", e)
+
+
+class WriteTicket:
+    """
+    One caller's share of a batch; result() and wait() return {node_id: status name}.
+
+    rejected holds the status of nodes that were never queued, such as unknown nodes.
+    """
+    def __init__(self, batch, node_ids, rejected=None):
+        self.id = uuid.uuid4().hex
+        self.batch = batch
+        self.node_ids = list(node_ids)
+        self.rejected = dict(rejected or {})
+
+    def done(self):
+        return self.batch.done.is_set()
+
+    def add_done_callback(self, callback):
+        """Call callback(ticket) once the write is done, from the thread or loop that wrote it"""
+        self.batch.add_done_callback(lambda: callback(self))
+
+    def result(self, timeout=None):
+        if not self.batch.done.wait(timeout):
+            raise TimeoutError("Write still queued")
+        if self.batch.error is not None:
+            raise self.batch.error
+        statuses = {
+            nid: self.batch.statuses[nid] if self.batch.owners.get(nid) == self.id else SUPERSEDED
+            for nid in self.node_ids
+        }
+        statuses.update(self.rejected)
+        return statuses
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def wake():
+            if not done.done():
+                done.set_result(None)
+
+        self.batch.add_done_callback(lambda: loop.call_soon_threadsafe(wake))
+        await done
+        return self.result(0)
+
+
+def write_status(session_id, ticket, write_id=None):
+    """Channel layer message reporting a finished ticket to WebSocket clients"""
+    message = {"type": "write_status", "write_id": write_id or ticket.id, "session_id": session_id}
+    try:
+        message["status"] = ticket.result(0)
+    except Exception as e:
+        message["message"] = f"Write: {str(e)}"
+    return message
+
+
+class WriteQueue:
+    """
+    Merges the writes of one session into batched Writes.
+
+    A write waits up to OPCUA_WRITE_COALESCE_MS for others, or until
+    OPCUA_WRITE_BATCH_SIZE nodes are pending; then all of them go out in one
+    Write, split by the server's OperationLimits as usual. A node written
+    again before that only keeps its latest value, and the replaced write
+    reports SUPERSEDED for it. Closed batches line up in a FIFO drained by a
+    single flusher, so an older value never overtakes a newer one. Values
+    are converted to the nodes' data types before they are queued, so a bad
+    value fails its own caller and not the batch.
+    """
+    def __init__(self, write, window_ms=None, max_nodes=None, max_tickets=1000):
+        self.write = write  # write(node_ids, data_values) -> {node_id: status name}
+        self.window_ms = window_ms
+        self.max_nodes = max_nodes
+        self.max_tickets = max_tickets
+        self._lock = threading.Lock()
+        self._collecting = None
+        self._closed = collections.deque()  # batches waiting for the flusher, oldest first
+        self._flushing = False
+        self._tickets = collections.OrderedDict()  # write id -> WriteTicket callers look up later
+        self.requests = 0
+        self.writes = 0
+        self.superseded = 0
+
+    @property
+    def window(self):
+        window_ms = self.window_ms if self.window_ms is not None else getattr(settings, 'OPCUA_WRITE_COALESCE_MS', 20)
+        return window_ms / 1000
+
+    @property
+    def batch_size(self):
+        return self.max_nodes or getattr(settings, 'OPCUA_WRITE_BATCH_SIZE', 1000)
+
+    def _line_up(self, batch):
+        """Queue a closed batch for writing; True when a flusher must be started. Call with self._lock held"""
+        self._closed.append(batch)
+        self.writes += 1
+        if self._flushing:
+            return False
+        self._flushing = True
+        return True
+
+    def _add(self, node_ids, data_values, rejected, flush, new_batch):
+        """Return (ticket, batch, created, start_flusher) for values added to the collecting batch"""
+        if not node_ids:
+            # Nothing to write, e.g. every node was rejected
+            batch = WriteBatch()
+            batch.finish({})
+            return WriteTicket(batch, node_ids, rejected), batch, False, False
+        with self._lock:
+            self.requests += 1
+            batch = self._collecting
+            created = batch is None
+            if created:
+                batch = self._collecting = new_batch()
+            ticket = WriteTicket(batch, node_ids, rejected)
+            for nid, data_value in zip(node_ids, data_values):
+                if nid in batch.values:
+                    self.superseded += 1
+                    write_superseded.inc()
+                    # Move it to the end, so the batch writes nodes in the order of their last change
+                    del batch.values[nid]
+                batch.values[nid] = data_value
+                batch.owners[nid] = ticket.id
+            start_flusher = False
+            if flush or len(batch.values) >= self.batch_size:
+                self._collecting = None
+                start_flusher = self._line_up(batch)
+                batch.full.set()
+            return ticket, batch, created, start_flusher
+
+    def _close(self, batch):
+        """Close a batch whose window ran out; True when a flusher must be started"""
+        with self._lock:
+            if self._collecting is not batch:
+                return False  # closed early because it filled up or a caller flushed it
+            self._collecting = None
+            return self._line_up(batch)
+
+    def _next(self):
+        """Oldest closed batch, or None after marking the flusher stopped"""
+        with self._lock:
+            if self._closed:
+                return self._closed.popleft()
+            self._flushing = False
+            return None
+
+    def submit(self, node_ids, data_values, rejected=None, flush=False):
+        """
+        Queue DataValues for node_ids and return a WriteTicket; rejected is {node_id: status name}.
+        flush closes the batch at once instead of waiting out the window.
+        """
+        def new_batch():
+            batch = WriteBatch()
+            batch.full = threading.Event()
+            return batch
+
+        ticket, batch, created, start_flusher = self._add(node_ids, data_values, rejected, flush, new_batch)
+        if created and not flush:
+            threading.Thread(target=self._run, args=(batch,), name="opcua-writes", daemon=True).start()
+        if start_flusher:
+            threading.Thread(target=self._flush, name="opcua-writes", daemon=True).start()
+        return ticket
+
+    def _run(self, batch):
+        batch.full.wait(self.window)
+        if self._close(batch):
+            self._flush()
+
+    def _flush(self):
+        batch = self._next()
+        while batch is not None:
+            try:
+                batch.finish(self.write(list(batch.values), list(batch.values.values())))
+            except Exception as e:
+                batch.finish(error=e)
+            batch = self._next()
+
+    async def submit_async(self, node_ids, data_values, rejected=None, flush=False):
+        """submit() for asyncio sessions; write is a coroutine function"""
+        def new_batch():
+            batch = WriteBatch()
+            batch.full = asyncio.Event()
+            return batch
+
+        ticket, batch, created, start_flusher = self._add(node_ids, data_values, rejected, flush, new_batch)
+        if created and not flush:
+            asyncio.ensure_future(self._run_async(batch))
+        if start_flusher:
+            asyncio.ensure_future(self._flush_async())
+        return ticket
+
+    async def _run_async(self, batch):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        if self._close(batch):
+            await self._flush_async()
+
+    async def _flush_async(self):
+        batch = self._next()
+        while batch is not None:
+            try:
+                batch.finish(await self.write(list(batch.values), list(batch.values.values())))
+            except Exception as e:
+                batch.finish(error=e)
+            batch = self._next()
+
+    def track(self, ticket):
+        """Keep ticket for ticket(write_id), forgetting the oldest beyond max_tickets"""
+        with self._lock:
+            self._tickets[ticket.id] = ticket
+            while len(self._tickets) > self.max_tickets:
+                self._tickets.popitem(last=False)
+        return ticket
+
+    def ticket(self, write_id):
+        """A tracked WriteTicket or None"""
+        with self._lock:
+            return self._tickets.get(write_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "writes": self.writes,
+                "superseded": self.superseded,
+                "pending": len(self._collecting.values) if self._collecting else 0,
+                "queued": len(self._closed),
+            }